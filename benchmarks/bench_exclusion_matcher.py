@@ -0,0 +1,80 @@
+"""
+Microbenchmark: per-path exclusion checks on a synthetic 200k-file tree.
+
+Compares the original should_exclude_file (a loop over every excluded
+extension plus a walk over every parent directory per call) with the
+compiled, .gitignore-aware ExclusionMatcher. Paths are generated in memory
+under a temporary workspace that only holds the .gitignore files, since
+neither implementation needs the files themselves.
+
+Usage: python benchmarks/bench_exclusion_matcher.py
+"""
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from puding_agent.config import EXCLUDED_FILES, EXCLUDED_EXTENSIONS
+from puding_agent.ignore import ExclusionMatcher
+
+FILES = 200_000
+NAMES = ["index", "util", "model", "view", "test_api", "app", "config", "bundle"]
+EXTENSIONS = [".py", ".js", ".ts", ".css", ".min.js", ".png", ".md", ".json", ".log", ".map"]
+DIRS = ["src", "lib", "tests", "docs", "node_modules", "dist", "pkg", "core", "api", "generated"]
+
+
+def legacy_should_exclude_file(file_path: Path) -> bool:
+    """should_exclude_file as it was before the compiled matcher."""
+    if file_path.name in EXCLUDED_FILES:
+        return True
+    if file_path.suffix.lower() in EXCLUDED_EXTENSIONS:
+        return True
+    filename_lower = file_path.name.lower()
+    for ext in EXCLUDED_EXTENSIONS:
+        if filename_lower.endswith(ext):
+            return True
+    if file_path.name.startswith('.'):
+        return True
+    for parent in file_path.parents:
+        if parent.name in EXCLUDED_FILES:
+            return True
+    return False
+
+
+def synthetic_paths(root: Path):
+    rng = random.Random(42)
+    dirs = [root]
+    for _ in range(4000):
+        parent = rng.choice(dirs)
+        if len(parent.parts) - len(root.parts) < 6:
+            dirs.append(parent / f"{rng.choice(DIRS)}{rng.randint(0, 9)}")
+    return [rng.choice(dirs) / f"{rng.choice(NAMES)}{i}{rng.choice(EXTENSIONS)}" for i in range(FILES)]
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp).resolve()
+        (root / ".gitignore").write_text("generated*/\n*.snap\n/docs*/*.md\n!keep.md\n", encoding="utf-8")
+        paths = synthetic_paths(root)
+
+        start = time.perf_counter()
+        legacy = sum(legacy_should_exclude_file(p) for p in paths)
+        legacy_time = time.perf_counter() - start
+
+        matcher = ExclusionMatcher(root)
+        start = time.perf_counter()
+        compiled = sum(matcher.excluded(p, is_dir=False) for p in paths)
+        compiled_time = time.perf_counter() - start
+
+        # The matcher also applies .gitignore rules, so it may exclude more paths
+        print(f"{len(paths):,} paths")
+        print(f"legacy should_exclude_file : {legacy_time:6.2f}s  ({legacy_time / len(paths) * 1e6:5.2f} us/path, {legacy:,} excluded)")
+        print(f"compiled ExclusionMatcher  : {compiled_time:6.2f}s  ({compiled_time / len(paths) * 1e6:5.2f} us/path, {compiled:,} excluded)")
+        print(f"speedup                    : {legacy_time / compiled_time:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Benchmark: per-iteration cost of building provider messages as history grows.
+
+Compares a full rebuild of the provider message list (the old behaviour of
+respond_once) with the incremental ProviderMessageStore.
+
+Usage: python benchmarks/bench_message_cache.py
+"""
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from puding_agent.agent import to_openai_message, to_gemini_message
+from puding_agent.utils import ConversationMessage, ProviderMessageStore
+
+HISTORY_SIZES = [100, 400, 1600, 6400]
+ITERATIONS = 50
+TOOL_RESULT = "x" * 20_000  # a tool result holding a whole file
+
+
+def make_history(size):
+    history = [ConversationMessage("system", "system prompt")]
+    for i in range(size):
+        if i % 2:
+            history.append(ConversationMessage("tool", TOOL_RESULT, tool_call_id=f"call_{i}", name="read_file"))
+        else:
+            history.append(ConversationMessage("assistant", "reading", tool_calls=[{"id": f"call_{i + 1}"}]))
+    return history
+
+
+def bench(convert, size, incremental):
+    history = make_history(size)
+    store = ProviderMessageStore(convert)
+    store.sync(history)
+    start = time.perf_counter()
+    for i in range(ITERATIONS):
+        history.append(ConversationMessage("tool", TOOL_RESULT, tool_call_id=f"extra_{i}", name="read_file"))
+        if not incremental:
+            store.reset()
+        store.sync(history)
+    return (time.perf_counter() - start) / ITERATIONS * 1e6
+
+
+def main():
+    for label, convert in (("openai", to_openai_message), ("gemini", to_gemini_message)):
+        print(f"\n[{label}] microseconds per loop iteration")
+        print(f"{'history':>10} {'rebuild':>12} {'incremental':>12}")
+        for size in HISTORY_SIZES:
+            full = bench(convert, size, incremental=False)
+            inc = bench(convert, size, incremental=True)
+            print(f"{size:>10} {full:>12.1f} {inc:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark: search_code's trigram index on a synthetic workspace.
+
+Writes FILES small Python modules to a temporary workspace, then times the
+initial index build, loading the saved index in a fresh TrigramIndex, and
+literal / regex queries against a brute-force scan of every file. Queries
+are timed after the index is current, as they are between refreshes.
+
+Usage: python benchmarks/bench_search_index.py [FILES]
+"""
+import random
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from puding_agent.search import TrigramIndex
+
+FILES = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+WORDS = ["load", "save", "parse", "render", "client", "config", "token", "buffer", "index", "cache"]
+QUERIES = [
+    ("literal, rare", "def parse_token_17(", False),
+    ("literal, common", "return value", False),
+    ("regex with literal", r"class \w+Cache\d+:", True),
+    ("no match", "parse_render_cache", False),
+]
+
+
+def write_workspace(root: Path):
+    rng = random.Random(7)
+    for i in range(FILES):
+        pkg = root / f"pkg{i % 100}"
+        pkg.mkdir(exist_ok=True)
+        a, b = rng.choice(WORDS), rng.choice(WORDS)
+        body = [f"class {a.title()}{b.title()}{i}:"]
+        for j in range(10):
+            body.append(f"    def {rng.choice(WORDS)}_{rng.choice(WORDS)}_{rng.randint(0, 99)}(self, value):")
+            body.append(f"        return value + {j}")
+        (pkg / f"mod{i}.py").write_text("\n".join(body) + "\n", encoding="utf-8")
+
+
+def brute_force(root: Path, pattern):
+    hits = 0
+    for path in root.rglob("*.py"):
+        for line in path.read_text(encoding="utf-8").splitlines():
+            if pattern.search(line):
+                hits += 1
+    return hits
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp).resolve()
+        write_workspace(root)
+
+        start = time.perf_counter()
+        index = TrigramIndex(root)
+        index.refresh(force=True)
+        print(f"build:  {FILES} files in {time.perf_counter() - start:.2f}s, {len(index.postings)} trigrams")
+
+        start = time.perf_counter()
+        index = TrigramIndex(root)
+        print(f"load:   {time.perf_counter() - start:.3f}s")
+        index.refresh(force=True)
+
+        for label, query, regex in QUERIES:
+            pattern = re.compile(query if regex else re.escape(query), re.IGNORECASE)
+            start = time.perf_counter()
+            result = index.search(query, regex=regex)
+            indexed = time.perf_counter() - start
+            start = time.perf_counter()
+            brute_force(root, pattern)
+            scanned = time.perf_counter() - start
+            print(f"{label:20} index {indexed * 1000:7.1f} ms ({result['files_searched']} candidates)"
+                  f"   scan {scanned * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
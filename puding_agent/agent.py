@@ -1,12 +1,19 @@
-
 """
 Main agent logic for PUding Agent.
 """
 import os
 import sys
 import json
+import hashlib
 import re
-from typing import List, Dict, Any, Optional
+import time
+import asyncio
+import threading
+from collections import deque
+from collections.abc import Mapping, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Set
 from rich.console import Console
 from rich.panel import Panel
 from rich.table import Table
@@ -15,33 +22,185 @@ import openai
 import google.generativeai as genai
 from dotenv import load_dotenv
 
-from .utils import ConversationMessage, normalize_path, should_exclude_file, is_text_file, clean_json_string
-from .config import SYSTEM_PROMPT
+from .utils import ConversationMessage, ProviderMessageStore, normalize_path, walk_files, clean_json_string
+from .config import SYSTEM_PROMPT, CONTEXT_MAX_FILES, CONTEXT_MAX_CHARS, CONTEXT_READ_WORKERS, REPO_MAP_TOKENS
 from .tools import TOOLS, TOOL_FUNCTIONS, read_local_file
+from .dispatch import ToolDispatcher, WRITE_TOOLS
+from .blobs import compact_tool_result
+from .digest import compact_command_result
+from .cache import file_cache
+from .repomap import repo_map
+from .shell import PersistentShell
+from .usage import UsageLedger, TurnUsage, openai_usage, gemini_usage
 
 # Load environment variables
 load_dotenv()
 
+OPENAI_PROVIDERS = ['openai', 'deepseek', 'qwen']
+
+# OpenAI wraps each Gemini-style function declaration in a "function" tool
+OPENAI_TOOLS = [{"type": "function", "function": tool} for tool in TOOLS]
+
+def to_openai_message(msg: ConversationMessage) -> Dict[str, Any]:
+    """Convert a history message to an OpenAI chat message."""
+    if msg.role == "assistant":
+        m = {"role": "assistant", "content": msg.content}
+        if msg.tool_calls:
+            m["tool_calls"] = msg.tool_calls
+        return m
+    if msg.role == "tool":
+        return {
+            "role": "tool", 
+            "content": msg.content,
+            "tool_call_id": msg.tool_call_id,
+            "name": msg.name
+        }
+    return {"role": msg.role, "content": msg.content}
+
+def to_gemini_message(msg: ConversationMessage) -> Dict[str, Any]:
+    """Convert a history message to a Gemini content dict."""
+    if msg.role == "assistant":
+        parts = []
+        if msg.content:
+            parts.append({"text": msg.content})
+        if msg.tool_calls:
+            # Reconstruct function calls for Gemini history
+            for tc in msg.tool_calls:
+                parts.append({"function_call": tc})
+        return {"role": "model", "parts": parts}
+    if msg.role == "tool":
+        # Gemini expects function_response
+        return {
+            "role": "function",
+            "parts": [{
+                "function_response": {
+                    "name": msg.name,
+                    "response": {"result": msg.content}
+                }
+            }]
+        }
+    # Gemini has no system role; the system prompt is sent as a user turn
+    return {"role": "user", "parts": [msg.content]}
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """Return the shared event loop that drives all engines, starting it on first use.
+
+    Every engine runs its coroutines on this one loop, so async LLM clients
+    and their connection pools can be shared between sessions.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="puding-event-loop", daemon=True).start()
+    return _loop
+
+def run_sync(coro):
+    """Run a coroutine on the background loop and block until it finishes."""
+    future = asyncio.run_coroutine_threadsafe(coro, get_background_loop())
+    try:
+        return future.result()
+    except BaseException:
+        # e.g. Ctrl+C in the CLI: stop the coroutine instead of leaving it running
+        future.cancel()
+        raise
+
+async def _aiter_chunks(resp, stream: bool):
+    """Iterate a Gemini async response chunk by chunk, or as one chunk if not streamed."""
+    if not stream:
+        yield resp
+        return
+    async for chunk in resp:
+        yield chunk
+
+def plain_args(value: Any) -> Any:
+    """Convert Gemini function-call args (proto MapComposite / RepeatedComposite) to plain dicts and lists.
+
+    Tools and the dispatcher check for dict and list, which the proto
+    containers are not; nested values (e.g. the entries of edit_files) are
+    converted too.
+    """
+    if isinstance(value, Mapping):
+        return {key: plain_args(item) for key, item in value.items()}
+    if isinstance(value, Sequence) and not isinstance(value, (str, bytes)):
+        return [plain_args(item) for item in value]
+    return value
+
+def content_digest(text: str) -> str:
+    """Hash identifying a context message's content."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class ResponseBlocked(Exception):
+    """Raised when the provider refuses to answer a prompt."""
+
 class GeminiEngineer:
     """Main application class for PUding Agent."""
     
-    def __init__(self):
+    def __init__(self, shared: Optional["GeminiEngineer"] = None):
+        """
+        Args:
+            shared: Optional engine whose LLM clients are reused instead of creating
+                new ones. The new engine still gets its own conversation state.
+        """
         self.console = Console()
-        self.conversation_history: List[ConversationMessage] = []
         self.model = None
         self.client = None
+        self.async_client = None
         self.provider = "gemini"
         self.history = InMemoryHistory()
-        self.setup_llm_client()
+        if shared is not None:
+            self.provider = shared.provider
+            self.model_name = shared.model_name
+            self.model = shared.model
+            self.client = shared.client
+            self.async_client = shared.async_client
+        else:
+            self.setup_llm_client()
+        
+        # Provider-format view of conversation_history, converted incrementally
+        converter = to_openai_message if self.provider in OPENAI_PROVIDERS else to_gemini_message
+        self.provider_messages = ProviderMessageStore(converter)
+        
+        # Runs the tool calls of one model turn, in parallel where they are independent
+        self.tool_dispatcher = ToolDispatcher(self.execute_tool)
+        
+        # Token and latency accounting for every LLM call and turn
+        self.usage = UsageLedger()
+        
+        # Files written by tools during the current turn, for run_affected_tests
+        self.changed_files: Set[str] = set()
+        
+        # Opt-in long-lived shell for run_command (keeps cd, exports, activated venvs)
+        self.shell: Optional[PersistentShell] = None
+        if os.getenv("PUDING_PERSISTENT_SHELL", "").lower() in ("1", "true", "yes", "on"):
+            self.set_persistent_shell(True)
         
         # Add system prompt as the first message to guide AI behavior
-        self.conversation_history.append(ConversationMessage("system", SYSTEM_PROMPT))
+        self.conversation_history = [ConversationMessage("system", SYSTEM_PROMPT)]
+    
+    @property
+    def conversation_history(self) -> List[ConversationMessage]:
+        return self._conversation_history
+    
+    @conversation_history.setter
+    def conversation_history(self, messages: List[ConversationMessage]):
+        # Replacing the history (clear, session switch) invalidates the provider cache
+        self._conversation_history = messages
+        self.provider_messages.reset()
+        # Rebuild the index of files in context: path -> (content hash, message)
+        self.context_files: Dict[str, Any] = {}
+        for msg in messages:
+            if msg.context_path:
+                self.context_files[msg.context_path] = (content_digest(msg.content), msg)
         
     def setup_llm_client(self):
         """Initialize the LLM client (Gemini or OpenAI/DeepSeek)."""
         self.provider = os.getenv('LLM_PROVIDER', 'gemini').lower()
         
-        if self.provider in ['openai', 'deepseek', 'qwen']:
+        if self.provider in OPENAI_PROVIDERS:
             self.setup_openai_client()
         else:
             self.setup_gemini_client()
@@ -65,6 +224,7 @@ class GeminiEngineer:
             
         try:
             self.client = openai.OpenAI(api_key=api_key, base_url=base_url)
+            self.async_client = openai.AsyncOpenAI(api_key=api_key, base_url=base_url)
             self.console.print(f"[green]✅ OpenAI compatible client initialized! (Provider: {self.provider}, Model: {self.model_name})[/green]")
         except Exception as e:
             self.console.print(f"[red]❌ Failed to initialize OpenAI client: {e}[/red]")
@@ -123,9 +283,12 @@ class GeminiEngineer:
 [bold cyan]Available Commands:[/bold cyan]
 • [yellow]/add <file_path>[/yellow] - Add a file to conversation context
 • [yellow]/add <folder_path>[/yellow] - Add all files in a folder to context
+• [yellow]/add --map [--tokens N] <folder_path>[/yellow] - Add a compact map of a folder (tree, sizes, outlines)
 • [yellow]/exit[/yellow] or [yellow]/quit[/yellow] - Exit the application
 • [yellow]/help[/yellow] - Show this help message
 • [yellow]/clear[/yellow] - Clear conversation history
+• [yellow]/stats[/yellow] - Show token usage and latency for this session
+• [yellow]/shell on|off|restart[/yellow] - Run commands in one persistent shell (keeps cd, env, venv)
 
 [bold cyan]Example Requests:[/bold cyan]
 • "Create a Flask API for a task manager with SQLite database"
@@ -144,12 +307,25 @@ class GeminiEngineer:
         if tool_name not in TOOL_FUNCTIONS:
             return {"error": f"Unknown tool: {tool_name}"}
         
+        if tool_name == "run_command" and self.shell is not None:
+            parameters = {**parameters, "shell_session": self.shell}
+        elif tool_name == "run_affected_tests":
+            parameters = {**parameters, "changed_files": sorted(self.changed_files)}
+        
         try:
             func = TOOL_FUNCTIONS[tool_name]
             return func(**parameters)
         except Exception as e:
             return {"error": f"Error executing {tool_name}: {str(e)}"}
 
+    def set_persistent_shell(self, enabled: bool):
+        """Route run_command through one long-lived shell for this engine, or back to one process per command."""
+        if enabled and self.shell is None:
+            self.shell = PersistentShell()
+        elif not enabled and self.shell is not None:
+            self.shell.close()
+            self.shell = None
+
     def display_tool_result(self, tool_name: str, result: Dict[str, Any]):
         """Display the result of a tool execution in a nice format."""
         if tool_name == "run_command":
@@ -163,6 +339,16 @@ class GeminiEngineer:
                 title="Command Execution",
                 border_style="green" if result.get('success') else "red"
             ))
+        elif tool_name in ("run_tests", "run_affected_tests", "run_tests_parallel") and "passed" in result:
+            status = "[green]✅ Passed[/green]" if result.get('success') else f"[red]❌ {result.get('status')}[/red]"
+            failing = "\n".join(f"  {f['nodeid']}" for f in result.get('failures', []) + result.get('collect_errors', []))
+            self.console.print(Panel(
+                f"{status}  {result['passed']} passed, {result['failed']} failed, {result['errors']} errors, "
+                f"{result['skipped']} skipped in {result.get('duration')}s" + (" (warm)" if result.get('warm') else "")
+                + (f"\n{failing}" if failing else ""),
+                title="Tests",
+                border_style="green" if result.get('success') else "red"
+            ))
         elif tool_name == "create_file":
             self.console.print(Panel(
                 f"[green]✅ {result['message']} ({result['size']} characters)[/green]",
@@ -233,7 +419,149 @@ class GeminiEngineer:
                 border_style="green"
             ))
 
-    def respond_once(self, user_input: str, on_loop_start=None) -> Dict[str, Any]:
+    def _emit(self, on_event, event: Dict[str, Any]):
+        """Deliver a streaming event to the caller, ignoring callback failures."""
+        if on_event:
+            try:
+                on_event(event)
+            except Exception:
+                pass
+
+    async def _openai_turn(self, messages, on_event=None, usage=None):
+        """Run one OpenAI chat completion. Returns (content, tool_calls as dicts).
+        
+        Token counts reported by the API are written into the usage dict if given.
+        """
+        usage = {} if usage is None else usage
+        if not on_event:
+            resp = await self.async_client.chat.completions.create(
+                model=self.model_name, 
+                messages=messages, 
+                tools=OPENAI_TOOLS
+            )
+            usage.update(openai_usage(getattr(resp, "usage", None)))
+            assistant_msg = resp.choices[0].message
+            tool_calls = [
+                {"id": tc.id, "type": "function", "function": {"name": tc.function.name, "arguments": tc.function.arguments}}
+                for tc in (getattr(assistant_msg, "tool_calls", None) or [])
+            ]
+            return assistant_msg.content or "", tool_calls
+        
+        stream = await self.async_client.chat.completions.create(
+            model=self.model_name, 
+            messages=messages, 
+            tools=OPENAI_TOOLS,
+            stream=True,
+            # Usage arrives in a final chunk with no choices
+            stream_options={"include_usage": True}
+        )
+        started = time.perf_counter()
+        content_parts = []
+        calls_by_index: Dict[int, Dict[str, Any]] = {}
+        async for chunk in stream:
+            if getattr(chunk, "usage", None):
+                usage.update(openai_usage(chunk.usage))
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                if not content_parts:
+                    usage["first_token_latency"] = round(time.perf_counter() - started, 3)
+                content_parts.append(delta.content)
+                self._emit(on_event, {"type": "text", "delta": delta.content})
+            # Tool calls arrive as fragments keyed by index; arguments are concatenated
+            for fragment in getattr(delta, "tool_calls", None) or []:
+                tc = calls_by_index.setdefault(fragment.index, {"id": None, "type": "function", "function": {"name": "", "arguments": ""}})
+                if fragment.id:
+                    tc["id"] = fragment.id
+                if fragment.function:
+                    if fragment.function.name:
+                        tc["function"]["name"] += fragment.function.name
+                    if fragment.function.arguments:
+                        tc["function"]["arguments"] += fragment.function.arguments
+        return "".join(content_parts), [calls_by_index[i] for i in sorted(calls_by_index)]
+
+    async def _gemini_turn(self, messages, on_event=None, usage=None):
+        """Run one Gemini generation. Returns (text, function calls).
+        
+        Token counts reported by the API are written into the usage dict if given.
+        """
+        usage = {} if usage is None else usage
+        started = time.perf_counter()
+        resp = await self.model.generate_content_async(messages, tools=[{"function_declarations": TOOLS}], stream=bool(on_event))
+        
+        text_parts = []
+        gemini_tool_calls = []
+        async for chunk in _aiter_chunks(resp, stream=bool(on_event)):
+            # Streamed chunks carry cumulative usage; the last one wins
+            if getattr(chunk, "usage_metadata", None):
+                usage.update(gemini_usage(chunk.usage_metadata))
+            if hasattr(chunk, "prompt_feedback") and chunk.prompt_feedback:
+                if chunk.prompt_feedback.block_reason:
+                    raise ResponseBlocked(f"Response blocked: {chunk.prompt_feedback.block_reason}")
+            
+            if hasattr(chunk, "candidates") and chunk.candidates:
+                for candidate in chunk.candidates:
+                    if hasattr(candidate, "content") and candidate.content:
+                        for part in candidate.content.parts:
+                            if hasattr(part, "function_call") and part.function_call:
+                                gemini_tool_calls.append(part.function_call)
+                            elif hasattr(part, "text") and part.text:
+                                if on_event and not text_parts:
+                                    usage["first_token_latency"] = round(time.perf_counter() - started, 3)
+                                text_parts.append(part.text)
+                                self._emit(on_event, {"type": "text", "delta": part.text})
+        return "".join(text_parts), gemini_tool_calls
+
+    def display_usage_stats(self):
+        """Display the token usage ledger for this session."""
+        summary = self.usage.summary()
+        totals = summary["totals"]
+        
+        table = Table(title="📈 Token Usage per Turn")
+        table.add_column("Turn", style="cyan")
+        table.add_column("LLM Calls", style="magenta")
+        table.add_column("Prompt", style="green")
+        table.add_column("Peak Prompt", style="yellow")
+        table.add_column("Cached", style="green")
+        table.add_column("Completion", style="green")
+        table.add_column("Latency (s)", style="blue")
+        for turn in summary["turns"]:
+            table.add_row(
+                str(turn["index"]),
+                str(len(turn["calls"])),
+                f"{turn['prompt_tokens']:,}",
+                f"{turn['peak_prompt_tokens']:,}",
+                f"{turn['cached_tokens']:,}",
+                f"{turn['completion_tokens']:,}",
+                f"{turn['latency']:.2f}"
+            )
+        self.console.print(table)
+        
+        cache = file_cache.stats()
+        by_role = ", ".join(f"{role}: {n:,}" for role, n in sorted(totals["by_role"].items(), key=lambda x: -x[1]))
+        self.console.print(Panel(
+            f"Turns: {totals['turns']}  LLM calls: {totals['calls']}\n"
+            f"Prompt tokens: {totals['prompt_tokens']:,} (cached {totals['cached_tokens']:,})\n"
+            f"Completion tokens: {totals['completion_tokens']:,}\n"
+            f"LLM latency: {totals['latency']:.2f}s\n"
+            f"Prompt tokens by role (estimated): {by_role or '-'}\n"
+            f"File cache: {cache['hits']:,} hits, {cache['misses']:,} misses "
+            f"({cache['hit_rate']:.0%}), {cache['entries']:,} files, {cache['bytes'] / 1024 / 1024:.1f} MB",
+            title="Session Totals",
+            border_style="cyan"
+        ))
+
+    def respond_once(self, user_input: str, on_loop_start=None, on_event=None) -> Dict[str, Any]:
+        """
+        Synchronous wrapper around respond() for the CLI and threaded callers.
+        
+        The coroutine runs on the shared background event loop, so callbacks
+        are invoked from that loop's thread.
+        """
+        return run_sync(self.respond(user_input, on_loop_start=on_loop_start, on_event=on_event))
+
+    async def respond(self, user_input: str, on_loop_start=None, on_event=None) -> Dict[str, Any]:
         """
         Process a message and run the autonomous loop (Reflection & Repair).
         Returns aggregated text and tool executions.
@@ -241,7 +569,21 @@ class GeminiEngineer:
         Args:
             user_input: The user's message
             on_loop_start: Optional callback function(iteration_count) called at start of each loop
+            on_event: Optional callback function(event) enabling streaming mode. Events are dicts
+                with a "type" of "loop", "text" (a "delta" of assistant text), "tool_call"
+                or "tool_result".
         """
+        turn = self.usage.start_turn()
+        self.changed_files = set()
+        try:
+            result = await self._respond(user_input, turn, on_loop_start, on_event)
+        finally:
+            self.usage.end_turn(turn, self.conversation_history)
+        result["usage"] = turn.to_dict()
+        return result
+
+    async def _respond(self, user_input: str, turn: TurnUsage, on_loop_start=None, on_event=None) -> Dict[str, Any]:
+        """Body of respond(); LLM calls are recorded against the given turn."""
         self.conversation_history.append(ConversationMessage("user", user_input))
         
         aggregated_text = []
@@ -256,45 +598,19 @@ class GeminiEngineer:
                     on_loop_start(loop_count)
                 except:
                     pass
+            self._emit(on_event, {"type": "loop", "iteration": loop_count})
             
-            if self.provider in ['openai', 'deepseek', 'qwen']:
+            messages = self.provider_messages.sync(self.conversation_history)
+            
+            if self.provider in OPENAI_PROVIDERS:
                 # OpenAI Logic
-                messages = []
-                for msg in self.conversation_history:
-                    if msg.role == "system":
-                        messages.append({"role": "system", "content": msg.content})
-                    elif msg.role == "assistant":
-                        m = {"role": "assistant", "content": msg.content}
-                        if msg.tool_calls:
-                            m["tool_calls"] = msg.tool_calls
-                        messages.append(m)
-                    elif msg.role == "user":
-                        messages.append({"role": "user", "content": msg.content})
-                    elif msg.role == "tool":
-                        messages.append({
-                            "role": "tool", 
-                            "content": msg.content,
-                            "tool_call_id": msg.tool_call_id,
-                            "name": msg.name
-                        })
-                
-                openai_tools = []
-                for tool in TOOLS:
-                    openai_tools.append({"type": "function", "function": tool})
-                
+                usage = {}
+                started = time.perf_counter()
                 try:
-                    resp = self.client.chat.completions.create(
-                        model=self.model_name, 
-                        messages=messages, 
-                        tools=openai_tools
-                    )
+                    content, tool_calls = await self._openai_turn(messages, on_event, usage)
                 except Exception as e:
                     return {"error": str(e), "assistant_text": "\n".join(aggregated_text)}
-                
-                choice = resp.choices[0]
-                assistant_msg = choice.message
-                content = assistant_msg.content or ""
-                tool_calls = getattr(assistant_msg, "tool_calls", None) or []
+                self.usage.record_call(turn, loop_count, usage, time.perf_counter() - started, self.conversation_history)
                 
                 # Append assistant response to history
                 # We need to store tool_calls in the message for OpenAI context
@@ -311,11 +627,11 @@ class GeminiEngineer:
                     # No tools called, we are done
                     break
                 
-                # Execute tools
+                # Parse all calls first so independent ones can run concurrently
+                calls = []
                 for tc in tool_calls:
-                    name = tc.function.name
-                    args_str = tc.function.arguments or ""
-                    call_id = tc.id
+                    name = tc["function"]["name"]
+                    args_str = tc["function"]["arguments"] or ""
                     
                     params = {}
                     try:
@@ -327,9 +643,13 @@ class GeminiEngineer:
                             params = json.loads(fixed)
                         except:
                             params = {} # Fail gracefully
-                            
-                    result = self.execute_tool(name, params)
-                    
+                    calls.append((name, params))
+                
+                # Tools block on disk and subprocesses, so they run off the event loop
+                results = await asyncio.get_running_loop().run_in_executor(None, self._run_tool_calls, calls, on_event)
+                
+                # Append results in the original call order so tool_call_ids pair up
+                for tc, (name, params), result in zip(tool_calls, calls, results):
                     # Store execution for return
                     all_tool_executions.append({
                         "name": name, 
@@ -340,62 +660,23 @@ class GeminiEngineer:
                     # Append tool result to history
                     self.conversation_history.append(ConversationMessage(
                         role="tool",
-                        content=json.dumps(result, ensure_ascii=False),
-                        tool_call_id=call_id,
+                        content=self._history_content(name, result),
+                        tool_call_id=tc["id"],
                         name=name
                     ))
                     
             else:
                 # Gemini Logic
-                messages = []
-                for msg in self.conversation_history:
-                    if msg.role == "system":
-                        messages.append({"role": "user", "parts": [msg.content]})
-                    elif msg.role == "assistant":
-                        parts = []
-                        if msg.content:
-                            parts.append({"text": msg.content})
-                        if msg.tool_calls:
-                            # Reconstruct function calls for Gemini history
-                            for tc in msg.tool_calls:
-                                parts.append({"function_call": tc})
-                        messages.append({"role": "model", "parts": parts})
-                    elif msg.role == "user":
-                        messages.append({"role": "user", "parts": [msg.content]})
-                    elif msg.role == "tool":
-                        # Gemini expects function_response
-                        messages.append({
-                            "role": "function",
-                            "parts": [{
-                                "function_response": {
-                                    "name": msg.name,
-                                    "response": {"result": msg.content}
-                                }
-                            }]
-                        })
-
+                usage = {}
+                started = time.perf_counter()
                 try:
-                    resp = self.model.generate_content(messages, tools=[{"function_declarations": TOOLS}])
+                    assistant_text, gemini_tool_calls = await self._gemini_turn(messages, on_event, usage)
+                except ResponseBlocked as e:
+                    return {"error": str(e)}
                 except Exception as e:
                     return {"error": str(e), "assistant_text": "\n".join(aggregated_text)}
+                self.usage.record_call(turn, loop_count, usage, time.perf_counter() - started, self.conversation_history)
                 
-                if hasattr(resp, "prompt_feedback") and resp.prompt_feedback:
-                    if resp.prompt_feedback.block_reason:
-                        return {"error": f"Response blocked: {resp.prompt_feedback.block_reason}"}
-
-                text_parts = []
-                gemini_tool_calls = []
-                
-                if hasattr(resp, "candidates") and resp.candidates:
-                    for candidate in resp.candidates:
-                        if hasattr(candidate, "content") and candidate.content:
-                            for part in candidate.content.parts:
-                                if hasattr(part, "function_call") and part.function_call:
-                                    gemini_tool_calls.append(part.function_call)
-                                elif hasattr(part, "text") and part.text:
-                                    text_parts.append(part.text)
-                
-                assistant_text = "".join(text_parts)
                 if assistant_text:
                     aggregated_text.append(assistant_text)
                 
@@ -409,22 +690,17 @@ class GeminiEngineer:
                 if not gemini_tool_calls:
                     break
                     
-                # Execute tools
+                # Parse all calls first so independent ones can run concurrently
+                calls = []
                 for fc in gemini_tool_calls:
                     name = fc.name
-                    params = {}
-                    if hasattr(fc, "args"):
-                        for key, value in fc.args.items():
-                            if hasattr(value, "string_value"):
-                                params[key] = value.string_value
-                            elif hasattr(value, "list_value"):
-                                # Simplify list extraction
-                                params[key] = [v.string_value for v in value.list_value.values if hasattr(v, "string_value")]
-                            else:
-                                params[key] = value
-
-                    result = self.execute_tool(name, params)
-                    
+                    params = plain_args(fc.args) if getattr(fc, "args", None) else {}
+                    calls.append((name, params))
+
+                # Tools block on disk and subprocesses, so they run off the event loop
+                results = await asyncio.get_running_loop().run_in_executor(None, self._run_tool_calls, calls, on_event)
+                
+                for (name, params), result in zip(calls, results):
                     all_tool_executions.append({
                         "name": name,
                         "parameters": params,
@@ -436,56 +712,200 @@ class GeminiEngineer:
                     # but map it to 'function' role in message construction above.
                     self.conversation_history.append(ConversationMessage(
                         role="tool",
-                        content=json.dumps(result, ensure_ascii=False),
+                        content=self._history_content(name, result),
                         name=name
                     ))
 
         return {"assistant_text": "\n\n".join(aggregated_text), "tools_executed": all_tool_executions}
 
-    def add_file_to_context(self, file_path: str):
-        """Add a file or directory to the conversation context."""
+    def _history_content(self, tool_name: str, result: Dict[str, Any]) -> str:
+        """Serialize a tool result for history, spilling oversized output to the blob store.
+
+        A run_command that ran tests keeps only its test digest; its full
+        output goes to the blob store.
+        """
+        if tool_name == "run_command":
+            result = compact_command_result(result)
+        # read_tool_output already returns a bounded slice of spilled output
+        if tool_name != "read_tool_output":
+            result = compact_tool_result(result)
+        return json.dumps(result, ensure_ascii=False, default=str)
+
+    def _run_tool_calls(self, calls, on_event=None) -> List[Dict[str, Any]]:
+        """Dispatch a turn's tool calls, emitting tool events in streaming mode."""
+        for name, params in calls:
+            self._emit(on_event, {"type": "tool_call", "name": name, "parameters": params})
+        
+        def on_result(index, result):
+            self._emit(on_event, {"type": "tool_result", "name": calls[index][0], "result": result})
+        
+        def on_output(index, name):
+            return lambda stream, line: self._emit(on_event, {
+                "type": "tool_output", "index": index, "name": name, "stream": stream, "line": line
+            })
+        
+        if on_event:
+            # Commands stream their output lines as they run; events and history keep the original parameters
+            calls = [
+                (name, {**params, "on_output": on_output(index, name)} if name == "run_command" else params)
+                for index, (name, params) in enumerate(calls)
+            ]
+        results = self.tool_dispatcher.run(calls, on_result=on_result if on_event else None)
+        for (name, params), result in zip(calls, results):
+            if name in WRITE_TOOLS and "error" not in result:
+                try:
+                    self.changed_files.update(str(Path(p).resolve()) for p in WRITE_TOOLS[name](params) if p)
+                except Exception:
+                    pass
+        return results
+
+    def _add_context_file(self, result: Dict[str, Any], title: Optional[str] = None) -> str:
+        """Put a read file into context, keeping at most one copy per path.
+        
+        Returns "added", "replaced" (older copy swapped for the new content)
+        or "unchanged" (same content already in context, nothing appended).
+        """
+        file_path = result['file_path']
+        content_text = f"{title or 'File: ' + file_path}\n```\n{result['content']}\n```"
+        digest = content_digest(content_text)
+        message = ConversationMessage("user", content_text, context_path=file_path)
+        
+        previous = self.context_files.get(file_path)
+        if previous is not None:
+            old_digest, old_message = previous
+            index = next((i for i, m in enumerate(self.conversation_history) if m is old_message), None)
+            if index is not None:
+                if old_digest == digest:
+                    return "unchanged"
+                self.conversation_history[index] = message
+                self.context_files[file_path] = (digest, message)
+                # An earlier message changed, so the provider cache must be rebuilt
+                self.provider_messages.reset()
+                return "replaced"
+        
+        self.conversation_history.append(message)
+        self.context_files[file_path] = (digest, message)
+        return "added"
+
+    def _add_directory_to_context(self, path: Path, on_progress, max_files: int, max_chars: int) -> Dict[str, Any]:
+        """Ingest a directory: prune-walk it, read files in parallel, add them in walk order."""
+        counts = {"added": 0, "replaced": 0, "unchanged": 0, "skipped": 0, "chars": 0}
+        
+        def excluded(_):
+            counts["skipped"] += 1
+        
+        files = walk_files(path, on_excluded=excluded)
+        window = CONTEXT_READ_WORKERS * 4  # Reads in flight ahead of the budget check
+        with ThreadPoolExecutor(max_workers=CONTEXT_READ_WORKERS, thread_name_prefix="puding-ingest") as pool:
+            pending = deque()
+            for file in files:
+                pending.append(pool.submit(read_local_file, str(file)))
+                if len(pending) < window:
+                    continue
+                if not self._ingest_result(pending.popleft().result(), counts, max_files, max_chars, on_progress):
+                    break
+            else:
+                while pending:
+                    if not self._ingest_result(pending.popleft().result(), counts, max_files, max_chars, on_progress):
+                        break
+            for future in pending:
+                future.cancel()
+        return counts
+
+    def _ingest_result(self, result: Dict[str, Any], counts: Dict[str, Any],
+                       max_files: int, max_chars: int, on_progress) -> bool:
+        """Add one read result to context. Returns False once the budget is exhausted."""
+        if "success" not in result:
+            # Binary, too large or unreadable
+            counts["skipped"] += 1
+        else:
+            if counts["added"] + counts["replaced"] + counts["unchanged"] >= max_files:
+                counts["truncated"] = "file"
+                return False
+            if counts["chars"] + result["size"] > max_chars:
+                counts["truncated"] = "size"
+                return False
+            counts[self._add_context_file(result)] += 1
+            counts["chars"] += result["size"]
+        if on_progress:
+            try:
+                on_progress(dict(counts))
+            except Exception:
+                pass
+        return True
+
+    def _add_repo_map_to_context(self, path: Path, map_tokens: int) -> Dict[str, Any]:
+        """Add the repository map of a directory, replacing an older map of the same directory."""
+        built = repo_map.build(path, map_tokens)
+        result = {"file_path": f"{path} (repository map)", "content": built["content"]}
+        outcome = self._add_context_file(result, title=f"Repository map: {path}")
+        counts = {"added": 0, "replaced": 0, "unchanged": 0, "skipped": 0}
+        counts[outcome] += 1
+        counts.update({k: built[k] for k in ("files", "outlined", "listed", "tokens")})
+        return counts
+
+    def add_file_to_context(self, file_path: str, on_progress=None,
+                            max_files: int = CONTEXT_MAX_FILES, max_chars: int = CONTEXT_MAX_CHARS,
+                            mode: str = "full", map_tokens: int = REPO_MAP_TOKENS) -> Dict[str, int]:
+        """Add a file or directory to the conversation context.
+        
+        Files already in context are not duplicated: unchanged files are skipped
+        and changed files replace their older copy. Directories are walked with
+        excluded subtrees pruned, read on a thread pool, and cut off once
+        max_files or max_chars is reached. Returns per-outcome counts.
+        
+        With mode="map" a directory is added as a ranked repository map (tree,
+        sizes and outlines within map_tokens) instead of full file bodies.
+        
+        Args:
+            on_progress: Optional callback function(counts) called as directory files are processed
+        """
+        counts = {"added": 0, "replaced": 0, "unchanged": 0, "skipped": 0}
         try:
             path = normalize_path(file_path)
             
             if not path.exists():
                 self.console.print(f"[red]❌ Path '{file_path}' does not exist[/red]")
-                return
+                return counts
+            
+            if mode == "map":
+                if not path.is_dir():
+                    self.console.print(f"[red]❌ '{file_path}' is not a directory; --map needs a directory[/red]")
+                    return counts
+                counts = self._add_repo_map_to_context(path, map_tokens)
+                verb = "Map of '{}' is already in context and unchanged" if counts["unchanged"] else "✅ Added map of '{}' to context"
+                self.console.print(
+                    f"[green]{verb.format(path)}: {counts['listed']} of {counts['files']} files listed, "
+                    f"{counts['outlined']} outlined, about {counts['tokens']:,} tokens.[/green]"
+                )
             
-            if path.is_file():
+            elif path.is_file():
                 result = read_local_file(str(path))
                 if "error" in result:
                     self.console.print(f"[red]❌ {result['error']}[/red]")
+                    counts["skipped"] += 1
                 else:
                     # Add file content as a user message for context
-                    content_text = f"File: {result['file_path']}\n```\n{result['content']}\n```"
-                    self.conversation_history.append(ConversationMessage("user", content_text))
-                    self.console.print(f"[green]✅ Added '{path}' to context[/green]")
+                    outcome = self._add_context_file(result)
+                    counts[outcome] += 1
+                    if outcome == "unchanged":
+                        self.console.print(f"[yellow]'{path}' is already in context and unchanged[/yellow]")
+                    elif outcome == "replaced":
+                        self.console.print(f"[green]✅ Updated '{path}' in context[/green]")
+                    else:
+                        self.console.print(f"[green]✅ Added '{path}' to context[/green]")
             
             elif path.is_dir():
-                added_count = 0
-                skipped_count = 0
-                for file_path in path.rglob("*"):  # Recursive glob
-                    # Skip excluded files and directories
-                    if should_exclude_file(file_path):
-                        skipped_count += 1
-                        continue
-                    
-                    if file_path.is_file() and is_text_file(file_path):
-                        try:
-                            result = read_local_file(str(file_path))
-                            if "success" in result:
-                                content_text = f"File: {result['file_path']}\n```\n{result['content']}\n```"
-                                self.conversation_history.append(ConversationMessage("user", content_text))
-                                added_count += 1
-                            else:
-                                skipped_count += 1
-                        except Exception as e:
-                            skipped_count += 1
-                            continue
-                    elif file_path.is_file():  # If it's a file but not text
-                        skipped_count += 1
-                
-                self.console.print(f"[green]✅ Added {added_count} text files from '{path}' to context. Skipped {skipped_count} files (binary/non-text/errors).[/green]")
+                counts.update(self._add_directory_to_context(path, on_progress, max_files, max_chars))
+                message = (
+                    f"✅ Added {counts['added']} text files from '{path}' to context, "
+                    f"updated {counts['replaced']}, {counts['unchanged']} already up to date. "
+                    f"Skipped {counts['skipped']} files (binary/non-text/errors)."
+                )
+                if counts.get("truncated"):
+                    message += f" Stopped early: reached the {counts['truncated']} budget."
+                self.console.print(f"[green]{message}[/green]")
                 
         except Exception as e:
             self.console.print(f"[red]❌ Error adding '{file_path}' to context: {e}[/red]")
+        return counts
@@ -0,0 +1,185 @@
+"""
+Local blob store for tool output too large to keep in conversation history.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Optional, Any, Dict
+
+from .config import (
+    STATE_DIR, TOOL_RESULT_SPILL_CHARS, SPILL_HEAD_LINES, SPILL_TAIL_LINES,
+    MAX_BLOB_READ_LINES, MAX_BLOB_READ_CHARS, BLOB_STORE_MAX_BYTES
+)
+
+_HANDLE_RE = re.compile(r"^[0-9a-f]{16}$")
+
+class BlobStore:
+    """Content-addressed text store under <workspace>/.puding/blobs."""
+
+    def __init__(self, root: Path, max_bytes: int = BLOB_STORE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._pruned = False
+        self._lock = threading.Lock()
+
+    def _path(self, handle: str) -> Path:
+        if not _HANDLE_RE.match(handle or ""):
+            raise ValueError(f"Invalid blob handle '{handle}'")
+        return self.root / f"{handle}.txt"
+
+    def put(self, text: str) -> str:
+        """Store text and return its handle. Identical text shares one blob."""
+        data = text.encode("utf-8")
+        handle = hashlib.sha256(data).hexdigest()[:16]
+        path = self._path(handle)
+        with self._lock:
+            if not self._pruned:
+                self.prune()
+                self._pruned = True
+            if not path.exists():
+                self.root.mkdir(parents=True, exist_ok=True)
+                tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+                tmp.write_bytes(data)
+                os.replace(tmp, path)
+        return handle
+
+    def get(self, handle: str) -> str:
+        return self._path(handle).read_text(encoding="utf-8")
+
+    def read_lines(self, handle: str, start_line: int = 1, end_line: Optional[int] = None) -> Dict[str, Any]:
+        """Return lines start_line..end_line (1-based, inclusive) of a stored blob.
+
+        At most MAX_BLOB_READ_LINES lines and MAX_BLOB_READ_CHARS characters
+        are returned, since the result goes back into history as is. A cut
+        read reports truncated and the next_start_line to continue from; a
+        single line longer than the budget is cut to it.
+        """
+        try:
+            lines = self.get(handle).splitlines()
+        except FileNotFoundError:
+            return {"error": f"No stored output with handle '{handle}'"}
+        except ValueError as e:
+            return {"error": str(e)}
+
+        start_line = max(1, int(start_line or 1))
+        end_line = len(lines) if end_line is None else min(int(end_line), len(lines))
+        truncated = False
+        if end_line - start_line + 1 > MAX_BLOB_READ_LINES:
+            end_line = start_line + MAX_BLOB_READ_LINES - 1
+            truncated = True
+        # Minified JSON or a long single-line log: cap by characters as well
+        selected = []
+        chars = 0
+        line_cut = False
+        for line in lines[start_line - 1:end_line]:
+            if chars + len(line) > MAX_BLOB_READ_CHARS:
+                if not selected:
+                    selected.append(line[:MAX_BLOB_READ_CHARS])
+                    line_cut = True
+                truncated = True
+                break
+            selected.append(line)
+            chars += len(line) + 1
+        if selected:
+            end_line = start_line + len(selected) - 1
+        result = {
+            "success": True,
+            "handle": handle,
+            "start_line": start_line,
+            "end_line": end_line,
+            "total_lines": len(lines),
+            "content": "\n".join(selected),
+            "truncated": truncated
+        }
+        if line_cut:
+            result["line_truncated"] = f"Line {start_line} was cut to its first {MAX_BLOB_READ_CHARS} characters"
+        if truncated and end_line < len(lines):
+            result["next_start_line"] = end_line + 1
+        return result
+
+    def prune(self):
+        """Delete the oldest blobs until the store fits in max_bytes."""
+        if not self.root.is_dir():
+            return
+        blobs = []
+        for entry in os.scandir(self.root):
+            if entry.is_file():
+                st = entry.stat()
+                blobs.append((st.st_mtime, st.st_size, entry.path))
+        total = sum(size for _, size, _ in blobs)
+        for _, size, path in sorted(blobs):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+_stores: Dict[Path, BlobStore] = {}
+_stores_lock = threading.Lock()
+
+def get_blob_store() -> BlobStore:
+    """Blob store of the current workspace (the working directory)."""
+    root = Path.cwd().resolve() / STATE_DIR / "blobs"
+    with _stores_lock:
+        if root not in _stores:
+            _stores[root] = BlobStore(root)
+        return _stores[root]
+
+def summarize_text(text: str, handle: str) -> Dict[str, Any]:
+    """Compact stand-in for a spilled string: size, handle, and its first and last lines."""
+    lines = text.splitlines()
+    summary = {
+        "blob": handle,
+        "total_lines": len(lines),
+        "total_chars": len(text),
+    }
+    # Cap by characters too, in case the output has a few very long lines
+    cap = TOOL_RESULT_SPILL_CHARS // 8
+    if len(lines) <= SPILL_HEAD_LINES + SPILL_TAIL_LINES:
+        summary["head"] = text[:cap]
+        summary["tail"] = text[-cap:]
+    else:
+        summary["head"] = "\n".join(lines[:SPILL_HEAD_LINES])[:cap]
+        summary["tail"] = "\n".join(lines[-SPILL_TAIL_LINES:])[-cap:]
+    summary["note"] = "Output stored in full; use read_tool_output with this blob handle to read specific lines."
+    return summary
+
+def _spill_strings(value: Any, store: BlobStore, limit: int) -> Any:
+    if isinstance(value, str):
+        if len(value) > limit:
+            return summarize_text(value, store.put(value))
+        return value
+    if isinstance(value, dict):
+        return {k: _spill_strings(v, store, limit) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_spill_strings(v, store, limit) for v in value]
+    return value
+
+def compact_tool_result(result: Dict[str, Any], store: Optional[BlobStore] = None,
+                        limit: int = TOOL_RESULT_SPILL_CHARS) -> Dict[str, Any]:
+    """Return the version of a tool result to keep in conversation history.
+
+    Oversized string fields (stdout, file content, ...) are stored in full in
+    the blob store and replaced by a head/tail summary with a handle. If the
+    result is still too large (many medium-sized fields), the whole result is
+    stored as indented JSON and summarized the same way.
+    """
+    if len(json.dumps(result, ensure_ascii=False, default=str)) <= limit:
+        return result
+    store = store or get_blob_store()
+    # Only fields over the whole limit go first, so a medium-sized file read stays
+    # inline; if that is not enough, half the limit, so two large fields
+    # (stdout and stderr) both go
+    for field_limit in (limit, limit // 2):
+        compact = _spill_strings(result, store, field_limit)
+        if len(json.dumps(compact, ensure_ascii=False, default=str)) <= limit:
+            return compact
+    full = json.dumps(result, ensure_ascii=False, indent=1, default=str)
+    summary = {k: v for k, v in result.items() if k in ("success", "error", "command", "returncode", "file_path", "directory")}
+    summary["result"] = summarize_text(full, store.put(full))
+    return summary
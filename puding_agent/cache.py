@@ -0,0 +1,96 @@
+"""
+Process-wide cache of decoded file contents for the tools layer.
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Any, Dict, Tuple
+
+from .config import FILE_CACHE_MAX_BYTES
+
+# (resolved path, mtime_ns, size, inode): any change to the file changes the key
+CacheKey = Tuple[str, int, int, int]
+
+def cache_key(path: str, st: os.stat_result) -> CacheKey:
+    return (path, st.st_mtime_ns, st.st_size, st.st_ino)
+
+class FileReadCache:
+    """LRU cache of file contents keyed on path and stat identity, bounded in bytes.
+
+    A lookup only hits when the file's mtime, size and inode still match the
+    cached entry, so files changed outside the agent are re-read. Writes made
+    through the tools call invalidate() so the stale entry is dropped at once.
+    """
+
+    def __init__(self, max_bytes: int = FILE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[CacheKey, Tuple[Any, int]]" = OrderedDict()
+        self._keys_by_path: Dict[str, CacheKey] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: CacheKey) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: CacheKey, value: Any, cost: int):
+        """Cache value for key; cost is its size in bytes against the budget."""
+        if cost > self.max_bytes:
+            return
+        with self._lock:
+            self._drop(self._keys_by_path.get(key[0]))
+            self._entries[key] = (value, cost)
+            self._keys_by_path[key[0]] = key
+            self._bytes += cost
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def invalidate(self, path: str):
+        """Drop any cached content for a path (call after writing the file)."""
+        with self._lock:
+            if path in self._keys_by_path:
+                self._drop(self._keys_by_path[path])
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_path.clear()
+            self._bytes = 0
+
+    def _drop(self, key: Optional[CacheKey]):
+        if key is None or key not in self._entries:
+            return
+        _, cost = self._entries.pop(key)
+        self._bytes -= cost
+        if self._keys_by_path.get(key[0]) == key:
+            del self._keys_by_path[key[0]]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+# Shared by every tool call, engine and web session in the process
+file_cache = FileReadCache()
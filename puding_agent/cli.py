@@ -5,7 +5,10 @@ CLI entry point for PUding Agent.
 import sys
 import shlex
 from rich.console import Console
+from rich.live import Live
 from rich.panel import Panel
+from rich.spinner import Spinner
+from rich.text import Text
 from prompt_toolkit import PromptSession
 from prompt_toolkit.styles import Style
 
@@ -39,6 +42,27 @@ def main():
                 console.print("[green]Conversation history cleared.[/green]")
                 continue
                 
+            if user_input.lower() == '/stats':
+                engineer.display_usage_stats()
+                continue
+                
+            if user_input.lower().split()[0] == '/shell':
+                arg = user_input.lower().split()[1] if len(user_input.split()) > 1 else ""
+                if arg == "on":
+                    engineer.set_persistent_shell(True)
+                elif arg == "off":
+                    engineer.set_persistent_shell(False)
+                elif arg == "restart" and engineer.shell is not None:
+                    engineer.shell.close()
+                elif arg:
+                    console.print("[red]Usage: /shell [on|off|restart][/red]")
+                    continue
+                if engineer.shell is not None:
+                    console.print(f"[green]Persistent shell on (cwd: {engineer.shell.cwd}).[/green]")
+                else:
+                    console.print("[green]Persistent shell off: each command runs in a new process.[/green]")
+                continue
+                
             if user_input.lower() == '/help':
                 engineer.display_welcome_banner()
                 continue
@@ -46,30 +70,60 @@ def main():
             # Handle /add command
             if user_input.lower().startswith('/add '):
                 args = shlex.split(user_input[5:])
+                options = {}
+                if args and args[0] == "--map":
+                    options["mode"] = "map"
+                    args = args[1:]
+                    if len(args) > 1 and args[0] == "--tokens" and args[1].isdigit():
+                        options["map_tokens"] = int(args[1])
+                        args = args[2:]
                 if args:
-                    engineer.add_file_to_context(args[0])
+                    with console.status("[bold green]Adding to context...[/bold green]", spinner="dots") as status:
+                        def on_progress(counts):
+                            status.update(
+                                f"[bold green]Adding to context... {counts['added'] + counts['replaced'] + counts['unchanged']} files, "
+                                f"{counts['chars']:,} characters[/bold green]"
+                            )
+                        engineer.add_file_to_context(args[0], on_progress=on_progress, **options)
                 else:
-                    console.print("[red]Usage: /add <file_or_directory_path>[/red]")
+                    console.print("[red]Usage: /add <file_or_directory_path> or /add --map [--tokens N] <directory_path>[/red]")
                 continue
             
-            # Process user input
-            with console.status("[bold green]Thinking...[/bold green]", spinner="dots") as status:
-                def loop_callback(count):
-                    if count > 1:
-                        status.update(f"[bold green]Thinking... (Reflection Cycle {count})[/bold green]")
+            # Process user input, rendering assistant text as it streams in
+            streamed = []
+            thinking = Spinner("dots", text="[bold green]Thinking...[/bold green]")
+            with Live(thinking, console=console, refresh_per_second=12) as live:
+                def render():
+                    live.update(Panel("".join(streamed), title="🤖 Assistant", border_style="blue"))
+                
+                def on_event(event):
+                    kind = event["type"]
+                    if kind == "loop" and event["iteration"] > 1:
+                        thinking.update(text=f"[bold green]Thinking... (Reflection Cycle {event['iteration']})[/bold green]")
+                        if streamed:
+                            streamed.append("\n\n")
+                    elif kind == "text":
+                        streamed.append(event["delta"])
+                        render()
+                    elif kind == "tool_output":
+                        # Command output as it is produced, above the live region
+                        style = "red" if event["stream"] == "stderr" else "dim"
+                        console.print(Text(event["line"], style=style))
+                    elif kind == "tool_result":
+                        # Printed above the live region as each tool finishes
+                        engineer.display_tool_result(event["name"], event["result"])
                 
-                response = engineer.respond_once(user_input, on_loop_start=loop_callback)
+                response = engineer.respond_once(user_input, on_event=on_event)
+                if not streamed and response.get("assistant_text"):
+                    streamed.append(response["assistant_text"])
+                if streamed:
+                    render()
+                else:
+                    live.update("")
             
             if "error" in response:
                 console.print(Panel(f"[red]Error: {response['error']}[/red]", title="Error"))
-            else:
-                console.print(Panel(response["assistant_text"], title="🤖 Assistant", border_style="blue"))
                 
-                # Check if there were tool executions
-                if "tools_executed" in response and response["tools_executed"]:
-                    for tool_exec in response["tools_executed"]:
-                        engineer.display_tool_result(tool_exec["name"], tool_exec["result"])
-                        
         except KeyboardInterrupt:
             console.print("\n[yellow]Interrupted. Type /exit to quit.[/yellow]")
         except EOFError:
@@ -6,6 +6,86 @@ Configuration constants for PUding Agent.
 # File size limit (1MB)
 MAX_FILE_SIZE = 1024 * 1024
 
+# Budget for one directory /add: stop after this many files or characters
+CONTEXT_MAX_FILES = 1000
+CONTEXT_MAX_CHARS = 2 * 1024 * 1024
+# Threads reading files in parallel during a directory /add
+CONTEXT_READ_WORKERS = 8
+# Token budget of the repository map added by /add --map (estimated at CHARS_PER_TOKEN)
+REPO_MAP_TOKENS = 4000
+CHARS_PER_TOKEN = 4
+
+# Bytes at the start of a file checked for NUL bytes to detect binary content
+BINARY_SNIFF_BYTES = 8192
+# Tried in order when a file is not valid UTF-8 (GB18030 covers GBK/GB2312 files)
+FALLBACK_TEXT_ENCODINGS = ["gb18030", "latin-1"]
+# A fallback decoding counts as text only if this share of the sniffed characters is printable
+# (latin-1 decodes any bytes, so without this every NUL-free binary file would be "text")
+FALLBACK_MIN_PRINTABLE_RATIO = 0.95
+
+# Threads writing files in parallel in create_multiple_files and other batch writes
+WRITE_WORKERS = 8
+# Upper bound on tool calls from one model turn that run concurrently
+MAX_PARALLEL_TOOLS = 4
+
+# Default and maximum run_command timeouts (seconds); the whole process group is killed on timeout
+COMMAND_TIMEOUT = 120
+MAX_COMMAND_TIMEOUT = 1800
+# run_command keeps the first and the last this many characters of each output stream
+COMMAND_OUTPUT_HEAD_CHARS = 64 * 1024
+COMMAND_OUTPUT_TAIL_CHARS = 64 * 1024
+
+# run_tests: seconds allowed for the warm worker to preload the test files' imports,
+# failure text kept per test, failures listed, and pytest output kept when pytest itself fails
+TEST_PRELOAD_TIMEOUT = 120
+TEST_FAILURE_CHARS = 4000
+TEST_MAX_FAILURES = 30
+TEST_OUTPUT_TAIL_CHARS = 8000
+# run_tests_parallel: shards to run at once (0 = one per CPU core), and the time assumed
+# for a test file with no recorded timing when there are no timings at all
+TEST_WORKERS = 0
+TEST_DEFAULT_SECONDS = 1.0
+# run_command output of a recognized pytest/unittest run is replaced in history by a digest
+# (failed tests, messages, deepest project frame) once it is at least this long;
+# each failure message in the digest is cut to TEST_DIGEST_MESSAGE_CHARS
+TEST_DIGEST_MIN_CHARS = 2000
+TEST_DIGEST_MESSAGE_CHARS = 600
+
+# Byte budget of the in-process cache of file contents read by the tools
+FILE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Per-workspace directory for PUding's own caches and stored tool output
+STATE_DIR = ".puding"
+
+# Tool results larger than this (in characters) are spilled to the blob store
+# and replaced in conversation history by a head/tail summary and a handle
+TOOL_RESULT_SPILL_CHARS = 16 * 1024
+# Lines of a spilled result kept inline at the start and end of the summary
+SPILL_HEAD_LINES = 40
+SPILL_TAIL_LINES = 40
+# Most lines and characters returned by one read_tool_output call
+MAX_BLOB_READ_LINES = 500
+MAX_BLOB_READ_CHARS = TOOL_RESULT_SPILL_CHARS
+# Stored tool output is pruned, oldest first, above this size
+BLOB_STORE_MAX_BYTES = 256 * 1024 * 1024
+# Most lines / bytes returned by one read_file_range call
+MAX_RANGE_READ_LINES = 2000
+MAX_RANGE_READ_BYTES = 256 * 1024
+
+# apply_patch may drop up to this many context lines from each end of a hunk that does not match
+PATCH_MAX_FUZZ = 2
+
+# search_code and find_symbol re-walk the workspace for changed files at most this
+# often (seconds). Files written through the tools are re-indexed on next use, and a
+# run_command makes the next query re-walk, so this only bounds how long edits made
+# outside the agent (e.g. in an editor) can go unseen
+SEARCH_REFRESH_INTERVAL = 300.0
+# Default cap on search_code matches, and the longest snippet shown per match
+SEARCH_MAX_RESULTS = 50
+SEARCH_SNIPPET_CHARS = 200
+# Default cap on find_symbol matches
+SYMBOL_MAX_RESULTS = 50
+
 # Comprehensive exclusion lists for file operations
 EXCLUDED_FILES = {
     # Python specific
@@ -21,7 +101,9 @@ EXCLUDED_FILES = {
     # Environment and config
     ".env", ".env.local", ".env.development", ".env.production",
     # Misc
-    ".git", ".svn", ".hg", "CVS"
+    ".git", ".svn", ".hg", "CVS",
+    # PUding Agent state
+    STATE_DIR
 }
 
 EXCLUDED_EXTENSIONS = {
@@ -58,20 +140,32 @@ Available tools:
 - create_file: Create a single file
 - create_multiple_files: Create multiple files at once
 - read_file: Read a file
+- read_file_range: Read a line range, byte range or the last lines of a file of any size
+- search_code: Search the workspace for a literal string or regex, returning path:line matches
+- find_symbol: Find where a Python class, function, method or import is defined, with its line span
+- outline_file: List the signatures and line spans in a Python file without reading its bodies
 - edit_file: Edit existing files
-- run_command: Run shell commands (use for testing, running scripts, installing dependencies)
+- edit_files: Apply several edits across one or more files in one atomic call
+- apply_patch: Apply a unified diff to one or more files (preferred over rewriting whole files)
+- run_command: Run shell commands (use for testing, running scripts, installing dependencies); pass a larger timeout for long builds or test runs; a long test run's output comes back as a test_digest of its failures plus a blob handle for the full log
+- run_tests: Run pytest in a warm, pre-forked interpreter and get structured pass/fail results (preferred over run_command for Python tests)
+- run_affected_tests: Run only the tests affected by the files changed in this turn
+- run_tests_parallel: Run a large pytest suite split into balanced shards across CPU cores, with one merged report
+- read_tool_output: Read a line range of a large tool result that was stored by handle
 
 MANDATORY BEHAVIOR:
 1. When user asks for file creation: IMMEDIATELY use create_file or create_multiple_files tools. Files are created relative to the current working directory.
 2. When user asks to create projects: Use create_multiple_files with all necessary files
-3. When user asks to read files: Use read_file tool
-4. When user asks to modify files: Use edit_file tool
-5. When user asks to run code or tests: Use run_command tool
+3. When user asks to read files: Use read_file tool (read_file_range for files too large for read_file, e.g. logs)
+4. When user asks to modify files: Use edit_file tool; for several changes (in one or many files) use a single edit_files or apply_patch call instead of re-creating whole files
+5. When user asks to run code or tests: Use run_command tool; for Python tests use run_tests; after a fix, verify with run_affected_tests first
+6. When user asks where something is defined or used: Use find_symbol or search_code instead of reading many files or running grep; use outline_file and read_file_range to read only the span you need
+7. When a tool result is replaced by a summary with a "blob" handle: Use read_tool_output to read the lines you need
 
 REFLECTION AND REPAIR:
 1. After executing a tool, carefully analyze the result.
 2. If a tool fails (returns an error), DO NOT GIVE UP. Analyze the error message, determine the root cause, and TRY AGAIN with corrected parameters.
-3. If a command fails (e.g., tests fail), read the error log, attempt to fix the code, and run the command again.
+3. If a command fails (e.g., tests fail), read the error log (run_tests lists each failure), attempt to fix the code, and run the command again.
 4. You have permission to try up to 3 times to fix any error.
 
 EXAMPLES OF WHEN TO USE TOOLS:
@@ -0,0 +1,303 @@
+"""
+Compact digests of pytest and unittest output, kept in history instead of the raw log.
+"""
+import os
+import re
+import shlex
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple
+
+from .blobs import get_blob_store
+from .config import TEST_DIGEST_MIN_CHARS, TEST_DIGEST_MESSAGE_CHARS, TEST_MAX_FAILURES
+
+# "pytest ...", "py.test", "python -m pytest", also after cd/&&/; or a path
+PYTEST_COMMAND_RE = re.compile(r"(?:^|[\s;&|(/\\])(?:py\.test|pytest)(?:\.exe)?(?:\s|$)|-m\s+pytest\b")
+# "python -m unittest", "manage.py test", "setup.py test", "python tests/test_x.py"
+UNITTEST_COMMAND_RE = re.compile(
+    r"-m\s+unittest\b|\b(?:manage|setup)\.py\s+test\b|\bpython[\d.]*(?:\.exe)?\s+(?:\S+[/\\])?test\w*\.py\b")
+
+_PYTEST_OUTCOMES = r"failed|passed|errors?|skipped|xfailed|xpassed|deselected|warnings?|rerun"
+_PYTEST_SUMMARY_RE = re.compile(
+    rf"^=*\s*((?:\d+ (?:{_PYTEST_OUTCOMES})(?:, )?)+) in [\d.]+\s*s|^=*\s*(no tests ran) in [\d.]+\s*s")
+_PYTEST_COUNT_RE = re.compile(rf"(\d+) ({_PYTEST_OUTCOMES})")
+_PYTEST_SHORT_RE = re.compile(r"^(FAILED|ERROR) (\S+)(?: - (.*))?$")
+_PYTEST_BLOCK_RE = re.compile(r"^_{3,} (.+?) _{3,}$")
+_PYTEST_FRAME_RE = re.compile(r"^([^\s:][^:]*):(\d+): (?:in \S+|[A-Za-z_][\w.]*)")
+_PY_FRAME_RE = re.compile(r'^\s*File "([^"]+)", line (\d+)(?:, in (\S+))?')
+_UNITTEST_HEADER_RE = re.compile(r"^(FAIL|ERROR): (\S+) \((\S+)\)")
+_UNITTEST_RAN_RE = re.compile(r"^Ran (\d+) tests? in ([\d.]+)s")
+_UNITTEST_RESULT_RE = re.compile(r"^(OK|FAILED)(?: \((.*)\))?$")
+
+def is_test_command(command: str) -> bool:
+    """Whether command runs pytest or unittest; only such commands' output is digested."""
+    return bool(PYTEST_COMMAND_RE.search(command) or UNITTEST_COMMAND_RE.search(command))
+
+def wants_junit(command: str) -> bool:
+    """Whether command runs pytest and can be given a JUnit XML report.
+
+    Commands disabling the junitxml plugin are left alone, since pytest
+    would reject the option.
+    """
+    return bool(PYTEST_COMMAND_RE.search(command)) and "no:junitxml" not in command
+
+def pytest_env(junit_path: Path) -> Dict[str, str]:
+    """Environment making pytest also write a JUnit XML report to junit_path.
+
+    The option goes through PYTEST_ADDOPTS, so the command itself is not
+    changed and a --junitxml given in it still wins.
+    """
+    env = dict(os.environ)
+    option = f"--junitxml={shlex.quote(junit_path.as_posix())}"
+    env["PYTEST_ADDOPTS"] = f"{env['PYTEST_ADDOPTS']} {option}" if env.get("PYTEST_ADDOPTS") else option
+    return env
+
+def _clip(text: str) -> str:
+    text = text.strip()
+    return text if len(text) <= TEST_DIGEST_MESSAGE_CHARS else text[:TEST_DIGEST_MESSAGE_CHARS] + " ..."
+
+def _is_project_path(path: str) -> bool:
+    normalized = path.replace("\\", "/")
+    if "site-packages/" in normalized or "/lib/python" in normalized or normalized.startswith("<"):
+        return False
+    return not os.path.isabs(path) or Path(path).resolve().is_relative_to(Path.cwd().resolve())
+
+def _relative(path: str) -> str:
+    try:
+        return Path(path).resolve().relative_to(Path.cwd().resolve()).as_posix() if os.path.isabs(path) else path
+    except ValueError:
+        return path
+
+def _nodeid(classname: str, name: str) -> str:
+    """pytest node id for a JUnit testcase: classname is the node id's path and classes joined by dots.
+
+    Collection errors have no classname and the dotted module path as name.
+    """
+    if not classname:
+        classname, name = name, ""
+    parts = classname.split(".")
+    for i in range(len(parts), 0, -1):
+        path = "/".join(parts[:i]) + ".py"
+        if Path(path).is_file():
+            return "::".join([path] + parts[i:] + ([name] if name else []))
+    return f"{classname}::{name}" if name else classname
+
+def deepest_frame(traceback: str) -> Optional[str]:
+    """"path:line" of the innermost traceback frame in the project's own code (else the innermost)."""
+    frames = []
+    for line in traceback.splitlines():
+        match = _PY_FRAME_RE.match(line) or _PYTEST_FRAME_RE.match(line)
+        if match:
+            frames.append((match.group(1), match.group(2)))
+    if not frames:
+        return None
+    project = [frame for frame in frames if _is_project_path(frame[0])]
+    path, line = (project or frames)[-1]
+    return f"{_relative(path)}:{line}"
+
+def _pytest_message(block: str) -> str:
+    """The "E " lines of a pytest failure: the exception and assertion explanation."""
+    lines = [line[1:].strip() for line in block.splitlines() if line.startswith("E ")]
+    return _clip("\n".join(lines))
+
+def _exception_message(traceback: str) -> str:
+    """The exception lines after the last frame of a Python traceback."""
+    lines = traceback.rstrip().splitlines()
+    last = max((i for i, line in enumerate(lines) if _PY_FRAME_RE.match(line)), default=-1)
+    tail = [line for line in lines[last + 1:] if line and not line.startswith(" ")]
+    return _clip("\n".join(tail))
+
+def _failure_list(failures: List[Dict[str, Any]]) -> Dict[str, Any]:
+    result: Dict[str, Any] = {"failures": failures[:TEST_MAX_FAILURES]}
+    if len(failures) > TEST_MAX_FAILURES:
+        result["failures_omitted"] = len(failures) - TEST_MAX_FAILURES
+    return result
+
+def parse_junit(path: Path) -> Optional[Dict[str, Any]]:
+    """Digest of a JUnit XML report (pytest's --junitxml and compatible writers)."""
+    try:
+        root = ET.parse(path).getroot()
+    except (OSError, ET.ParseError):
+        return None
+    suites = [root] if root.tag == "testsuite" else root.findall("testsuite")
+    counts = {"tests": 0, "failed": 0, "errors": 0, "skipped": 0}
+    elapsed = 0.0
+    failures = []
+    for suite in suites:
+        elapsed += float(suite.get("time", 0) or 0)
+        for case in suite.iter("testcase"):
+            counts["tests"] += 1
+            test = _nodeid(case.get("classname", ""), case.get("name", ""))
+            for tag, kind in (("failure", "failed"), ("error", "error")):
+                element = case.find(tag)
+                if element is not None:
+                    counts["failed" if kind == "failed" else "errors"] += 1
+                    text = element.text or ""
+                    failures.append({
+                        "test": test,
+                        "kind": kind,
+                        "message": _pytest_message(text) or _clip(element.get("message") or _exception_message(text)),
+                        "location": deepest_frame(text),
+                    })
+                    break
+            else:
+                if case.find("skipped") is not None:
+                    counts["skipped"] += 1
+    counts["passed"] = counts["tests"] - counts["failed"] - counts["errors"] - counts["skipped"]
+    summary = ", ".join(f"{counts[k]} {k}" for k in ("failed", "errors", "passed", "skipped") if counts[k])
+    return {
+        "framework": "pytest",
+        "source": "junit",
+        "summary": f"{summary or 'no tests ran'} in {elapsed:.2f}s",
+        "counts": {k: v for k, v in counts.items() if v},
+        **_failure_list(failures),
+    }
+
+def parse_pytest_text(text: str) -> Optional[Dict[str, Any]]:
+    """Digest of pytest's terminal output, or None if text does not look like a pytest run."""
+    lines = text.splitlines()
+    summary = None
+    for line in reversed(lines):
+        match = _PYTEST_SUMMARY_RE.match(line.strip())
+        if match:
+            summary = (match.group(1) or match.group(2)).strip()
+            break
+    if summary is None and "test session starts" not in text:
+        return None
+
+    # Long tracebacks, by block title ("test_name", "TestClass.test_name", "ERROR at setup of test_x")
+    blocks: Dict[str, str] = {}
+    title, body = None, []
+    for line in lines:
+        match = _PYTEST_BLOCK_RE.match(line)
+        if match or line.startswith("====="):
+            if title:
+                blocks[title] = "\n".join(body)
+            title, body = (match.group(1) if match else None), []
+        elif title:
+            body.append(line)
+    if title:
+        blocks[title] = "\n".join(body)
+
+    def block_for(test: str) -> str:
+        name = test.split("::", 1)[-1].replace("::", ".")
+        for key, block in blocks.items():
+            if key == name or key.endswith(" " + name) or key.endswith(" " + test) or key == test:
+                return block
+        return ""
+
+    failures = []
+    for line in lines:
+        match = _PYTEST_SHORT_RE.match(line)
+        if match:
+            kind, test, short = match.groups()
+            block = block_for(test)
+            failures.append({
+                "test": test,
+                "kind": "failed" if kind == "FAILED" else "error",
+                "message": _pytest_message(block) or _clip(short or ""),
+                "location": deepest_frame(block),
+            })
+    if not failures:
+        # No short summary (e.g. -rN): fall back to the traceback blocks
+        for key, block in blocks.items():
+            failures.append({"test": key, "kind": "error" if key.startswith("ERROR") else "failed",
+                             "message": _pytest_message(block), "location": deepest_frame(block)})
+
+    counts = {}
+    for number, word in _PYTEST_COUNT_RE.findall(summary or ""):
+        word = {"error": "errors", "warning": "warnings"}.get(word, word)
+        counts[word] = int(number)
+    return {
+        "framework": "pytest",
+        "source": "text",
+        "summary": summary or "run did not finish",
+        "counts": counts,
+        **_failure_list(failures),
+    }
+
+def parse_unittest_text(text: str) -> Optional[Dict[str, Any]]:
+    """Digest of unittest's (or Django's test runner's) output, or None if it is not one."""
+    lines = text.splitlines()
+    ran = next((m for m in map(_UNITTEST_RAN_RE.match, lines) if m), None)
+    if ran is None:
+        return None
+    failures = []
+    i = 0
+    while i < len(lines):
+        match = _UNITTEST_HEADER_RE.match(lines[i])
+        if not match:
+            i += 1
+            continue
+        kind, method, where = match.groups()
+        body = []
+        i += 1
+        # The traceback runs until the next "=====" header or the "Ran N tests" line
+        while i < len(lines) and not lines[i].startswith("=" * 20) and not _UNITTEST_RAN_RE.match(lines[i]):
+            if not lines[i].startswith("-" * 20):
+                body.append(lines[i])
+            i += 1
+        traceback = "\n".join(body)
+        failures.append({
+            "test": f"{where}.{method}" if not where.endswith(method) else where,
+            "kind": "failed" if kind == "FAIL" else "error",
+            "message": _exception_message(traceback),
+            "location": deepest_frame(traceback),
+        })
+    counts = {"tests": int(ran.group(1))}
+    result_line = next((m for m in map(_UNITTEST_RESULT_RE.match, reversed(lines)) if m), None)
+    if result_line and result_line.group(2):
+        for part in result_line.group(2).split(","):
+            key, _, value = part.strip().partition("=")
+            if value.isdigit():
+                counts[key] = int(value)
+    status = result_line.group(0) if result_line else "did not finish"
+    return {
+        "framework": "unittest",
+        "source": "text",
+        "summary": f"Ran {ran.group(1)} tests in {ran.group(2)}s: {status}",
+        "counts": counts,
+        **_failure_list(failures),
+    }
+
+def digest_test_output(stdout: str, stderr: str, junit_path: Optional[Path] = None) -> Optional[Dict[str, Any]]:
+    """Digest of a test run's output: from the JUnit report if one was written, else the text."""
+    if junit_path is not None:
+        digest = parse_junit(junit_path)
+        if digest is not None:
+            return digest
+    text = stdout + ("\n" + stderr if stderr else "")
+    # unittest prints to stderr, pytest to stdout; try the likelier parser first
+    parsers: Tuple = (parse_pytest_text, parse_unittest_text) if "test session starts" in stdout \
+        else (parse_unittest_text, parse_pytest_text)
+    for parse in parsers:
+        digest = parse(text)
+        if digest is not None:
+            return digest
+    return None
+
+def compact_command_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """History version of a run_command result that ran tests: the digest instead of the raw log.
+
+    The full stdout/stderr go to the blob store and only their handle and
+    size stay, so read_tool_output can still fetch any part of the log.
+    Results without a test digest are unchanged, and ones with little
+    output keep the raw output instead.
+    """
+    digest = result.get("test_digest")
+    if digest is None:
+        return result
+    stdout, stderr = result.get("stdout") or "", result.get("stderr") or ""
+    if len(stdout) + len(stderr) < TEST_DIGEST_MIN_CHARS:
+        # Short output says it all; the digest would only repeat it
+        return {k: v for k, v in result.items() if k != "test_digest"}
+    log = stdout + (f"\n--- stderr ---\n{stderr}" if stderr else "")
+    compact = {k: v for k, v in result.items() if k not in ("stdout", "stderr", "test_digest")}
+    compact["test_digest"] = digest
+    compact["output"] = {
+        "blob": get_blob_store().put(log),
+        "total_lines": len(log.splitlines()),
+        "total_chars": len(log),
+        "note": "Full output stored; use read_tool_output with this blob handle to read specific lines.",
+    }
+    return compact
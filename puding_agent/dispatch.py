@@ -0,0 +1,133 @@
+"""
+Concurrent dispatch of the tool calls returned in one model turn.
+"""
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Dict, Any, List, Tuple, Callable, Optional
+
+from .config import MAX_PARALLEL_TOOLS
+from .patch import patch_paths
+
+# Tools that only read the workspace, mapped to the paths they read
+READ_ONLY_TOOLS: Dict[str, Callable[[Dict[str, Any]], List[str]]] = {
+    "read_file": lambda p: [p.get("file_path", "")],
+    "read_file_range": lambda p: [p.get("file_path", "")],
+    "read_multiple_files": lambda p: list(p.get("file_paths") or []),
+    "list_directory": lambda p: [p.get("dir_path") or "."],
+    "search_code": lambda p: ["."],  # Reads the whole workspace
+    "find_symbol": lambda p: ["."],
+    "outline_file": lambda p: [p.get("file_path", "")],
+    "read_tool_output": lambda p: [],  # Reads the blob store, not the workspace
+}
+
+# Tools that write files, mapped to the paths they write
+WRITE_TOOLS: Dict[str, Callable[[Dict[str, Any]], List[str]]] = {
+    "create_file": lambda p: [p.get("file_path", "")],
+    "create_multiple_files": lambda p: [f.get("path", "") for f in p.get("files") or [] if isinstance(f, Mapping)],
+    "edit_file": lambda p: [p.get("file_path", "")],
+    "edit_files": lambda p: [e.get("file_path", "") for e in p.get("edits") or [] if isinstance(e, Mapping)],
+    "apply_patch": lambda p: patch_paths(p.get("patch") or ""),
+}
+
+class _CallAccess:
+    """Workspace access of a single tool call, used to order conflicting calls."""
+
+    def __init__(self, name: str, params: Dict[str, Any]):
+        self.barrier = False
+        self.writes = False
+        self.paths: List[Path] = []
+        if name in READ_ONLY_TOOLS:
+            extract = READ_ONLY_TOOLS[name]
+        elif name in WRITE_TOOLS:
+            extract = WRITE_TOOLS[name]
+            self.writes = True
+        else:
+            # run_command and unknown tools may touch anything
+            self.barrier = True
+            return
+        try:
+            self.paths = [Path(p).resolve() for p in extract(params) if isinstance(p, str)]
+        except Exception:
+            self.barrier = True
+
+    def conflicts_with(self, other: "_CallAccess") -> bool:
+        if self.barrier or other.barrier:
+            return True
+        if not (self.writes or other.writes):
+            return False
+        for a in self.paths:
+            for b in other.paths:
+                # Same path, or one contains the other (list_directory vs a write inside it)
+                if a == b or a in b.parents or b in a.parents:
+                    return True
+        return False
+
+class ToolDispatcher:
+    """Run a turn's tool calls concurrently while preserving their observable order.
+
+    Read-only tools run in parallel on a bounded thread pool. A call waits for
+    every earlier call it conflicts with: calls touching the same path where
+    at least one of them writes, and any call before or after a barrier tool
+    such as run_command. Results are returned in the original call order.
+    """
+
+    def __init__(self, execute: Callable[[str, Dict[str, Any]], Dict[str, Any]], max_workers: int = MAX_PARALLEL_TOOLS):
+        self.execute = execute
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="puding-tool")
+        return self._executor
+
+    def run(self, calls: List[Tuple[str, Dict[str, Any]]],
+            on_result: Optional[Callable[[int, Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+        """Execute (tool_name, parameters) pairs and return results in call order.
+
+        on_result, if given, is called with (call_index, result) as each call
+        finishes, which may be out of call order.
+        """
+        if len(calls) <= 1 or self.max_workers <= 1:
+            results = []
+            for index, (name, params) in enumerate(calls):
+                results.append(self.execute(name, params))
+                if on_result:
+                    on_result(index, results[-1])
+            return results
+
+        access = [_CallAccess(name, params) for name, params in calls]
+        deps = [
+            {j for j in range(i) if access[i].conflicts_with(access[j])}
+            for i in range(len(calls))
+        ]
+        results: List[Optional[Dict[str, Any]]] = [None] * len(calls)
+        done = set()
+        waiting = list(range(len(calls)))
+        pending = {}  # future -> call index
+        pool = self._pool()
+
+        while len(done) < len(calls):
+            # Start every call whose conflicting predecessors have all finished
+            for index in [i for i in waiting if deps[i] <= done]:
+                name, params = calls[index]
+                pending[pool.submit(self.execute, name, params)] = index
+                waiting.remove(index)
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                index = pending.pop(future)
+                try:
+                    results[index] = future.result()
+                except Exception as e:
+                    results[index] = {"error": f"Error executing {calls[index][0]}: {str(e)}"}
+                done.add(index)
+                if on_result:
+                    on_result(index, results[index])
+
+        return results
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,263 @@
+"""
+Compiled exclusion rules: EXCLUDED_FILES / EXCLUDED_EXTENSIONS plus .gitignore files.
+"""
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Optional, List, Dict, Tuple, Pattern
+
+from .config import EXCLUDED_FILES, EXCLUDED_EXTENSIONS
+
+# How often get_matcher() checks known .gitignore files for changes (seconds)
+GITIGNORE_RECHECK_INTERVAL = 2.0
+
+_EXTENSIONS = frozenset(ext.lower() for ext in EXCLUDED_EXTENSIONS)
+
+def name_excluded(name: str, is_dir: bool = False) -> bool:
+    """Check a file or directory name against the built-in exclusion lists.
+
+    Directories are pruned only by EXCLUDED_FILES; the hidden-name and
+    extension rules apply to files, so .github/workflows/ci.yml is kept.
+    """
+    if name in EXCLUDED_FILES:
+        return True
+    if is_dir:
+        return False
+    # Hidden files
+    if name.startswith('.'):
+        return True
+    # Every dot-suffix of the name (".min.js", ".js" for "app.min.js") is one set lookup,
+    # equivalent to testing name.endswith(ext) for each excluded extension
+    lower = name.lower()
+    dot = lower.find('.', 1)
+    while dot != -1:
+        if lower[dot:] in _EXTENSIONS:
+            return True
+        dot = lower.find('.', dot + 1)
+    return False
+
+def _glob_to_regex(glob: str) -> str:
+    """Translate the body of a .gitignore pattern to a regex for a slash-separated path."""
+    i, n = 0, len(glob)
+    out = []
+    while i < n:
+        c = glob[i]
+        if glob.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif glob.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif c == "*":
+            out.append("[^/]*")
+            i += 1
+        elif c == "?":
+            out.append("[^/]")
+            i += 1
+        elif c == "[":
+            end = glob.find("]", i + 2)
+            if end == -1:
+                out.append(re.escape(c))
+                i += 1
+            else:
+                body = glob[i + 1:end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append("[" + body.replace("\\", "\\\\") + "]")
+                i = end + 1
+        elif c == "\\" and i + 1 < n:
+            out.append(re.escape(glob[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(c))
+            i += 1
+    return "".join(out)
+
+class GitignoreRules:
+    """Compiled rules of one .gitignore file, matched against paths relative to its directory."""
+
+    def __init__(self, lines: List[str]):
+        # (regex, negated, dir_only) in file order
+        self.rules: List[Tuple[Pattern, bool, bool]] = []
+        for raw in lines:
+            line = raw.rstrip("\n\r")
+            if not line.strip() or line.startswith("#"):
+                continue
+            if not line.endswith("\\ "):
+                line = line.rstrip()
+            negated = line.startswith("!")
+            if negated:
+                line = line[1:]
+            elif line.startswith("\\!") or line.startswith("\\#"):
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            if not line:
+                continue
+            # A slash anywhere but the end anchors the pattern to this directory
+            anchored = "/" in line
+            line = line.lstrip("/")
+            prefix = "" if anchored else "(?:.*/)?"
+            self.rules.append((re.compile(f"^{prefix}{_glob_to_regex(line)}$"), negated, dir_only))
+        self.has_negation = any(neg for _, neg, _ in self.rules)
+        self._any_file: Optional[Pattern] = None
+        self._any_dir: Optional[Pattern] = None
+        # Without negations the last-match-wins order does not matter: one alternation decides
+        if self.rules and not self.has_negation:
+            files = [r.pattern for r, _, dir_only in self.rules if not dir_only]
+            self._any_file = re.compile("|".join(f"(?:{p})" for p in files)) if files else None
+            self._any_dir = re.compile("|".join(f"(?:{r.pattern})" for r, _, _ in self.rules))
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["GitignoreRules"]:
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                rules = cls(f.readlines())
+        except OSError:
+            return None
+        return rules if rules.rules else None
+
+    def match(self, rel_path: str, is_dir: bool) -> Optional[bool]:
+        """True if ignored, False if explicitly re-included, None if no rule matches."""
+        if not self.has_negation:
+            pattern = self._any_dir if is_dir else self._any_file
+            return True if pattern is not None and pattern.match(rel_path) else None
+        for regex, negated, dir_only in reversed(self.rules):
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel_path):
+                return not negated
+        return None
+
+class ExclusionMatcher:
+    """Exclusion rules of one workspace, compiled once and answered from per-directory memos.
+
+    A path is excluded if its own name matches the built-in lists (for
+    directories: EXCLUDED_FILES only), if any .gitignore from the workspace
+    root down to its directory ignores it, or if any of its parent
+    directories (below the root) is excluded.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self._root_str = str(root)
+        self._lock = threading.Lock()
+        self._gitignores: Dict[str, Optional[GitignoreRules]] = {}  # dir rel path -> rules
+        self._gitignore_mtimes: Dict[str, int] = {}
+        self._dir_excluded: Dict[object, bool] = {}  # dir rel path (or (explicit, rel)) -> excluded
+        self._chains: Dict[str, List[Tuple[str, GitignoreRules]]] = {}
+
+    def _relative(self, path: Path) -> Optional[str]:
+        s = str(path)
+        if s == self._root_str:
+            return ""
+        if s.startswith(self._root_str + os.sep):
+            rel = s[len(self._root_str) + 1:]
+            return rel.replace(os.sep, "/") if os.sep != "/" else rel
+        return None
+
+    def _rules_in(self, rel_dir: str) -> Optional[GitignoreRules]:
+        if rel_dir not in self._gitignores:
+            path = self.root / rel_dir / ".gitignore" if rel_dir else self.root / ".gitignore"
+            rules = GitignoreRules.load(path) if path.is_file() else None
+            with self._lock:
+                self._gitignores[rel_dir] = rules
+                if rules is not None:
+                    self._gitignore_mtimes[str(path)] = path.stat().st_mtime_ns
+        return self._gitignores[rel_dir]
+
+    def _chain(self, rel_dir: str) -> List[Tuple[str, GitignoreRules]]:
+        """The .gitignore files that apply inside rel_dir, deepest first."""
+        chain = self._chains.get(rel_dir)
+        if chain is None:
+            parent = rel_dir.rpartition("/")[0] if rel_dir else None
+            chain = list(self._chain(parent)) if parent is not None else []
+            rules = self._rules_in(rel_dir)
+            if rules is not None:
+                chain.insert(0, (rel_dir, rules))
+            self._chains[rel_dir] = chain
+        return chain
+
+    def _own_excluded(self, rel: str, is_dir: bool) -> bool:
+        parent, _, name = rel.rpartition("/")
+        if name_excluded(name, is_dir):
+            return True
+        for base, rules in self._chain(parent):
+            verdict = rules.match(rel[len(base) + 1:] if base else rel, is_dir)
+            if verdict is not None:
+                return verdict
+        return False
+
+    def _dir_is_excluded(self, rel_dir: str, explicit: str = "") -> bool:
+        # The explicitly named directory and its ancestors are never excluded
+        if not rel_dir or rel_dir == explicit or explicit.startswith(rel_dir + "/"):
+            return False
+        key = (explicit, rel_dir) if explicit else rel_dir
+        cached = self._dir_excluded.get(key)
+        if cached is None:
+            parent = rel_dir.rpartition("/")[0]
+            cached = self._dir_is_excluded(parent, explicit) or self._own_excluded(rel_dir, True)
+            self._dir_excluded[key] = cached
+        return cached
+
+    def excluded(self, path: Path, is_dir: Optional[bool] = None, explicit: Optional[Path] = None) -> bool:
+        """Whether path is excluded. Pass is_dir when known to avoid a stat.
+
+        explicit is a directory the user named (e.g. with /add): it and the
+        directories above it are not excluded, only what lies inside it.
+        """
+        rel = self._relative(path)
+        if rel is None:
+            # Outside the workspace: only the built-in name rules apply
+            return name_excluded(path.name, path.is_dir() if is_dir is None else is_dir)
+        if not rel:
+            return False
+        explicit_rel = (self._relative(explicit) or "") if explicit is not None else ""
+        if is_dir is None:
+            is_dir = path.is_dir()
+        if is_dir:
+            return self._dir_is_excluded(rel, explicit_rel)
+        parent = rel.rpartition("/")[0]
+        return self._dir_is_excluded(parent, explicit_rel) or self._own_excluded(rel, False)
+
+    def gitignores_changed(self) -> bool:
+        """Whether a .gitignore read by this matcher was modified or removed since."""
+        with self._lock:
+            known = list(self._gitignore_mtimes.items())
+        for path, mtime in known:
+            try:
+                if os.stat(path).st_mtime_ns != mtime:
+                    return True
+            except OSError:
+                return True
+        return False
+
+_matchers: Dict[str, Tuple[ExclusionMatcher, float]] = {}
+_matchers_lock = threading.Lock()
+
+def get_matcher(root: Optional[Path] = None) -> ExclusionMatcher:
+    """Matcher for a workspace (default: the working directory), rebuilt when its .gitignores change."""
+    root = (root or Path.cwd()).resolve()
+    key = str(root)
+    now = time.monotonic()
+    with _matchers_lock:
+        entry = _matchers.get(key)
+    if entry is not None:
+        matcher, checked = entry
+        if now - checked < GITIGNORE_RECHECK_INTERVAL:
+            return matcher
+        if not matcher.gitignores_changed():
+            with _matchers_lock:
+                _matchers[key] = (matcher, now)
+            return matcher
+    matcher = ExclusionMatcher(root)
+    with _matchers_lock:
+        _matchers[key] = (matcher, now)
+    return matcher
+
+def invalidate_matchers():
+    """Drop compiled matchers, e.g. after the agent writes a .gitignore."""
+    with _matchers_lock:
+        _matchers.clear()
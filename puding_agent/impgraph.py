@@ -0,0 +1,132 @@
+"""
+Import graph of the workspace's Python files, and the test modules affected by a set of changed files.
+"""
+import ast
+import posixpath
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Optional, Dict, List, Set, Tuple, Iterable
+
+from .symbols import get_symbol_index, Symbol
+from .testrunner import is_test_file
+
+def module_names(rel: str) -> List[str]:
+    """Dotted names a file can be imported as, from its full path down to its bare name."""
+    parts = rel[:-len(posixpath.splitext(rel)[1])].split("/")
+    if parts[-1] == "__init__":
+        parts = parts[:-1]
+    return [".".join(parts[i:]) for i in range(len(parts)) if parts[i:]]
+
+def resolve_import(module: str, importer: str, modules: Dict[str, str]) -> Optional[str]:
+    """File (relative path) an import in importer refers to, if it is one of modules' files."""
+    if module.startswith("."):
+        level = len(module) - len(module.lstrip("."))
+        package = posixpath.dirname(importer).split("/") if posixpath.dirname(importer) else []
+        package = package[:len(package) - (level - 1)] if level > 1 else package
+        module = ".".join(package + [p for p in module.lstrip(".").split(".") if p])
+    # "from pkg.mod import name" names pkg.mod.name; fall back to the enclosing module
+    while module:
+        if module in modules:
+            return modules[module]
+        module = module.rpartition(".")[0]
+    return None
+
+def _imported_names(symbols: List[Symbol]) -> List[str]:
+    """Imported modules, plus "pkg.name" for "from pkg import name" in case name is a submodule."""
+    names = []
+    for sym in symbols:
+        if sym.kind != "import":
+            continue
+        names.append(sym.name)
+        if sym.signature.startswith("from ") and not sym.name.endswith("."):
+            try:
+                node = ast.parse(sym.signature).body[0]
+            except (SyntaxError, IndexError):
+                continue
+            if isinstance(node, ast.ImportFrom) and node.module:
+                names.extend(f"{sym.name}.{alias.name}" for alias in node.names if alias.name != "*")
+    return names
+
+class ImportGraph:
+    """Which workspace files import which, built from the symbol index.
+
+    The graph is rebuilt only when a file's content digest changed, and the
+    imports of each distinct file content are extracted once.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.imports: Dict[str, Set[str]] = {}     # file -> files it imports
+        self.importers: Dict[str, Set[str]] = {}   # file -> files importing it
+        self._fingerprint: Optional[frozenset] = None
+        self._names: Dict[str, List[str]] = {}     # digest -> imported names
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        snapshot = get_symbol_index().snapshot()
+        fingerprint = frozenset((rel, digest) for rel, (digest, _) in snapshot.items())
+        with self._lock:
+            if fingerprint == self._fingerprint:
+                return
+            modules: Dict[str, str] = {}
+            # Shorter names may be ambiguous; the shallowest file wins
+            for rel in sorted(snapshot, key=lambda r: (r.count("/"), r)):
+                for name in module_names(rel):
+                    modules.setdefault(name, rel)
+            names = {digest: self._names.get(digest) or _imported_names(symbols)
+                     for digest, symbols in snapshot.values()}
+            imports = {}
+            importers: Dict[str, Set[str]] = {rel: set() for rel in snapshot}
+            for rel, (digest, _) in snapshot.items():
+                targets = {resolve_import(name, rel, modules) for name in names[digest]} - {None, rel}
+                imports[rel] = targets
+                for target in targets:
+                    importers[target].add(rel)
+            self.imports, self.importers = imports, importers
+            self._names = names
+            self._fingerprint = fingerprint
+
+    def affected_tests(self, changed: Iterable[str]) -> Tuple[List[str], List[str]]:
+        """Test modules that are, or transitively import, one of the changed files.
+
+        changed holds paths relative to the root. A changed conftest.py
+        affects every test module below its directory. Returns the test
+        modules and the changed files the graph knows nothing about
+        (non-Python, deleted or outside the workspace).
+        """
+        self.refresh()
+        with self._lock:
+            importers = self.importers
+        reached: Set[str] = set()
+        unmapped: List[str] = []
+        queue = deque()
+        for rel in changed:
+            if posixpath.basename(rel) == "conftest.py":
+                directory = posixpath.dirname(rel)
+                reached.update(f for f in importers
+                               if is_test_file(f) and (not directory or f.startswith(directory + "/")))
+            if rel in importers:
+                if rel not in reached:
+                    reached.add(rel)
+                    queue.append(rel)
+            else:
+                unmapped.append(rel)
+        while queue:
+            for importer in importers.get(queue.popleft(), ()):
+                if importer not in reached:
+                    reached.add(importer)
+                    queue.append(importer)
+        tests = sorted(f for f in reached if is_test_file(f) and posixpath.basename(f) != "conftest.py")
+        return tests, unmapped
+
+_graphs: Dict[Path, ImportGraph] = {}
+_graphs_lock = threading.Lock()
+
+def get_import_graph() -> ImportGraph:
+    """Import graph of the current workspace (the working directory)."""
+    root = Path.cwd().resolve()
+    with _graphs_lock:
+        if root not in _graphs:
+            _graphs[root] = ImportGraph(root)
+        return _graphs[root]
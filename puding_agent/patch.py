@@ -0,0 +1,186 @@
+"""
+Parsing and fuzzy application of unified diffs.
+"""
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple
+
+from .config import PATCH_MAX_FUZZ
+
+_HUNK_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+DEV_NULL = "/dev/null"
+
+@dataclass
+class Hunk:
+    old_start: Optional[int]          # 1-based, None when the header had no line numbers
+    lines: List[Tuple[str, str]] = field(default_factory=list)  # (" " | "-" | "+", text)
+
+    @property
+    def old_lines(self) -> List[str]:
+        return [text for tag, text in self.lines if tag != "+"]
+
+@dataclass
+class FilePatch:
+    old_path: str
+    new_path: str
+    hunks: List[Hunk] = field(default_factory=list)
+
+    @property
+    def path(self) -> str:
+        return self.old_path if self.new_path == DEV_NULL else self.new_path
+
+def _header_path(line: str) -> str:
+    # "--- a/path\t2024-01-01 ..." -> "a/path"
+    return line[4:].split("\t")[0].strip()
+
+def parse_unified_diff(text: str) -> List[FilePatch]:
+    """Parse a (possibly multi-file) unified diff.
+
+    Hunk line counts are not trusted, since hand-written and generated diffs
+    often get them wrong: a hunk runs until the next hunk or file header, or
+    the first line that is not context, removal, addition or a "\\ No newline"
+    marker. Hunk headers without line numbers ("@@ @@") are accepted.
+    """
+    lines = text.splitlines()
+    patches: List[FilePatch] = []
+    current: Optional[FilePatch] = None
+    hunk: Optional[Hunk] = None
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if line.startswith("--- ") and i + 1 < len(lines) and lines[i + 1].startswith("+++ "):
+            current = FilePatch(_header_path(line), _header_path(lines[i + 1]))
+            patches.append(current)
+            hunk = None
+            i += 2
+            continue
+        if line.startswith("@@"):
+            if current is None:
+                raise ValueError(f"Hunk header before any file header on line {i + 1}")
+            match = _HUNK_RE.match(line)
+            hunk = Hunk(int(match.group(1)) if match else None)
+            current.hunks.append(hunk)
+        elif hunk is not None and line[:1] in (" ", "-", "+"):
+            hunk.lines.append((line[0], line[1:]))
+        elif hunk is not None and line == "":
+            # Some tools drop the leading space of empty context lines
+            hunk.lines.append((" ", ""))
+        elif line.startswith("\\"):
+            pass  # "\ No newline at end of file"
+        else:
+            hunk = None  # "diff --git", "index ...", commentary between files
+        i += 1
+    for patch in patches:
+        for h in patch.hunks:
+            # Blank separator lines after the last change are not context
+            while h.lines and h.lines[-1] == (" ", ""):
+                h.lines.pop()
+        patch.hunks = [h for h in patch.hunks if h.lines]
+    return patches
+
+def patch_paths(text: str) -> List[str]:
+    """File paths named in a diff's headers (cheap, without parsing hunks)."""
+    paths = []
+    for line in text.splitlines():
+        if line.startswith(("--- ", "+++ ")):
+            path = _header_path(line)
+            if path != DEV_NULL:
+                paths.append(strip_prefix(path))
+    return paths
+
+def strip_prefix(path: str) -> str:
+    """Drop git's "a/" / "b/" prefix unless it names a real directory."""
+    if path.startswith(("a/", "b/")) and not Path(path).exists():
+        return path[2:]
+    return path
+
+def _matches(file_lines: List[str], pos: int, block: List[str], loose: bool) -> bool:
+    if pos < 0 or pos + len(block) > len(file_lines):
+        return False
+    if loose:
+        return all(a.strip() == b.strip() for a, b in zip(file_lines[pos:pos + len(block)], block))
+    return file_lines[pos:pos + len(block)] == block
+
+def _find(file_lines: List[str], block: List[str], expected: int, loose: bool) -> Optional[int]:
+    """Position of block nearest to expected, searching outward in both directions."""
+    if not block:
+        return max(0, min(expected, len(file_lines)))
+    limit = max(expected, len(file_lines) - expected) + 1
+    for distance in range(limit):
+        for pos in (expected - distance, expected + distance) if distance else (expected,):
+            if _matches(file_lines, pos, block, loose):
+                return pos
+    return None
+
+def _trim(lines: List[Tuple[str, str]], fuzz: int) -> List[Tuple[str, str]]:
+    """Drop up to fuzz context lines from each end of a hunk (patch(1)'s fuzz factor)."""
+    start, end = 0, len(lines)
+    for _ in range(fuzz):
+        if start < end and lines[start][0] == " ":
+            start += 1
+        if end > start and lines[end - 1][0] == " ":
+            end -= 1
+    return lines[start:end]
+
+def apply_hunks(content: str, hunks: List[Hunk], max_fuzz: int = PATCH_MAX_FUZZ) -> Tuple[str, List[Dict[str, Any]]]:
+    """Apply hunks in order to content; returns the new content and one result per hunk.
+
+    Each hunk is tried at its header line (shifted by the net line change of
+    earlier hunks), then at the nearest position where it matches exactly,
+    then ignoring whitespace, then with up to max_fuzz context lines dropped
+    from each end. Context lines keep the file's text, so a whitespace-only
+    mismatch never rewrites them.
+    """
+    trailing_newline = content.endswith("\n") or not content
+    file_lines = content.split("\n")
+    if trailing_newline:
+        file_lines.pop()
+    results = []
+    delta = 0
+    for number, hunk in enumerate(hunks, 1):
+        expected = (hunk.old_start - 1 if hunk.old_start else 0) + delta
+        placed = None
+        for fuzz in range(max_fuzz + 1):
+            lines = _trim(hunk.lines, fuzz)
+            if fuzz and lines == hunk.lines:
+                break
+            block = [text for tag, text in lines if tag != "+"]
+            if not block and file_lines and hunk.old_start is None:
+                break  # Pure insertion with no anchor: nowhere to put it
+            for loose in (False, True):
+                pos = _find(file_lines, block, max(0, expected), loose)
+                if pos is not None:
+                    placed = (pos, lines, fuzz, loose)
+                    break
+            if placed:
+                break
+        if placed is None:
+            results.append({"hunk": number, "status": "failed",
+                            "error": "Context and removed lines not found in the file"})
+            continue
+        pos, lines, fuzz, loose = placed
+        replacement = []
+        cursor = pos
+        for tag, text in lines:
+            if tag == " ":
+                replacement.append(file_lines[cursor])
+                cursor += 1
+            elif tag == "-":
+                cursor += 1
+            else:
+                replacement.append(text)
+        file_lines[pos:cursor] = replacement
+        delta += len(replacement) - (cursor - pos)
+        result = {"hunk": number, "status": "applied", "line": pos + 1}
+        if hunk.old_start is not None and pos != expected:
+            result["offset"] = pos - expected
+        if fuzz:
+            result["fuzz"] = fuzz
+        if loose:
+            result["ignored_whitespace"] = True
+        results.append(result)
+    new_content = "\n".join(file_lines)
+    if trailing_newline and file_lines:
+        new_content += "\n"
+    return new_content, results
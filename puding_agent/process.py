@@ -0,0 +1,146 @@
+"""
+Subprocess execution with streamed, bounded output capture.
+"""
+import os
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from typing import Optional, Dict, Any, Callable, List, Union
+
+from .config import COMMAND_OUTPUT_HEAD_CHARS, COMMAND_OUTPUT_TAIL_CHARS
+
+# Seconds between the polite and the forced kill of a timed-out process group
+KILL_GRACE = 2.0
+
+OutputCallback = Callable[[str, str], None]  # (stream name, line)
+
+class OutputCapture:
+    """Head-plus-tail capture of a text stream in bounded memory.
+
+    The first head_chars characters are kept as they arrive; after that only
+    the most recent tail_chars characters are kept (in whole lines), and the
+    lines dropped in between are counted.
+    """
+
+    def __init__(self, head_chars: int = COMMAND_OUTPUT_HEAD_CHARS, tail_chars: int = COMMAND_OUTPUT_TAIL_CHARS):
+        self.head_chars = head_chars
+        self.tail_chars = tail_chars
+        self._head: List[str] = []
+        self._head_size = 0
+        self._tail: deque = deque()
+        self._tail_size = 0
+        self.dropped_lines = 0
+        self.dropped_chars = 0
+        self._lock = threading.Lock()
+
+    def write(self, text: str):
+        with self._lock:
+            if self._head_size < self.head_chars and not self._tail:
+                room = self.head_chars - self._head_size
+                self._head.append(text[:room])
+                self._head_size += min(len(text), room)
+                text = text[room:]
+                if not text:
+                    return
+            self._tail.append(text)
+            self._tail_size += len(text)
+            while self._tail_size > self.tail_chars and len(self._tail) > 1:
+                dropped = self._tail.popleft()
+                self._tail_size -= len(dropped)
+                self.dropped_lines += 1
+                self.dropped_chars += len(dropped)
+
+    @property
+    def truncated(self) -> bool:
+        return self.dropped_chars > 0
+
+    def getvalue(self) -> str:
+        with self._lock:
+            head = "".join(self._head)
+            tail = "".join(self._tail)
+            if not self.dropped_chars:
+                return head + tail
+            marker = f"\n... [{self.dropped_lines} lines, {self.dropped_chars} characters omitted] ...\n"
+            return head + marker + tail
+
+def _pump(pipe, name: str, capture: OutputCapture, on_output: Optional[OutputCallback]):
+    """Copy a pipe into capture line by line, forwarding each line as it arrives."""
+    try:
+        # Bounded readline, so a huge line without newlines cannot exhaust memory
+        for raw in iter(lambda: pipe.readline(8192), b""):
+            text = raw.decode("utf-8", errors="replace")
+            capture.write(text)
+            if on_output:
+                try:
+                    on_output(name, text.rstrip("\r\n"))
+                except Exception:
+                    pass
+    finally:
+        pipe.close()
+
+def kill_process_tree(proc: subprocess.Popen):
+    """Stop a process and everything it started (its process group / job tree)."""
+    # On POSIX the group can outlive its leader, so it is signalled even after the leader exited
+    if proc.poll() is not None and os.name == "nt":
+        return
+    try:
+        if os.name == "nt":
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(proc.pid)], capture_output=True)
+        else:
+            os.killpg(proc.pid, signal.SIGTERM)
+            try:
+                proc.wait(KILL_GRACE)
+            except subprocess.TimeoutExpired:
+                pass
+            os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError, OSError):
+        pass
+
+def popen_group(args: Union[str, List[str]], shell: bool, **kwargs) -> subprocess.Popen:
+    """Start a process in its own process group so it can be killed as a tree."""
+    if os.name == "nt":
+        kwargs.setdefault("creationflags", subprocess.CREATE_NEW_PROCESS_GROUP)
+    else:
+        kwargs.setdefault("start_new_session", True)
+    return subprocess.Popen(args, shell=shell, **kwargs)
+
+def run_streaming(args: Union[str, List[str]], shell: bool, timeout: float,
+                  on_output: Optional[OutputCallback] = None, cwd: Optional[str] = None,
+                  env: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Run a command, streaming stdout/stderr into bounded captures.
+
+    Returns {"stdout", "stderr", "returncode", "timed_out", "duration",
+    "truncated"}. On timeout the whole process group is killed and the
+    output captured so far is returned with returncode None.
+    """
+    start = time.time()
+    proc = popen_group(args, shell, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                       stderr=subprocess.PIPE, cwd=cwd, env=env)
+    captures = {"stdout": OutputCapture(), "stderr": OutputCapture()}
+    readers = [
+        threading.Thread(target=_pump, args=(proc.stdout, "stdout", captures["stdout"], on_output), daemon=True),
+        threading.Thread(target=_pump, args=(proc.stderr, "stderr", captures["stderr"], on_output), daemon=True),
+    ]
+    for reader in readers:
+        reader.start()
+    timed_out = False
+    try:
+        proc.wait(timeout)
+    except subprocess.TimeoutExpired:
+        timed_out = True
+        kill_process_tree(proc)
+        proc.wait()
+    # A background grandchild may still hold the pipes open; wait for it only briefly
+    drain_until = time.time() + KILL_GRACE
+    for reader in readers:
+        reader.join(max(0.0, drain_until - time.time()))
+    return {
+        "stdout": captures["stdout"].getvalue(),
+        "stderr": captures["stderr"].getvalue(),
+        "returncode": None if timed_out else proc.returncode,
+        "timed_out": timed_out,
+        "duration": round(time.time() - start, 3),
+        "truncated": any(c.truncated for c in captures.values()),
+    }
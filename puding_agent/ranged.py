@@ -0,0 +1,170 @@
+"""
+Ranged reads of files of any size through mmap and a lazily built line index.
+"""
+import mmap
+import os
+import re
+import threading
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+from .config import MAX_RANGE_READ_BYTES, MAX_RANGE_READ_LINES
+from .cache import cache_key
+
+# One index entry per this many lines; lines in between are found with a short scan
+INDEX_STRIDE = 256
+_STRIDE_RE = re.compile(rb"(?:[^\n]*\n){%d}" % INDEX_STRIDE)
+
+class LineIndex:
+    """Sparse line-start offsets of one file version, extended only as far as requested.
+
+    checkpoints[k] is the byte offset where line k * INDEX_STRIDE + 1 starts.
+    Checkpoints are found by a compiled regex running over the mmap, so
+    building the index never loops in Python per line, and only the pages up
+    to the last requested line are touched.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.checkpoints = array("Q", [0])
+        self.complete = size == 0
+        self.total_lines: Optional[int] = 0 if size == 0 else None
+        self._lock = threading.Lock()
+
+    def _extend(self, mm: mmap.mmap, line: int):
+        """Add checkpoints until line is covered or the end of the file is reached."""
+        # Also take the next checkpoint, which proves every line before it exists
+        needed = (line - 1) // INDEX_STRIDE + 1
+        if self.complete or len(self.checkpoints) > needed:
+            return
+        # Each stride is anchored at the previous checkpoint: an unanchored search
+        # would retry from every byte of a short tail, which is quadratic
+        match = _STRIDE_RE.match(mm, self.checkpoints[-1])
+        while match and match.end() < self.size:
+            self.checkpoints.append(match.end())
+            if len(self.checkpoints) > needed:
+                return
+            match = _STRIDE_RE.match(mm, match.end())
+        # Fewer than INDEX_STRIDE lines remain after the last checkpoint
+        self.complete = True
+        tail_start = self.checkpoints[-1]
+        tail_lines = mm[tail_start:self.size].count(b"\n")
+        if mm[self.size - 1:self.size] != b"\n":
+            tail_lines += 1
+        self.total_lines = (len(self.checkpoints) - 1) * INDEX_STRIDE + tail_lines
+
+    def line_start(self, mm: mmap.mmap, line: int) -> Optional[int]:
+        """Byte offset where 1-based line starts, or None if the file has fewer lines."""
+        with self._lock:
+            self._extend(mm, line)
+            if self.total_lines is not None and line > self.total_lines:
+                return None
+            k = (line - 1) // INDEX_STRIDE
+            pos = self.checkpoints[k]
+        for _ in range((line - 1) % INDEX_STRIDE):
+            pos = mm.find(b"\n", pos) + 1
+        return pos
+
+_indexes: "OrderedDict[tuple, LineIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+MAX_INDEXED_FILES = 16
+
+def _line_index(path: Path, st: os.stat_result) -> LineIndex:
+    key = cache_key(str(path), st)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = LineIndex(st.st_size)
+            _indexes[key] = index
+            while len(_indexes) > MAX_INDEXED_FILES:
+                _indexes.popitem(last=False)
+        else:
+            _indexes.move_to_end(key)
+        return index
+
+def _decode(data: bytes) -> str:
+    return data.decode("utf-8", errors="replace")
+
+def read_range(path: Path, start_line: Optional[int] = None, end_line: Optional[int] = None,
+               start_byte: Optional[int] = None, end_byte: Optional[int] = None,
+               tail_lines: Optional[int] = None) -> Dict[str, Any]:
+    """Read a line range, byte range or the last lines of a file without loading all of it.
+
+    Only one mode is used: tail_lines, then a byte range, then a line range.
+    Output is capped at MAX_RANGE_READ_LINES lines and MAX_RANGE_READ_BYTES bytes;
+    "truncated" is set when a cap cut the requested range short, and a line
+    range cut by the byte cap ends at the last whole line returned.
+    """
+    st = path.stat()
+    result: Dict[str, Any] = {"success": True, "file_path": str(path), "file_size": st.st_size, "truncated": False}
+    if st.st_size == 0:
+        result.update({"content": "", "start_line": 1, "end_line": 0, "total_lines": 0})
+        return result
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if tail_lines is not None:
+            wanted = max(1, min(int(tail_lines), MAX_RANGE_READ_LINES))
+            # Walk back from the end; a trailing newline does not start another line
+            end = st.st_size
+            pos = end - 1 if mm[end - 1:end] == b"\n" else end
+            count = 0
+            while count < wanted:
+                nl = mm.rfind(b"\n", 0, pos)
+                count += 1
+                if nl == -1:
+                    pos = -1
+                    break
+                pos = nl
+            start = pos + 1
+            if end - start > MAX_RANGE_READ_BYTES:
+                start = end - MAX_RANGE_READ_BYTES
+                result["truncated"] = True
+            result.update({"content": _decode(mm[start:end]), "start_byte": start, "end_byte": end})
+            return result
+
+        if start_byte is not None or end_byte is not None:
+            start = max(0, int(start_byte or 0))
+            end = st.st_size if end_byte is None else min(int(end_byte), st.st_size)
+            if end - start > MAX_RANGE_READ_BYTES:
+                end = start + MAX_RANGE_READ_BYTES
+                result["truncated"] = True
+            result.update({"content": _decode(mm[start:max(start, end)]), "start_byte": start, "end_byte": max(start, end)})
+            return result
+
+        first = max(1, int(start_line or 1))
+        last = first + MAX_RANGE_READ_LINES - 1 if end_line is None else max(first, int(end_line))
+        if last - first + 1 > MAX_RANGE_READ_LINES:
+            last = first + MAX_RANGE_READ_LINES - 1
+            result["truncated"] = True
+
+        index = _line_index(path, st)
+        start = index.line_start(mm, first)
+        if start is None:
+            return {"error": f"Line {first} is past the end of '{path}' ({index.total_lines} lines)"}
+        end = index.line_start(mm, last + 1)
+        if end is None:
+            end = st.st_size
+            last = index.total_lines
+        elif end_line is None:
+            # The default window stopped before the end of the file
+            result["truncated"] = True
+        if end - start > MAX_RANGE_READ_BYTES:
+            # Cut at the last whole line within the cap and report the line it ends on
+            end = start + MAX_RANGE_READ_BYTES
+            nl = mm.rfind(b"\n", start, end)
+            if nl == -1:
+                last = first
+                result["line_truncated"] = f"Line {first} was cut to its first {MAX_RANGE_READ_BYTES} bytes"
+            else:
+                end = nl + 1
+                last = first + mm[start:end].count(b"\n") - 1
+            result["truncated"] = True
+        content = _decode(mm[start:end])
+        if content.endswith("\n"):
+            content = content[:-1]
+        result.update({"content": content, "start_line": first, "end_line": last})
+        if index.total_lines is not None:
+            result["total_lines"] = index.total_lines
+        return result
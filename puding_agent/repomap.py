@@ -0,0 +1,143 @@
+"""
+Compact, ranked repository map: the tree with sizes and per-file outlines within a token budget.
+"""
+import posixpath
+import threading
+from pathlib import Path
+from typing import Dict, Any, List, Tuple
+
+from .config import REPO_MAP_TOKENS, CHARS_PER_TOKEN
+from .impgraph import module_names, resolve_import
+from .symbols import get_symbol_index, PYTHON_SUFFIXES
+from .utils import walk_files
+
+# Files a reader looks at first, ranked above anything the import graph says
+ENTRY_POINTS = {"readme.md", "readme.rst", "readme.txt", "readme", "pyproject.toml", "setup.py",
+                "setup.cfg", "package.json", "main.py", "__main__.py", "app.py", "cli.py"}
+
+def _human_size(size: int) -> str:
+    if size < 1024:
+        return f"{size} B"
+    if size < 1024 * 1024:
+        return f"{size / 1024:.1f} KB"
+    return f"{size / (1024 * 1024):.1f} MB"
+
+def _ancestors(directory: str) -> List[str]:
+    """"a/b/c" -> ["a", "a/b", "a/b/c"]; "" -> []."""
+    parts = directory.split("/") if directory else []
+    return ["/".join(parts[:i + 1]) for i in range(len(parts))]
+
+class RepoMap:
+    """Ranked map of one directory, rendered within a token budget.
+
+    Files are ranked by how many other files in the map import them (entry
+    points such as README or setup.py first). In rank order each file gets
+    its full outline if it fits the remaining budget, else its top-level
+    definitions, else just a line with its size; once even that does not
+    fit, the rest are counted as omitted. Everything shown is printed in
+    tree order.
+    Outlines come from the symbol index, so only changed files are parsed
+    again, and the rendered map is reused while no file changed.
+    """
+
+    def __init__(self):
+        self._cache: Dict[Tuple[str, int], Tuple[tuple, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def build(self, root: Path, budget_tokens: int = REPO_MAP_TOKENS) -> Dict[str, Any]:
+        """Return {"content", "files", "outlined", "listed", "tokens"} for the map of root."""
+        root = root.resolve()
+        files = []
+        for path in walk_files(root):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            files.append((path.relative_to(root).as_posix(), st.st_size, st.st_mtime_ns))
+        fingerprint = tuple(files)
+        key = (str(root), budget_tokens)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] == fingerprint:
+                return cached[1]
+
+        index = get_symbol_index()
+        outlines: Dict[str, List] = {}
+        modules: Dict[str, str] = {}
+        for rel, _, _ in files:
+            if posixpath.splitext(rel)[1] in PYTHON_SUFFIXES:
+                try:
+                    outlines[rel] = index.file_symbols(root / rel).get("symbols", [])
+                except OSError:
+                    continue
+                for name in module_names(rel):
+                    # Shorter suffixes may be ambiguous; the first (shallowest) file wins
+                    modules.setdefault(name, rel)
+
+        in_degree = {rel: 0 for rel, _, _ in files}
+        for rel, symbols in outlines.items():
+            targets = {resolve_import(sym.name, rel, modules) for sym in symbols if sym.kind == "import"}
+            for target in targets - {None, rel}:
+                in_degree[target] += 1
+
+        def rank(item):
+            rel, size, _ = item
+            name = posixpath.basename(rel).lower()
+            return (name not in ENTRY_POINTS, -in_degree[rel], rel.count("/"), rel)
+
+        header = f"Repository map of {root} ({len(files)} files; outlines show 'start-end signature')"
+        budget = budget_tokens * CHARS_PER_TOKEN
+        used = len(header) + 100  # Header and the closing "files omitted" line
+        entries: Dict[str, List[str]] = {}
+        shown_dirs = set()
+        outlined = 0
+        for rel, size, _ in sorted(files, key=rank):
+            line = f"{posixpath.basename(rel)} ({_human_size(size)})"
+            if in_degree[rel]:
+                line += f" [imported by {in_degree[rel]}]"
+            symbols = [sym for sym in outlines.get(rel, ()) if sym.kind != "import"]
+            new_dirs = [d for d in _ancestors(posixpath.dirname(rel)) if d not in shown_dirs]
+            # Indentation costs about two characters per level, plus the newline
+            indent = 2 * rel.count("/") + 1
+            fixed = sum(len(d) + 2 for d in new_dirs) + len(line) + indent
+            # Full outline, then top-level definitions only, then just the file line
+            tiers = [symbols, [sym for sym in symbols if sym.depth == 0], []] if symbols else [[]]
+            for tier in tiers:
+                body = ["  " + "  " * sym.depth + sym.describe() for sym in tier]
+                cost = fixed + sum(len(b) + indent for b in body)
+                if used + cost <= budget:
+                    break
+            if used + cost > budget:
+                break
+            entries[rel] = [line] + body
+            outlined += bool(body)
+            used += cost
+            shown_dirs.update(new_dirs)
+
+        lines = [header]
+        printed = set()
+        for rel in sorted(entries):
+            directory = posixpath.dirname(rel)
+            for d in _ancestors(directory):
+                if d not in printed:
+                    printed.add(d)
+                    lines.append("  " * d.count("/") + posixpath.basename(d) + "/")
+            depth = directory.count("/") + 1 if directory else 0
+            lines.extend("  " * depth + text for text in entries[rel])
+        omitted = len(files) - len(entries)
+        if omitted:
+            lines.append(f"... {omitted} lower-ranked files omitted to fit the {budget_tokens}-token budget")
+        content = "\n".join(lines)
+        result = {
+            "content": content,
+            "files": len(files),
+            "outlined": outlined,
+            "listed": len(entries),
+            "tokens": len(content) // CHARS_PER_TOKEN,
+        }
+        with self._lock:
+            self._cache[key] = (fingerprint, result)
+        return result
+
+# Shared by the CLI and every web session in the process
+repo_map = RepoMap()
@@ -0,0 +1,344 @@
+"""
+Workspace code search backed by a persistent trigram index.
+"""
+import marshal
+import os
+import re
+import re._parser as sre_parse
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Set, Tuple, Iterator, Pattern
+
+from .config import (
+    STATE_DIR, MAX_FILE_SIZE, SEARCH_REFRESH_INTERVAL, SEARCH_MAX_RESULTS, SEARCH_SNIPPET_CHARS
+)
+from .cache import file_cache, cache_key
+from .ignore import get_matcher
+from .utils import walk_files, read_text_file
+
+INDEX_VERSION = 2
+# File id of paths that were seen but not indexed (binary or too large)
+NOT_INDEXED = -1
+
+def trigrams(text: str) -> Set[str]:
+    """Lowercased 3-character substrings of text."""
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def regex_literals(pattern: str) -> List[str]:
+    """Literal runs every match of pattern must contain (conservative: may return none)."""
+    try:
+        parsed = sre_parse.parse(pattern)
+    except Exception:
+        return []
+    runs, current = [], []
+    for op, arg in parsed:
+        if op is sre_parse.LITERAL:
+            current.append(chr(arg))
+        else:
+            # Anything else (classes, repeats, groups, branches) ends the run
+            runs.append("".join(current))
+            current = []
+    runs.append("".join(current))
+    return [run for run in runs if len(run) >= 3]
+
+class TrigramIndex:
+    """Trigram -> file postings for one workspace, saved under .puding/search.
+
+    The saved index lives inside the workspace, so a cloned repository could
+    ship one: it is stored with marshal as plain dicts, tuples, ints and
+    bytes (never pickle, which runs code on load) and validated when read.
+
+    Postings hold file ids in increasing order, so intersections use binary
+    search. A changed file gets a new id and its old id is left dead in the
+    postings until compact() drops dead ids. The workspace is re-walked at
+    most every SEARCH_REFRESH_INTERVAL seconds and only files whose mtime or
+    size changed are re-read; files written through the tools are re-indexed
+    on the next search regardless, and mark_stale() (called after shell
+    commands) forces a walk on the next search. The index is saved after
+    walks that changed it, so a new process only re-reads files changed since.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.index_path = root / STATE_DIR / "search" / "trigrams.bin"
+        self.files: Dict[str, Tuple[int, int, int]] = {}  # rel path -> (mtime_ns, size, file id)
+        self.paths: Dict[int, str] = {}                   # live file id -> rel path
+        self.postings: Dict[str, array] = {}
+        self.next_id = 0
+        self.dead = 0
+        self._refreshed = float("-inf")  # Walk on first use
+        self._dirty: Set[str] = set()
+        self._unsaved = False
+        self._lock = threading.RLock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path, "rb") as f:
+                state = marshal.load(f)
+            if not isinstance(state, dict) or state.get("version") != INDEX_VERSION \
+                    or state.get("root") != str(self.root):
+                return
+            files = {}
+            for rel, entry in state["files"].items():
+                mtime, size, fid = entry
+                if not (isinstance(rel, str) and all(type(n) is int for n in entry)):
+                    raise ValueError("bad file entry")
+                files[rel] = (mtime, size, fid)
+            postings = {}
+            for gram, data in state["postings"].items():
+                if not (isinstance(gram, str) and isinstance(data, bytes)):
+                    raise ValueError("bad posting")
+                posting = array("i")
+                posting.frombytes(data)
+                postings[gram] = posting
+            next_id, dead = state["next_id"], state["dead"]
+            if type(next_id) is not int or type(dead) is not int:
+                raise ValueError("bad counters")
+        except (OSError, EOFError, ValueError, TypeError, KeyError, AttributeError):
+            return
+        self.files = files
+        self.postings = postings
+        self.next_id = next_id
+        self.dead = dead
+        self.paths = {fid: rel for rel, (_, _, fid) in self.files.items() if fid != NOT_INDEXED}
+
+    def save(self):
+        with self._lock:
+            state = {
+                "version": INDEX_VERSION,
+                "root": str(self.root),
+                "files": self.files,
+                "postings": {gram: posting.tobytes() for gram, posting in self.postings.items()},
+                "next_id": self.next_id,
+                "dead": self.dead,
+            }
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.index_path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp, "wb") as f:
+                marshal.dump(state, f)
+            os.replace(tmp, self.index_path)
+
+    def mark_dirty(self, rel: str):
+        with self._lock:
+            self._dirty.add(rel)
+
+    def mark_stale(self):
+        """Make the next refresh re-walk the workspace, e.g. after a shell command may have changed files."""
+        with self._lock:
+            self._refreshed = float("-inf")
+
+    def _remove(self, rel: str):
+        entry = self.files.pop(rel, None)
+        if entry is not None and entry[2] != NOT_INDEXED:
+            del self.paths[entry[2]]
+            self.dead += 1
+
+    def _index_file(self, rel: str, path: Path, st: os.stat_result):
+        self._remove(rel)
+        text = read_text_file(path, MAX_FILE_SIZE, st)
+        if "error" in text:
+            self.files[rel] = (st.st_mtime_ns, st.st_size, NOT_INDEXED)
+            return
+        fid = self.next_id
+        self.next_id += 1
+        self.files[rel] = (st.st_mtime_ns, st.st_size, fid)
+        self.paths[fid] = rel
+        for gram in trigrams(text["content"]):
+            posting = self.postings.get(gram)
+            if posting is None:
+                self.postings[gram] = array("i", [fid])
+            else:
+                posting.append(fid)
+
+    def _update(self, rel: str, path: Path, st: os.stat_result) -> bool:
+        entry = self.files.get(rel)
+        if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            return False
+        self._index_file(rel, path, st)
+        return True
+
+    def refresh(self, force: bool = False) -> bool:
+        """Bring the index up to date with the workspace; returns whether it changed."""
+        with self._lock:
+            changed = False
+            now = time.monotonic()
+            if force or now - self._refreshed >= SEARCH_REFRESH_INTERVAL:
+                seen = set()
+                for path in walk_files(self.root, matcher=get_matcher(self.root)):
+                    rel = path.relative_to(self.root).as_posix()
+                    seen.add(rel)
+                    try:
+                        changed |= self._update(rel, path, path.stat())
+                    except OSError:
+                        seen.discard(rel)
+                for rel in set(self.files) - seen:
+                    self._remove(rel)
+                    changed = True
+                self._refreshed = now
+                save = changed or self._unsaved
+                self._unsaved = False
+            else:
+                matcher = get_matcher(self.root)
+                for rel in self._dirty:
+                    path = self.root / rel
+                    try:
+                        st = path.stat()
+                    except OSError:
+                        st = None
+                    if st is None or matcher.excluded(path, is_dir=False):
+                        if rel in self.files:
+                            self._remove(rel)
+                            changed = True
+                    else:
+                        changed |= self._update(rel, path, st)
+                # Saved with the next full walk; mtimes catch the change if we exit first
+                self._unsaved |= changed
+                save = False
+            self._dirty.clear()
+            if self.dead > max(1000, len(self.paths)):
+                self.compact()
+            if save:
+                self.save()
+            return changed
+
+    def compact(self):
+        """Drop ids of removed or re-indexed files from the postings."""
+        with self._lock:
+            live = self.paths
+            for gram in list(self.postings):
+                kept = array("i", (fid for fid in self.postings[gram] if fid in live))
+                if kept:
+                    self.postings[gram] = kept
+                else:
+                    del self.postings[gram]
+            self.dead = 0
+
+    def candidates(self, literals: List[str]) -> Iterator[str]:
+        """Yield paths of files containing every trigram of every literal, in file id order.
+
+        Lazy, so a search that reaches its result cap stops intersecting early.
+        With no usable trigrams every indexed file is a candidate.
+        """
+        grams = set()
+        for literal in literals:
+            grams |= trigrams(literal)
+        if not grams:
+            yield from sorted(self.paths.values())
+            return
+        postings = []
+        for gram in grams:
+            posting = self.postings.get(gram)
+            if posting is None:
+                return
+            postings.append(posting)
+        postings.sort(key=len)
+        rest = postings[1:]
+        for fid in postings[0]:
+            rel = self.paths.get(fid)
+            if rel is None:
+                continue
+            if all((i := bisect_left(p, fid)) < len(p) and p[i] == fid for p in rest):
+                yield rel
+
+    def search(self, query: str, regex: bool = False, case_sensitive: bool = False,
+               max_results: int = SEARCH_MAX_RESULTS) -> Dict[str, Any]:
+        """Return path:line: snippet matches of a literal or regex query."""
+        try:
+            pattern = re.compile(query if regex else re.escape(query), 0 if case_sensitive else re.IGNORECASE)
+        except re.error as e:
+            return {"error": f"Invalid regular expression '{query}': {e}"}
+        matches = []
+        files_matched = files_searched = 0
+        truncated = False
+        with self._lock:
+            self.refresh()
+            for rel in self.candidates(regex_literals(query) if regex else [query]):
+                files_searched += 1
+                if self._collect(rel, pattern, matches, max_results):
+                    files_matched += 1
+                if len(matches) >= max_results:
+                    truncated = True
+                    break
+        return {
+            "success": True,
+            "query": query,
+            "matches": matches,
+            "count": len(matches),
+            "files_matched": files_matched,
+            "files_searched": files_searched,
+            "truncated": truncated,
+        }
+
+    def _collect(self, rel: str, pattern: Pattern, matches: List[str], max_results: int) -> bool:
+        """Append path:line: snippet for each matching line of one file; returns whether any matched."""
+        content = self._read(rel)
+        if content is None:
+            return False
+        found = False
+        last_line = 0
+        line_no, line_pos = 1, 0
+        for m in pattern.finditer(content):
+            if m.start() == m.end():
+                continue
+            line_no += content.count("\n", line_pos, m.start())
+            line_pos = content.rfind("\n", 0, m.start()) + 1
+            if line_no == last_line:
+                continue
+            last_line = line_no
+            end = content.find("\n", m.start())
+            line = content[line_pos:end if end != -1 else len(content)].strip()
+            matches.append(f"{rel}:{line_no}: {line[:SEARCH_SNIPPET_CHARS]}")
+            found = True
+            if len(matches) >= max_results:
+                break
+        return found
+
+    def _read(self, rel: str) -> Optional[str]:
+        path = self.root / rel
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        key = cache_key(str(path), st)
+        cached = file_cache.get(key)
+        if cached is None:
+            text = read_text_file(path, MAX_FILE_SIZE, st)
+            if "error" in text:
+                return None
+            cached = (text["content"], text["encoding"])
+            file_cache.put(key, cached, st.st_size)
+        return cached[0]
+
+_indexes: Dict[Path, TrigramIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_search_index() -> TrigramIndex:
+    """Search index of the current workspace (the working directory)."""
+    root = Path.cwd().resolve()
+    with _indexes_lock:
+        if root not in _indexes:
+            _indexes[root] = TrigramIndex(root)
+        return _indexes[root]
+
+def notify_file_changed(path: Path):
+    """Mark a file written by the tools for re-indexing in any loaded index that covers it."""
+    with _indexes_lock:
+        indexes = list(_indexes.values())
+    for index in indexes:
+        try:
+            rel = path.relative_to(index.root).as_posix()
+        except ValueError:
+            continue
+        index.mark_dirty(rel)
+
+def notify_workspace_changed():
+    """Have every loaded index re-walk its workspace on next use (files may have changed outside the tools)."""
+    with _indexes_lock:
+        indexes = list(_indexes.values())
+    for index in indexes:
+        index.mark_stale()
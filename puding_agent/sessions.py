@@ -0,0 +1,60 @@
+"""
+Session management for serving several conversations from one process.
+"""
+import itertools
+import threading
+from typing import Dict, List, Optional
+
+from .agent import GeminiEngineer
+from .utils import ConversationMessage
+
+DEFAULT_SESSION = "default"
+
+class Session:
+    """One conversation: its own engine state, guarded by its own lock."""
+
+    def __init__(self, session_id: str, engine: GeminiEngineer, name: str = ""):
+        self.id = session_id
+        self.name = name
+        self.engine = engine
+        # Held for anything that mutates the conversation (a turn, /add, clear)
+        self.lock = threading.RLock()
+
+    def messages(self) -> List[ConversationMessage]:
+        """Snapshot of the conversation, safe to read while a turn is running."""
+        return list(self.engine.conversation_history)
+
+    def clear(self):
+        """Reset the conversation to just the system prompt."""
+        with self.lock:
+            self.engine.conversation_history = [self.engine.conversation_history[0]]
+
+class SessionManager:
+    """Thread-safe registry of sessions that share one set of LLM clients."""
+
+    def __init__(self, base: GeminiEngineer):
+        self.base = base
+        self._sessions: Dict[str, Session] = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.create(session_id=DEFAULT_SESSION)
+
+    def create(self, name: str = "", session_id: Optional[str] = None) -> Session:
+        """Create a session with a fresh conversation and the shared clients."""
+        engine = GeminiEngineer(shared=self.base)
+        with self._lock:
+            if session_id is None:
+                session_id = f"s{next(self._ids)}"
+                while session_id in self._sessions:
+                    session_id = f"s{next(self._ids)}"
+            session = Session(session_id, engine, name)
+            self._sessions[session_id] = session
+        return session
+
+    def get(self, session_id: Optional[str]) -> Optional[Session]:
+        with self._lock:
+            return self._sessions.get(session_id or DEFAULT_SESSION)
+
+    def list(self) -> List[Session]:
+        with self._lock:
+            return list(self._sessions.values())
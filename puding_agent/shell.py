@@ -0,0 +1,212 @@
+"""
+Persistent shell session that keeps cwd and environment across run_command calls.
+"""
+import atexit
+import base64
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+import weakref
+from typing import Optional, Dict, Any
+
+from .process import OutputCapture, OutputCallback, kill_process_tree, popen_group
+
+# Shells still running at interpreter exit are killed with their children
+_live_shells: "weakref.WeakSet[PersistentShell]" = weakref.WeakSet()
+
+def _shell_args():
+    if os.name == "nt":
+        return ["powershell.exe", "-NoProfile", "-NoLogo", "-ExecutionPolicy", "Bypass", "-Command", "-"]
+    bash = shutil.which("bash")
+    return [bash, "--noprofile", "--norc"] if bash else ["/bin/sh"]
+
+def _posix_script(command: str, marker: str) -> str:
+    # The command goes through a quoted heredoc, so no quoting is needed and a
+    # syntax error in it fails the eval instead of the shell; stdin is closed
+    # so the command cannot read the scripts of later commands
+    return (
+        f"eval \"$(cat <<'{marker}CMD'\n{command}\n{marker}CMD\n)\" < /dev/null\n"
+        f"__puding_rc=$?\n"
+        f"printf '%s %s %s\\n' '{marker}' \"$__puding_rc\" \"$PWD\"\n"
+        f"printf '%s\\n' '{marker}' >&2\n"
+    )
+
+def _powershell_script(command: str, marker: str) -> str:
+    encoded = base64.b64encode(command.encode("utf-8")).decode("ascii")
+    return (
+        "$global:LASTEXITCODE = 0; $__puding_ok = $true; "
+        f"try {{ Invoke-Expression ([Text.Encoding]::UTF8.GetString([Convert]::FromBase64String('{encoded}'))) "
+        "| Out-String -Stream | ForEach-Object { [Console]::Out.WriteLine($_) }; $__puding_ok = $? } "
+        "catch { [Console]::Error.WriteLine($_); $__puding_ok = $false }; "
+        "$__puding_rc = if ($LASTEXITCODE) { $LASTEXITCODE } elseif ($__puding_ok) { 0 } else { 1 }; "
+        f"[Console]::Out.WriteLine(\"{marker} $__puding_rc $PWD\"); [Console]::Error.WriteLine(\"{marker}\")\n"
+    )
+
+class PersistentShell:
+    """One long-lived shell process that runs commands one at a time.
+
+    Each command is written to the shell's stdin followed by sentinel lines
+    (a fresh random marker per command) on stdout and stderr; its output is
+    everything up to the sentinels, and the stdout sentinel carries the exit
+    code and the shell's working directory. cd, exported variables and
+    activated virtualenvs therefore carry over to the next command.
+
+    A command that times out has its shell killed with everything it
+    started; so does one that exits the shell. The next command starts a
+    fresh shell in the last known working directory (the environment is
+    lost) and its result says so.
+    """
+
+    def __init__(self, cwd: Optional[str] = None):
+        self.cwd = cwd or os.getcwd()
+        self.proc: Optional[subprocess.Popen] = None
+        self.starts = 0
+        self._lines: Optional[queue.Queue] = None
+        self._lock = threading.Lock()
+        _live_shells.add(self)
+
+    @property
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def _start(self):
+        cwd = self.cwd if os.path.isdir(self.cwd) else os.getcwd()
+        self.proc = popen_group(_shell_args(), False, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, cwd=cwd)
+        self._lines = queue.Queue()
+        for pipe, name in ((self.proc.stdout, "stdout"), (self.proc.stderr, "stderr")):
+            threading.Thread(target=self._read, args=(pipe, name, self._lines), daemon=True).start()
+        self.starts += 1
+
+    @staticmethod
+    def _read(pipe, name: str, lines: queue.Queue):
+        try:
+            for raw in iter(lambda: pipe.readline(8192), b""):
+                lines.put((name, raw.decode("utf-8", errors="replace")))
+        except (OSError, ValueError):
+            pass
+        finally:
+            lines.put((name, None))
+
+    def close(self):
+        """Kill the shell and everything it started."""
+        with self._lock:
+            self._kill()
+
+    def _kill(self):
+        if self.proc is not None:
+            kill_process_tree(self.proc)
+            try:
+                self.proc.wait(5)
+            except subprocess.TimeoutExpired:
+                pass
+            for pipe in (self.proc.stdin, self.proc.stdout, self.proc.stderr):
+                try:
+                    pipe.close()
+                except OSError:
+                    pass
+            self.proc = None
+
+    def run(self, command: str, timeout: float, on_output: Optional[OutputCallback] = None) -> Dict[str, Any]:
+        """Run one command; returns the same fields as process.run_streaming plus "cwd".
+
+        "shell_restarted" is set when the shell had to be started again
+        (after a timeout or exit) and "shell_exited" when this command ended it.
+        """
+        with self._lock:
+            start = time.time()
+            restarted = False
+            if not self.alive:
+                self._kill()
+                restarted = self.starts > 0
+                self._start()
+            lines = self._lines
+            # Output of background jobs between commands belongs to no command
+            while not lines.empty():
+                lines.get_nowait()
+
+            marker = f"__PUDING_{uuid.uuid4().hex}__"
+            script = _powershell_script(command, marker) if os.name == "nt" else _posix_script(command, marker)
+            captures = {"stdout": OutputCapture(), "stderr": OutputCapture()}
+            returncode = None
+            timed_out = exited = False
+            try:
+                self.proc.stdin.write(script.encode("utf-8"))
+                self.proc.stdin.flush()
+            except OSError:
+                pass  # Already dead; the readers report end of file
+
+            done = set()
+            deadline = start + timeout
+            while len(done) < 2:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    timed_out = True
+                    break
+                try:
+                    stream, text = lines.get(timeout=min(remaining, 0.5))
+                except queue.Empty:
+                    if self.proc.poll() is not None:
+                        # Exited, with a background child still holding the pipes
+                        exited = True
+                        break
+                    continue
+                if text is None:
+                    # The shell closed a pipe: the command exited it
+                    done.add(stream)
+                    exited = True
+                    continue
+                position = text.find(marker)
+                if position >= 0:
+                    done.add(stream)
+                    if stream == "stdout":
+                        status = text[position + len(marker):].strip().split(" ", 1)
+                        returncode = int(status[0]) if status[0].lstrip("-").isdigit() else None
+                        if len(status) > 1:
+                            self.cwd = status[1]
+                    text = text[:position]
+                    if not text:
+                        continue
+                captures[stream].write(text)
+                if on_output:
+                    try:
+                        on_output(stream, text.rstrip("\r\n"))
+                    except Exception:
+                        pass
+
+            if timed_out or exited:
+                if exited and self.proc is not None:
+                    try:
+                        returncode = self.proc.wait(5)
+                    except subprocess.TimeoutExpired:
+                        pass
+                self._kill()
+                if timed_out:
+                    returncode = None
+
+            result = {
+                "stdout": captures["stdout"].getvalue(),
+                "stderr": captures["stderr"].getvalue(),
+                "returncode": returncode,
+                "timed_out": timed_out,
+                "duration": round(time.time() - start, 3),
+                "truncated": any(c.truncated for c in captures.values()),
+                "cwd": self.cwd,
+            }
+            if restarted:
+                result["shell_restarted"] = True
+            if exited:
+                result["shell_exited"] = True
+            return result
+
+@atexit.register
+def _close_all():
+    for shell in list(_live_shells):
+        try:
+            shell.close()
+        except Exception:
+            pass
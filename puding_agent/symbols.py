@@ -0,0 +1,338 @@
+"""
+Symbol index of Python sources (classes, functions, methods, imports) built with ast.
+"""
+import ast
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, astuple
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Set, Tuple
+
+from .config import STATE_DIR, MAX_FILE_SIZE, SEARCH_REFRESH_INTERVAL, SYMBOL_MAX_RESULTS
+from .ignore import get_matcher
+from .utils import walk_files, decode_text
+
+INDEX_VERSION = 2
+PYTHON_SUFFIXES = (".py", ".pyi")
+
+@dataclass
+class Symbol:
+    """A class, function, method or import with its line span (1-based, inclusive)."""
+    name: str                 # Qualified within the file, e.g. "Session.clear"
+    kind: str                 # class, function, method or import
+    line: int
+    end_line: int
+    signature: str            # e.g. "def clear(self) -> None", "from .utils import walk_files"
+    doc: str = ""             # First line of the docstring
+    depth: int = 0            # Nesting level, for outlines
+
+    def describe(self) -> str:
+        span = f"{self.line}-{self.end_line}" if self.end_line != self.line else str(self.line)
+        text = f"{span} {self.signature}"
+        return f"{text}  # {self.doc}" if self.doc else text
+
+def _signature(node: ast.AST) -> str:
+    decorators = "".join(f"@{ast.unparse(d)} " for d in node.decorator_list)
+    if isinstance(node, ast.ClassDef):
+        bases = [ast.unparse(b) for b in node.bases] + [ast.unparse(k) for k in node.keywords]
+        return decorators + (f"class {node.name}({', '.join(bases)})" if bases else f"class {node.name}")
+    prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+    returns = f" -> {ast.unparse(node.returns)}" if node.returns else ""
+    return f"{decorators}{prefix} {node.name}({ast.unparse(node.args)}){returns}"
+
+def _doc_line(node: ast.AST) -> str:
+    doc = ast.get_docstring(node, clean=True)
+    return doc.strip().splitlines()[0][:120] if doc and doc.strip() else ""
+
+def import_modules(node: ast.AST) -> List[str]:
+    """Modules named by an import statement, relative ones with their leading dots."""
+    if isinstance(node, ast.Import):
+        return [alias.name for alias in node.names]
+    base = "." * node.level + (node.module or "")
+    if node.module:
+        return [base]
+    # "from . import x" imports sibling modules
+    return [base + alias.name for alias in node.names]
+
+_SYMBOL_FIELD_TYPES = (str, str, int, int, str, str, int)
+
+def _symbol_from_fields(fields: List[Any]) -> Symbol:
+    """Symbol from the field list it was saved as; ValueError if the entry is malformed."""
+    if not isinstance(fields, list) or len(fields) != len(_SYMBOL_FIELD_TYPES) \
+            or not all(type(v) is t for v, t in zip(fields, _SYMBOL_FIELD_TYPES)):
+        raise ValueError("bad symbol entry")
+    return Symbol(*fields)
+
+def parse_symbols(source: str) -> List[Symbol]:
+    """Symbols of a Python module in source order. Nested functions are not listed."""
+    tree = ast.parse(source)
+    symbols: List[Symbol] = []
+
+    def visit(body, prefix: str, depth: int, in_class: bool):
+        for node in body:
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                for module in import_modules(node):
+                    symbols.append(Symbol(module, "import", node.lineno, node.end_lineno,
+                                          ast.unparse(node), depth=depth))
+            elif isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+                # The span starts at the first decorator
+                start = min([d.lineno for d in node.decorator_list] + [node.lineno])
+                is_class = isinstance(node, ast.ClassDef)
+                kind = "class" if is_class else ("method" if in_class else "function")
+                symbols.append(Symbol(prefix + node.name, kind, start, node.end_lineno,
+                                      _signature(node), _doc_line(node), depth))
+                if is_class:
+                    visit(node.body, f"{prefix}{node.name}.", depth + 1, True)
+            elif isinstance(node, (ast.If, ast.Try)):
+                # Definitions under "if TYPE_CHECKING:" or "try: import x" still count
+                visit(node.body, prefix, depth, in_class)
+                for handler in getattr(node, "handlers", []):
+                    visit(handler.body, prefix, depth, in_class)
+                visit(node.orelse, prefix, depth, in_class)
+
+    visit(tree.body, "", 0, False)
+    return symbols
+
+class SymbolIndex:
+    """Symbols of every Python file in a workspace, saved under .puding/symbols.
+
+    Parsed symbols are cached by content hash, so a file is parsed again only
+    when its bytes change, and identical files share one entry. Like the
+    search index, the workspace is re-walked at most every
+    SEARCH_REFRESH_INTERVAL seconds, only files with a new mtime or size are
+    hashed, files written through the tools are refreshed on next use, and
+    mark_stale() (called after shell commands) forces a walk on next use.
+    The saved index is JSON, with each Symbol as a list of its fields, since
+    the workspace (and so .puding) may come from an untrusted clone.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.index_path = root / STATE_DIR / "symbols" / "index.json"
+        self.files: Dict[str, Tuple[int, int, str]] = {}   # rel path -> (mtime_ns, size, digest)
+        self.by_digest: Dict[str, List[Symbol]] = {}
+        self.errors: Dict[str, str] = {}                    # digest -> syntax error
+        self._refreshed = float("-inf")  # Walk on first use
+        self._dirty: Set[str] = set()
+        self._unsaved = False
+        self._lock = threading.RLock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            if not isinstance(state, dict) or state.get("version") != INDEX_VERSION \
+                    or state.get("root") != str(self.root):
+                return
+            files = {}
+            for rel, (mtime, size, digest) in state["files"].items():
+                if type(mtime) is not int or type(size) is not int or not isinstance(digest, str):
+                    raise ValueError("bad file entry")
+                files[rel] = (mtime, size, digest)
+            by_digest = {}
+            for digest, symbols in state["by_digest"].items():
+                by_digest[digest] = [_symbol_from_fields(fields) for fields in symbols]
+            errors = {d: e for d, e in state["errors"].items() if isinstance(e, str)}
+        except (OSError, ValueError, TypeError, KeyError, AttributeError):
+            return
+        self.files = files
+        self.by_digest = by_digest
+        self.errors = errors
+
+    def save(self):
+        with self._lock:
+            live = {digest for _, _, digest in self.files.values()}
+            self.by_digest = {d: s for d, s in self.by_digest.items() if d in live}
+            self.errors = {d: e for d, e in self.errors.items() if d in live}
+            state = {
+                "version": INDEX_VERSION,
+                "root": str(self.root),
+                "files": self.files,
+                "by_digest": {d: [astuple(sym) for sym in symbols] for d, symbols in self.by_digest.items()},
+                "errors": self.errors,
+            }
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.index_path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(state, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp, self.index_path)
+
+    def mark_dirty(self, rel: str):
+        with self._lock:
+            self._dirty.add(rel)
+
+    def mark_stale(self):
+        """Make the next refresh re-walk the workspace, e.g. after a shell command may have changed files."""
+        with self._lock:
+            self._refreshed = float("-inf")
+
+    def _update(self, rel: str, path: Path, st: os.stat_result) -> bool:
+        """Refresh one file's entry if its mtime or size changed; returns whether it did."""
+        entry = self.files.get(rel)
+        if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            return False
+        if st.st_size > MAX_FILE_SIZE:
+            self.files.pop(rel, None)
+            return entry is not None
+        with open(path, "rb") as f:
+            digest = self._parse(f.read())
+        self.files[rel] = (st.st_mtime_ns, st.st_size, digest)
+        return entry is None or entry[2] != digest
+
+    def _parse(self, data: bytes) -> str:
+        """Parse file content into by_digest (once per distinct content); returns its digest."""
+        digest = hashlib.sha1(data).hexdigest()
+        if digest not in self.by_digest:
+            decoded = decode_text(data)
+            try:
+                self.by_digest[digest] = parse_symbols(decoded[0]) if decoded else []
+            except (SyntaxError, ValueError) as e:
+                self.by_digest[digest] = []
+                self.errors[digest] = str(e)
+        return digest
+
+    def refresh(self, force: bool = False) -> bool:
+        """Bring the index up to date with the workspace; returns whether it changed."""
+        with self._lock:
+            changed = False
+            save = False
+            now = time.monotonic()
+            if force or now - self._refreshed >= SEARCH_REFRESH_INTERVAL:
+                seen = set()
+                for path in walk_files(self.root, matcher=get_matcher(self.root)):
+                    if path.suffix not in PYTHON_SUFFIXES:
+                        continue
+                    rel = path.relative_to(self.root).as_posix()
+                    try:
+                        changed |= self._update(rel, path, path.stat())
+                        seen.add(rel)
+                    except OSError:
+                        pass
+                for rel in set(self.files) - seen:
+                    del self.files[rel]
+                    changed = True
+                self._refreshed = now
+                save = changed or self._unsaved
+                self._unsaved = False
+            else:
+                matcher = get_matcher(self.root)
+                for rel in self._dirty:
+                    path = self.root / rel
+                    if path.suffix not in PYTHON_SUFFIXES:
+                        continue
+                    try:
+                        st = path.stat()
+                    except OSError:
+                        st = None
+                    if st is None or matcher.excluded(path, is_dir=False):
+                        changed |= self.files.pop(rel, None) is not None
+                    else:
+                        changed |= self._update(rel, path, st)
+                self._unsaved |= changed
+            self._dirty.clear()
+            if save:
+                self.save()
+            return changed
+
+    def file_symbols(self, path: Path) -> Dict[str, Any]:
+        """Symbols of one file, refreshed from disk if it changed. Works outside the workspace too.
+
+        Only files refresh() would index get an entry in the index; others
+        (outside the root, excluded, not Python) are parsed without one, so
+        they never show up in find(), snapshot() or the saved index.
+        """
+        path = path.resolve()
+        st = path.stat()
+        try:
+            rel = path.relative_to(self.root).as_posix()
+        except ValueError:
+            rel = None
+        if rel is not None and (path.suffix not in PYTHON_SUFFIXES
+                                or get_matcher(self.root).excluded(path, is_dir=False)):
+            rel = None
+        with self._lock:
+            if rel is None:
+                if st.st_size > MAX_FILE_SIZE:
+                    return {"error": f"File '{path}' is too large to outline (max {MAX_FILE_SIZE} bytes)"}
+                # by_digest keeps it only until the next save prunes unreferenced digests
+                digest = self._parse(path.read_bytes())
+            else:
+                self._update(rel, path, st)
+                entry = self.files.get(rel)
+                if entry is None:
+                    return {"error": f"File '{path}' is too large to outline (max {MAX_FILE_SIZE} bytes)"}
+                digest = entry[2]
+            result = {"symbols": self.by_digest[digest]}
+            if digest in self.errors:
+                result["syntax_error"] = self.errors[digest]
+            return result
+
+    def snapshot(self) -> Dict[str, Tuple[str, List[Symbol]]]:
+        """Content digest and symbols of every indexed file, after a refresh."""
+        self.refresh()
+        with self._lock:
+            return {rel: (digest, self.by_digest.get(digest, [])) for rel, (_, _, digest) in self.files.items()}
+
+    def imports(self) -> Dict[str, List[str]]:
+        """Modules imported by each indexed file (relative ones keep their leading dots)."""
+        return {
+            rel: [sym.name for sym in symbols if sym.kind == "import"]
+            for rel, (_, symbols) in self.snapshot().items()
+        }
+
+    def find(self, name: str, kind: Optional[str] = None,
+             max_results: int = SYMBOL_MAX_RESULTS) -> Tuple[List[Tuple[str, Symbol]], bool]:
+        """Symbols whose qualified or short name equals name; if none, those containing it.
+
+        Returns (path, symbol) pairs and whether the matches are the fallback
+        substring matches.
+        """
+        self.refresh()
+        wanted = name.lower()
+        with self._lock:
+            files = sorted(self.files.items())
+            exact, partial = [], []
+            for rel, (_, _, digest) in files:
+                for sym in self.by_digest.get(digest, ()):
+                    if kind and sym.kind != kind:
+                        continue
+                    if sym.name == name or sym.name.rpartition(".")[2] == name:
+                        exact.append((rel, sym))
+                    elif len(partial) < max_results and wanted in sym.name.lower():
+                        partial.append((rel, sym))
+        if exact:
+            return exact[:max_results], False
+        return partial[:max_results], True
+
+_indexes: Dict[Path, SymbolIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_symbol_index() -> SymbolIndex:
+    """Symbol index of the current workspace (the working directory)."""
+    root = Path.cwd().resolve()
+    with _indexes_lock:
+        if root not in _indexes:
+            _indexes[root] = SymbolIndex(root)
+        return _indexes[root]
+
+def notify_file_changed(path: Path):
+    """Mark a file written by the tools for refreshing in any loaded index that covers it."""
+    with _indexes_lock:
+        indexes = list(_indexes.values())
+    for index in indexes:
+        try:
+            rel = path.relative_to(index.root).as_posix()
+        except ValueError:
+            continue
+        index.mark_dirty(rel)
+
+def notify_workspace_changed():
+    """Have every loaded index re-walk its workspace on next use (files may have changed outside the tools)."""
+    with _indexes_lock:
+        indexes = list(_indexes.values())
+    for index in indexes:
+        index.mark_stale()
@@ -0,0 +1,462 @@
+"""
+Warm pytest runner: a pre-forked interpreter with the project's imports loaded, one fork per test run.
+"""
+import atexit
+import heapq
+import json
+import os
+import queue
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Set, Tuple
+
+from .config import (STATE_DIR, TEST_PRELOAD_TIMEOUT, TEST_FAILURE_CHARS, TEST_MAX_FAILURES,
+                     TEST_OUTPUT_TAIL_CHARS, TEST_DEFAULT_SECONDS)
+from .process import kill_process_tree, popen_group, run_streaming
+from .symbols import get_symbol_index
+
+WORKER = str(Path(__file__).with_name("testworker.py"))
+CAN_FORK = hasattr(os, "fork") and os.name != "nt"
+
+PYTEST_EXIT_CODES = {0: "all tests passed", 1: "some tests failed", 2: "interrupted",
+                     3: "internal error", 4: "usage error", 5: "no tests collected"}
+
+def project_python(root: Path) -> str:
+    """The workspace's virtualenv interpreter if it has one, else the agent's own."""
+    for venv in (".venv", "venv", "env"):
+        for candidate in (root / venv / "bin" / "python", root / venv / "Scripts" / "python.exe"):
+            if candidate.is_file():
+                return str(candidate)
+    return sys.executable
+
+def is_test_file(rel: str) -> bool:
+    name = rel.rsplit("/", 1)[-1]
+    return name == "conftest.py" or name.startswith("test_") or name.endswith("_test.py")
+
+def preload_modules() -> List[str]:
+    """pytest plus every absolute module imported by the workspace's test files and conftests."""
+    modules = ["pytest"]
+    for rel, imported in sorted(get_symbol_index().imports().items()):
+        if is_test_file(rel):
+            modules.extend(name for name in imported if not name.startswith(".") and name not in modules)
+    return modules
+
+def summarize(raw: Dict[str, Any], log: str) -> Dict[str, Any]:
+    """Counts, failures and (only when pytest itself failed) the tail of its output."""
+    counts: Dict[str, int] = {}
+    for test in raw.get("tests", []):
+        counts[test["outcome"]] = counts.get(test["outcome"], 0) + 1
+    exit_code = raw.get("exit_code")
+    result: Dict[str, Any] = {
+        "success": exit_code == 0,
+        "exit_code": exit_code,
+        "status": PYTEST_EXIT_CODES.get(exit_code, "pytest did not finish"),
+        "passed": counts.get("passed", 0),
+        "failed": counts.get("failed", 0),
+        "errors": counts.get("error", 0) + len(raw.get("collect_errors", [])),
+        "skipped": counts.get("skipped", 0),
+    }
+    for outcome in ("xfailed", "xpassed"):
+        if counts.get(outcome):
+            result[outcome] = counts[outcome]
+    failures = [
+        {key: test[key] for key in ("nodeid", "outcome", "when", "message") if key in test}
+        for test in raw.get("tests", []) if test["outcome"] in ("failed", "error")
+    ]
+    if failures:
+        result["failures"] = failures[:TEST_MAX_FAILURES]
+        if len(failures) > TEST_MAX_FAILURES:
+            result["failures_omitted"] = len(failures) - TEST_MAX_FAILURES
+    if raw.get("collect_errors"):
+        result["collect_errors"] = raw["collect_errors"][:TEST_MAX_FAILURES]
+    slowest = sorted(raw.get("tests", []), key=lambda t: -t["duration"])[:5]
+    if slowest:
+        result["slowest"] = [{"nodeid": t["nodeid"], "duration": t["duration"]} for t in slowest]
+    if raw.get("error"):
+        result["error"] = f"pytest did not finish: {raw['error']}"
+    if raw.get("error") or (exit_code not in (0, 1) and not raw.get("collect_errors")):
+        result["output"] = log[-TEST_OUTPUT_TAIL_CHARS:]
+    return result
+
+def merge_exit_codes(codes: List[Optional[int]]) -> Optional[int]:
+    """pytest exit code of several shards run as one: the most serious code wins."""
+    if None in codes:
+        return None
+    ran = [code for code in codes if code != 5]  # A shard that collected nothing is not a failure
+    if not ran:
+        return 5
+    serious = [code for code in ran if code not in (0, 1)]
+    return max(serious) if serious else max(ran)
+
+def merge_results(raws: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine the raw worker results of several shards."""
+    seen = set()
+    collect_errors = []
+    for raw in raws:
+        for error in raw.get("collect_errors", []):
+            if error["nodeid"] not in seen:
+                seen.add(error["nodeid"])
+                collect_errors.append(error)
+    errors = [raw["error"] for raw in raws if raw.get("error")]
+    return {
+        "exit_code": merge_exit_codes([raw.get("exit_code") for raw in raws]),
+        "error": errors[0] if errors else None,
+        "tests": [test for raw in raws for test in raw.get("tests", [])],
+        "collect_errors": collect_errors,
+        "duration": max((raw.get("duration") or 0.0 for raw in raws), default=0.0),
+    }
+
+def merge_junit(reports: List[str], target: Path) -> bool:
+    """Merge shard JUnit XML reports into one <testsuites> file; returns whether any were read."""
+    merged = ET.Element("testsuites")
+    totals = {"tests": 0, "failures": 0, "errors": 0, "skipped": 0}
+    elapsed = 0.0
+    for report in reports:
+        try:
+            root = ET.parse(report).getroot()
+        except (OSError, ET.ParseError):
+            continue
+        for suite in ([root] if root.tag == "testsuite" else root.findall("testsuite")):
+            merged.append(suite)
+            for key in totals:
+                totals[key] += int(suite.get(key, 0) or 0)
+            elapsed += float(suite.get("time", 0) or 0)
+    if not len(merged):
+        return False
+    for key, value in totals.items():
+        merged.set(key, str(value))
+    merged.set("time", f"{elapsed:.3f}")
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_suffix(f".{os.getpid()}.tmp")
+    ET.ElementTree(merged).write(tmp, encoding="utf-8", xml_declaration=True)
+    os.replace(tmp, target)
+    return True
+
+class TestTimings:
+    """Seconds each test file took in its last run, saved under .puding/tests for shard planning."""
+
+    def __init__(self, root: Path):
+        self.path = root / STATE_DIR / "tests" / "timings.json"
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.seconds: Dict[str, float] = json.load(f)
+        except (OSError, ValueError):
+            self.seconds = {}
+        self._lock = threading.Lock()
+
+    def estimate(self, unit: str) -> float:
+        """Expected seconds for a test file (or a test id within one); unknown files get the median."""
+        with self._lock:
+            known = self.seconds.get(unit.split("::")[0])
+            if known is not None:
+                return known
+            values = sorted(self.seconds.values())
+        return values[len(values) // 2] if values else TEST_DEFAULT_SECONDS
+
+    def record(self, tests: List[Dict[str, Any]]):
+        per_file: Dict[str, float] = {}
+        for test in tests:
+            path = test["nodeid"].split("::")[0]
+            per_file[path] = per_file.get(path, 0.0) + test["duration"]
+        if not per_file:
+            return
+        with self._lock:
+            self.seconds.update({path: round(seconds, 4) for path, seconds in per_file.items()})
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(self.seconds, f, sort_keys=True)
+                os.replace(tmp, self.path)
+            except OSError:
+                pass
+
+def shard_units(args: List[str], root: Path) -> Tuple[List[str], List[str]]:
+    """Split pytest args into shardable units (test files and test ids) and the remaining options.
+
+    Directories, and no path at all, expand to the test files the symbol
+    index knows below them.
+    """
+    units, options, dirs = [], [], []
+    for arg in args:
+        path = Path(arg.split("::")[0])
+        if arg.startswith("-") or not path.exists():
+            options.append(arg)
+            continue
+        try:
+            rel = path.resolve().relative_to(root).as_posix()
+        except ValueError:
+            options.append(arg)
+            continue
+        if path.is_dir():
+            dirs.append("" if rel == "." else rel)
+        else:
+            units.append(rel + arg[len(arg.split("::")[0]):])
+    if dirs or not units:
+        for rel in sorted(get_symbol_index().imports()):
+            if is_test_file(rel) and rel.rsplit("/", 1)[-1] != "conftest.py" and (
+                    not dirs or any(not d or rel.startswith(d + "/") for d in dirs)):
+                units.append(rel)
+    return units, options
+
+def partition(units: List[str], shards: int, estimate) -> List[List[str]]:
+    """Longest-first greedy split of units into shards of about equal expected time."""
+    loads = [(0.0, i) for i in range(shards)]
+    groups: List[List[str]] = [[] for _ in range(shards)]
+    for unit in sorted(units, key=lambda u: (-estimate(u), u)):
+        load, i = heapq.heappop(loads)
+        groups[i].append(unit)
+        heapq.heappush(loads, (load + estimate(unit), i))
+    return [group for group in groups if group]
+
+class WarmTestRunner:
+    """pytest runs forked from a long-lived interpreter of one workspace.
+
+    The parent ("zygote") process imports pytest and everything the test
+    files import once; each run is a fork of it, so those imports cost
+    nothing after the first run and no run can leak state into the next.
+    Before running, the fork drops the project's own modules if any of them
+    changed since they were preloaded (files written through the tools are
+    reported to it, other edits are caught by mtime), so tests always see
+    the current code while third-party imports stay warm.
+
+    A run may be split into shards that are forked at the same time, one
+    pytest session each, with their results merged into one report.
+
+    Without fork (Windows) every run is a cold "python testworker.py --once"
+    subprocess per shard that returns the same structured results.
+    """
+
+    def __init__(self, root: Path, python: str):
+        self.root = root
+        self.python = python
+        self.proc: Optional[subprocess.Popen] = None
+        self.preloaded: Dict[str, Any] = {}
+        self._replies: Optional[queue.Queue] = None
+        self._changed: Set[str] = set()
+        self._changed_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self.timings = TestTimings(root)
+
+    def mark_changed(self, path: Path):
+        with self._changed_lock:
+            self._changed.add(str(path))
+
+    def _take_changed(self) -> List[str]:
+        with self._changed_lock:
+            changed = sorted(self._changed)
+            self._changed.clear()
+        return changed
+
+    def close(self):
+        with self._lock:
+            self._stop()
+
+    def _stop(self):
+        if self.proc is not None:
+            kill_process_tree(self.proc)
+            self.proc = None
+
+    @staticmethod
+    def _read(pipe, replies: queue.Queue):
+        for line in iter(pipe.readline, b""):
+            try:
+                replies.put(json.loads(line))
+            except ValueError:
+                pass  # Stray output of import-time code
+        replies.put(None)
+
+    def _reply(self, timeout: float) -> Optional[Dict[str, Any]]:
+        try:
+            return self._replies.get(timeout=max(0.0, timeout))
+        except queue.Empty:
+            return None
+
+    def _send(self, message: Dict[str, Any]):
+        self.proc.stdin.write((json.dumps(message) + "\n").encode("utf-8"))
+        self.proc.stdin.flush()
+
+    def _start(self):
+        self.proc = popen_group([self.python, WORKER, "--serve", str(self.root)], False,
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, cwd=str(self.root))
+        self._replies = queue.Queue()
+        threading.Thread(target=self._read, args=(self.proc.stdout, self._replies), daemon=True).start()
+        started = time.time()
+        self._send({"cmd": "preload", "modules": preload_modules()})
+        reply = self._reply(TEST_PRELOAD_TIMEOUT)
+        if not reply or not reply.get("ready"):
+            reason = "preloading timed out" if self.proc.poll() is None else f"exited with code {self.proc.returncode}"
+            self._stop()
+            raise RuntimeError(f"Warm test worker did not start with {self.python}: {reason}")
+        if "pytest" not in reply["preloaded"]:
+            self._stop()
+            raise RuntimeError(f"pytest is not installed for {self.python}")
+        self.preloaded = {"modules": len(reply["preloaded"]), "failed": reply["failed"],
+                          "seconds": round(time.time() - started, 3)}
+        # Everything changed so far is already loaded fresh
+        self._take_changed()
+
+    def run(self, args: List[str], timeout: float, restart: bool = False) -> Dict[str, Any]:
+        """Run pytest once with args; returns summarize()'s structured result."""
+        return self.run_shards([args], timeout, restart)
+
+    def run_shards(self, shards: List[List[str]], timeout: float, restart: bool = False,
+                   junit_path: Optional[Path] = None) -> Dict[str, Any]:
+        """Run one pytest process per argument list, all at once, and merge their results.
+
+        With junit_path, every shard writes a JUnit XML report and the
+        reports are merged into that file.
+        """
+        with self._lock:
+            with tempfile.TemporaryDirectory(prefix="puding-tests-") as tmp:
+                specs = []
+                for i, args in enumerate(shards):
+                    spec = {
+                        "args": list(args),
+                        "result": os.path.join(tmp, f"result-{i}.json"),
+                        "log": os.path.join(tmp, f"output-{i}.log"),
+                    }
+                    if junit_path is not None:
+                        spec["args"].append(f"--junitxml={os.path.join(tmp, f'junit-{i}.xml')}")
+                    specs.append(spec)
+                started = time.time()
+                if CAN_FORK:
+                    extra = self._run_forked(specs, timeout, restart)
+                else:
+                    extra = self._run_cold(specs, timeout)
+                failure = extra.pop("failure", "the test process died")
+                raws, logs = [], []
+                for i, spec in enumerate(specs):
+                    try:
+                        with open(spec["log"], encoding="utf-8", errors="replace") as f:
+                            log = f.read()
+                    except OSError:
+                        log = ""
+                    logs.append(f"[shard {i + 1}]\n{log}" if len(specs) > 1 else log)
+                    try:
+                        with open(spec["result"], encoding="utf-8") as f:
+                            raws.append(json.load(f))
+                    except (OSError, ValueError):
+                        raws.append({"exit_code": None, "error": failure, "tests": [], "duration": 0.0})
+                raw = merge_results(raws)
+                self.timings.record(raw["tests"])
+                result = summarize(raw, "\n".join(logs))
+                result.update(extra)
+                if len(specs) > 1:
+                    result["shards"] = [{"tests": len(r.get("tests", [])), "duration": r.get("duration")} for r in raws]
+                if junit_path is not None:
+                    reports = [os.path.join(tmp, f"junit-{i}.xml") for i in range(len(specs))]
+                    if merge_junit(reports, junit_path):
+                        result["junit_xml"] = str(junit_path)
+                result["duration"] = round(time.time() - started, 3)
+                return result
+
+    def _run_forked(self, specs: List[Dict[str, Any]], timeout: float, restart: bool) -> Dict[str, Any]:
+        extra: Dict[str, Any] = {}
+        if restart or self.proc is None or self.proc.poll() is not None:
+            self._stop()
+            self._start()
+            extra["worker_started"] = self.preloaded
+        request = {"cmd": "run", "shards": specs, "changed": self._take_changed(), "max_chars": TEST_FAILURE_CHARS}
+        deadline = time.time() + timeout
+        self._send(request)
+        reply = self._reply(deadline - time.time())
+        pids = reply.get("pids") if reply else None
+        reply = self._reply(deadline - time.time()) if pids else None
+        if reply is None:
+            # Timed out or the worker died: kill the runs' process groups, and the worker if it is stuck
+            for pid in pids or []:
+                try:
+                    os.killpg(pid, signal.SIGKILL)
+                except OSError:
+                    try:
+                        os.kill(pid, signal.SIGKILL)  # Killed before it started its own group
+                    except OSError:
+                        pass
+            reply = self._reply(5) if pids else None
+            if reply is None:
+                self._stop()
+            extra["failure"] = f"timed out after {timeout} seconds" if time.time() >= deadline else "the warm worker died"
+            extra["timed_out"] = time.time() >= deadline
+            return extra
+        extra["warm"] = "worker_started" not in extra
+        if reply.get("reloaded"):
+            extra["reloaded"] = reply["reloaded"]
+        return extra
+
+    def _run_cold(self, specs: List[Dict[str, Any]], timeout: float) -> Dict[str, Any]:
+        def run(spec):
+            request = {**spec, "max_chars": TEST_FAILURE_CHARS}
+            return run_streaming([self.python, WORKER, "--once", str(self.root), json.dumps(request)],
+                                 False, timeout, cwd=str(self.root))
+
+        with ThreadPoolExecutor(max_workers=len(specs)) as pool:
+            procs = list(pool.map(run, specs))
+        extra: Dict[str, Any] = {"warm": False}
+        if any(proc["timed_out"] for proc in procs):
+            extra["failure"] = f"timed out after {timeout} seconds"
+            extra["timed_out"] = True
+        else:
+            stderr = "".join(proc["stderr"] for proc in procs)
+            if stderr:
+                extra["failure"] = stderr[-TEST_OUTPUT_TAIL_CHARS:]
+        return extra
+
+    def run_parallel(self, args: List[str], workers: int, timeout: float, restart: bool = False) -> Dict[str, Any]:
+        """Split the test files named by args (or all of them) into balanced shards and run those at once."""
+        units, options = shard_units(args, self.root)
+        workers = max(1, min(workers, len(units)))
+        if workers == 1:
+            shards, plan = [args], None
+        else:
+            groups = partition(units, workers, self.timings.estimate)
+            # Shards would overwrite each other's last-failed cache
+            shards = [group + options + ["-p", "no:cacheprovider"] for group in groups]
+            plan = [round(sum(self.timings.estimate(u) for u in group), 2) for group in groups]
+        result = self.run_shards(shards, timeout, restart,
+                                 junit_path=self.root / STATE_DIR / "tests" / "junit.xml")
+        result["workers"] = len(shards)
+        if plan and "shards" in result:
+            for shard, expected in zip(result["shards"], plan):
+                shard["expected"] = expected
+        return result
+
+_runners: Dict[Tuple[Path, str], WarmTestRunner] = {}
+_runners_lock = threading.Lock()
+
+def get_test_runner(python: Optional[str] = None) -> WarmTestRunner:
+    """Warm runner of the current workspace for an interpreter (default: the workspace venv's)."""
+    root = Path.cwd().resolve()
+    python = python or project_python(root)
+    with _runners_lock:
+        key = (root, python)
+        if key not in _runners:
+            _runners[key] = WarmTestRunner(root, python)
+        return _runners[key]
+
+def notify_file_changed(path: Path):
+    """Tell loaded runners a file was written, so their next run imports it fresh."""
+    if path.suffix not in (".py", ".pyi"):
+        return
+    with _runners_lock:
+        runners = list(_runners.values())
+    for runner in runners:
+        runner.mark_changed(path)
+
+@atexit.register
+def _close_all():
+    with _runners_lock:
+        runners = list(_runners.values())
+    for runner in runners:
+        try:
+            runner.close()
+        except Exception:
+            pass
@@ -0,0 +1,192 @@
+"""
+Warm pytest worker, run as a script in the project's interpreter (it must not import puding_agent).
+
+    python testworker.py --serve ROOT       Preload modules, then fork one child per test run
+    python testworker.py --once ROOT JSON   Run one shard in this process (no fork available)
+
+Requests and replies are JSON lines on stdin/stdout:
+    {"cmd": "preload", "modules": [...]}                       -> {"ready": true, "preloaded": [...], "failed": [...]}
+    {"cmd": "run", "shards": [{"args": [...], "result": path, "log": path}, ...],
+     "changed": [paths], "max_chars": n}                       -> {"pids": [...]}, then {"statuses": [...], "reloaded": [...]}
+"""
+import json
+import os
+import sys
+import time
+
+ROOT = ""
+# Modules asked for by the last preload request
+_preload = []
+# Project modules (files under ROOT) imported while preloading, with the mtimes seen then
+_project_mtimes = {}
+
+def _module_file(module):
+    path = getattr(module, "__file__", None)
+    return os.path.abspath(path) if isinstance(path, str) else None
+
+def _project_modules():
+    prefix = ROOT.rstrip(os.sep) + os.sep
+    for name, module in list(sys.modules.items()):
+        path = _module_file(module)
+        if path and path.startswith(prefix) and os.sep + "site-packages" + os.sep not in path:
+            yield name, path
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+def preload(modules):
+    _preload[:] = modules
+    _project_mtimes.clear()
+    preloaded, failed = [], []
+    for name in modules:
+        try:
+            __import__(name)
+            preloaded.append(name)
+        except BaseException as e:  # SystemExit and friends from import-time code too
+            failed.append(f"{name}: {type(e).__name__}: {e}")
+    for name, path in _project_modules():
+        _project_mtimes[name] = _mtime(path)
+    return {"ready": True, "preloaded": preloaded, "failed": failed}
+
+def purge_changed(changed_paths):
+    """Drop project modules from sys.modules if any of them changed since preload.
+
+    Other project modules may hold names bound from a changed one
+    ("from .models import User"), so all project modules are dropped and
+    imported again; third-party modules stay loaded, which is the slow part.
+    """
+    changed = {os.path.abspath(p) for p in changed_paths}
+    modules = dict(_project_modules())
+    stale = sorted(name for name, path in modules.items()
+                   if path in changed or _mtime(path) != _project_mtimes.get(name))
+    if stale:
+        for name in modules:
+            sys.modules.pop(name, None)
+    return stale
+
+class ResultCollector:
+    """pytest plugin recording one outcome per test, with failure text for the ones that did not pass."""
+
+    def __init__(self, max_chars):
+        self.max_chars = max_chars
+        self.tests = {}
+        self.collect_errors = []
+
+    def _text(self, report):
+        text = str(report.longrepr) if report.longrepr else ""
+        return text if len(text) <= self.max_chars else "...\n" + text[-self.max_chars:]
+
+    def pytest_collectreport(self, report):
+        if report.failed:
+            self.collect_errors.append({"nodeid": report.nodeid, "message": self._text(report)})
+
+    def pytest_runtest_logreport(self, report):
+        entry = self.tests.setdefault(report.nodeid, {"nodeid": report.nodeid, "outcome": "passed", "duration": 0.0})
+        entry["duration"] = round(entry["duration"] + report.duration, 4)
+        if hasattr(report, "wasxfail"):
+            entry["outcome"] = "xfailed" if report.skipped else "xpassed"
+        elif report.failed:
+            entry["outcome"] = "failed" if report.when == "call" else "error"
+            entry["when"] = report.when
+            entry["message"] = self._text(report)
+        elif report.skipped and entry["outcome"] == "passed":
+            entry["outcome"] = "skipped"
+            if isinstance(report.longrepr, tuple) and len(report.longrepr) == 3:
+                entry["message"] = str(report.longrepr[2])
+
+def run_request(request):
+    """Run pytest for one shard, writing the collected results to request["result"]."""
+    started = time.time()
+    collector = ResultCollector(request.get("max_chars", 4000))
+    exit_code = None
+    error = None
+    try:
+        import pytest
+        exit_code = int(pytest.main(list(request.get("args") or []), plugins=[collector]))
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+    result = {
+        "exit_code": exit_code,
+        "error": error,
+        "tests": list(collector.tests.values()),
+        "collect_errors": collector.collect_errors,
+        "duration": round(time.time() - started, 3),
+    }
+    with open(request["result"], "w", encoding="utf-8") as f:
+        json.dump(result, f)
+
+def _redirect_output(log_path):
+    sys.stdout.flush()
+    sys.stderr.flush()
+    log = os.open(log_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.dup2(log, 1)
+    os.dup2(log, 2)
+    os.close(log)
+    os.close(devnull)
+
+def _reply(message):
+    sys.stdout.write(json.dumps(message) + "\n")
+    sys.stdout.flush()
+
+def serve():
+    for line in sys.stdin:
+        request = json.loads(line)
+        if request["cmd"] == "preload":
+            _reply(preload(request.get("modules") or []))
+        elif request["cmd"] == "run":
+            changed = request.get("changed") or []
+            reloaded_path = request["shards"][0]["result"] + ".reloaded"
+            pids = []
+            for i, shard in enumerate(request["shards"]):
+                shard = {**shard, "max_chars": request.get("max_chars", 4000)}
+                pid = os.fork()
+                if pid == 0:
+                    code = 1
+                    try:
+                        os.setsid()  # Its own process group, so a timeout kills the whole run
+                        _redirect_output(shard["log"])
+                        stale = purge_changed(changed)
+                        if i == 0:
+                            with open(reloaded_path, "w", encoding="utf-8") as f:
+                                json.dump(stale, f)
+                        run_request(shard)
+                        code = 0
+                    finally:
+                        os._exit(code)
+                pids.append(pid)
+            _reply({"pids": pids})
+            statuses = [os.waitpid(pid, 0)[1] for pid in pids]
+            reloaded = []
+            try:
+                with open(reloaded_path, encoding="utf-8") as f:
+                    reloaded = json.load(f)
+                os.unlink(reloaded_path)
+            except (OSError, ValueError):
+                pass
+            _reply({"statuses": statuses, "reloaded": reloaded})
+            if reloaded:
+                # Re-warm this process too, so the next fork starts from current code
+                for name in dict(_project_modules()):
+                    sys.modules.pop(name, None)
+                preload(list(_preload))
+
+def main():
+    global ROOT
+    ROOT = os.path.abspath(sys.argv[2])
+    os.chdir(ROOT)
+    # Like "python -m pytest", so tests can import the project from its root
+    sys.path.insert(0, ROOT)
+    if sys.argv[1] == "--serve":
+        serve()
+    else:
+        request = json.loads(sys.argv[3])
+        _redirect_output(request["log"])
+        run_request(request)
+
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,88 @@
-
 """
 File operation and system tools for PUding Agent.
 """
 import os
-import subprocess
+import shlex
+import stat
+import tempfile
 from pathlib import Path
-from typing import Dict, Any, List
-from .utils import normalize_path, is_text_file, should_exclude_file
-from .config import MAX_FILE_SIZE
+from collections.abc import Mapping
+from typing import Dict, Any, List, Tuple, Optional
+from .utils import normalize_path, read_text_file, should_exclude_file, decode_text, atomic_write_text, write_temp_sibling, encode_text
+from .config import MAX_FILE_SIZE, SEARCH_MAX_RESULTS, SYMBOL_MAX_RESULTS, COMMAND_TIMEOUT, MAX_COMMAND_TIMEOUT, TEST_WORKERS
+from .blobs import get_blob_store
+from .cache import file_cache, cache_key
+from .ignore import invalidate_matchers
+from .ranged import read_range
+from .writer import write_files
+from .process import run_streaming
+from .digest import digest_test_output, is_test_command, wants_junit, pytest_env
+from .testrunner import get_test_runner, notify_file_changed as tests_file_changed
+from .impgraph import get_import_graph
+from .patch import parse_unified_diff, apply_hunks, strip_prefix, DEV_NULL
+from .search import get_search_index, notify_file_changed as search_file_changed, notify_workspace_changed as search_workspace_changed
+from .symbols import (
+    get_symbol_index, notify_file_changed as symbols_file_changed,
+    notify_workspace_changed as symbols_workspace_changed, PYTHON_SUFFIXES
+)
+
+def _file_written(path: Path):
+    """Drop cached state derived from a file the tools just wrote."""
+    file_cache.invalidate(str(path))
+    search_file_changed(path)
+    symbols_file_changed(path)
+    tests_file_changed(path)
+    if path.name == ".gitignore":
+        invalidate_matchers()
 
 def read_local_file(file_path: str) -> Dict[str, Any]:
     """Read content of a single file."""
     try:
         path = normalize_path(file_path)
         
-        if not path.exists():
+        try:
+            st = path.stat()
+        except FileNotFoundError:
             return {"error": f"File '{file_path}' does not exist"}
         
-        if not path.is_file():
+        if not stat.S_ISREG(st.st_mode):
             return {"error": f"'{file_path}' is not a file"}
         
-        if path.stat().st_size > MAX_FILE_SIZE:
-            return {"error": f"File '{file_path}' is too large (max {MAX_FILE_SIZE} bytes)"}
-        
-        if not is_text_file(path):
-            return {"error": f"File '{file_path}' appears to be binary or non-textual"}
+        key = cache_key(str(path), st)
+        cached = file_cache.get(key)
+        if cached is None:
+            # One open: size check from the stat above, binary sniff and decode on one buffer
+            text = read_text_file(path, MAX_FILE_SIZE, st)
+            if text.get("error") == "too_large":
+                return {"error": f"File '{file_path}' is too large (max {MAX_FILE_SIZE} bytes); use read_file_range to read part of it"}
+            if text.get("error") == "binary":
+                return {"error": f"File '{file_path}' appears to be binary or non-textual"}
+            cached = (text["content"], text["encoding"])
+            file_cache.put(key, cached, st.st_size)
+        content, encoding = cached
         
-        with open(path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        return {
+        result = {
             "success": True,
             "file_path": str(path),
             "content": content,
             "size": len(content)
         }
+        if encoding != "utf-8":
+            result["encoding"] = encoding
+        return result
+    except Exception as e:
+        return {"error": f"Failed to read '{file_path}': {str(e)}"}
+
+def read_file_range(file_path: str, start_line: int = None, end_line: int = None,
+                    start_byte: int = None, end_byte: int = None, tail_lines: int = None) -> Dict[str, Any]:
+    """Read part of a file of any size: a line range, a byte range, or its last lines."""
+    try:
+        path = normalize_path(file_path)
+        if not path.exists():
+            return {"error": f"File '{file_path}' does not exist"}
+        if not path.is_file():
+            return {"error": f"'{file_path}' is not a file"}
+        return read_range(path, start_line, end_line, start_byte, end_byte, tail_lines)
     except Exception as e:
         return {"error": f"Failed to read '{file_path}': {str(e)}"}
 
@@ -61,8 +109,8 @@ def create_file(file_path: str, content: str) -> Dict[str, Any]:
     try:
         path = normalize_path(file_path)
         path.parent.mkdir(parents=True, exist_ok=True)
-        with open(path, 'w', encoding='utf-8') as f:
-            f.write(content)
+        atomic_write_text(path, content)
+        _file_written(path)
         
         return {
             "success": True,
@@ -73,21 +121,52 @@ def create_file(file_path: str, content: str) -> Dict[str, Any]:
     except Exception as e:
         return {"error": f"Failed to create '{file_path}': {str(e)}"}
 
-def create_multiple_files(files: List[Dict[str, str]]) -> Dict[str, Any]:
-    """Create multiple files."""
+def create_multiple_files(files: List[Dict[str, str]], fsync: bool = False, atomic: bool = False) -> Dict[str, Any]:
+    """Create multiple files.
+    
+    Files are written concurrently, each through a temp file and a rename,
+    with every directory created once (see writer.write_files). fsync makes
+    the whole batch durable before returning; atomic writes either every
+    file or none of them.
+    """
     results = {}
     errors = []
+    contents: Dict[Path, bytes] = {}
+    given: Dict[Path, Tuple[str, int]] = {}  # path -> (path as given, size)
+    cwd = Path.cwd().resolve()
     
     for file_info in files:
-        if "path" not in file_info or "content" not in file_info:
+        if not isinstance(file_info, Mapping) or "path" not in file_info or "content" not in file_info:
             errors.append("File info must contain 'path' and 'content' keys")
             continue
-        
-        result = create_file(file_info["path"], file_info["content"])
-        if "error" in result:
-            errors.append(f"'{file_info['path']}': {result['error']}")
-        else:
-            results[file_info["path"]] = result
+        try:
+            path = normalize_path(file_info["path"], cwd)
+            contents[path] = encode_text(file_info["content"])
+        except Exception as e:
+            errors.append(f"'{file_info['path']}': Failed to create '{file_info['path']}': {str(e)}")
+            continue
+        # A later entry for the same path wins, as with sequential writes
+        given[path] = (file_info["path"], len(file_info["content"]))
+    
+    if atomic and errors:
+        return {
+            "success": False,
+            "files": {},
+            "errors": errors + ["No files were written (atomic batch)"]
+        }
+    
+    for path, error in write_files(contents, fsync=fsync, all_or_nothing=atomic).items():
+        name, size = given[path]
+        if error:
+            errors.append(f"'{name}': Failed to create '{name}': {error}")
+            continue
+        _file_written(path)
+        results[name] = {
+            "success": True,
+            "file_path": str(path),
+            "size": size,
+            "message": f"File '{name}' created successfully"
+        }
     
     return {
         "success": len(errors) == 0,
@@ -103,20 +182,21 @@ def edit_file(file_path: str, original_snippet: str, new_snippet: str) -> Dict[s
         if not path.exists():
             return {"error": f"File '{file_path}' does not exist"}
         
-        # Read current content
-        with open(path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        # Read current content in whatever encoding read_file saw, and keep it
+        decoded, error = _read_for_edit(path)
+        if decoded is None:
+            return {"error": f"Cannot edit '{file_path}': {error}"}
+        content, encoding = decoded
         
-        if original_snippet not in content:
+        # One scan: locate the first occurrence and splice it out (only the first, for safety)
+        start = content.find(original_snippet)
+        if start == -1:
             return {"error": f"Original snippet not found in '{file_path}'"}
+        new_content = content[:start] + new_snippet + content[start + len(original_snippet):]
         
-        # Replace the snippet
-        # Use replace(..., 1) to replace only the first occurrence for safety
-        new_content = content.replace(original_snippet, new_snippet, 1) 
-        
-        # Write back to file
-        with open(path, 'w', encoding='utf-8') as f:
-            f.write(new_content)
+        # Write back through a temp file so the file is never left half-written
+        atomic_write_text(path, new_content, encoding)
+        _file_written(path)
         
         return {
             "success": True,
@@ -131,36 +211,319 @@ def edit_file(file_path: str, original_snippet: str, new_snippet: str) -> Dict[s
     except Exception as e:
         return {"error": f"Failed to edit '{file_path}': {str(e)}"}
 
-def run_command(command: str) -> Dict[str, Any]:
-    """Run a shell command."""
+def _apply_hunks(content: str, hunks: List[Tuple[int, str, str]]) -> Tuple[str, List[Dict[str, Any]]]:
+    """Apply (index, original, new) hunks to content in one pass.
+    
+    Every original snippet is located in the unmodified content; a hunk takes
+    the first occurrence not already claimed by an earlier hunk, so repeated
+    snippets map to successive occurrences. Returns the new content and one
+    failure entry per hunk that could not be placed.
+    """
+    spans = []
+    failures = []
+    for index, original, new in hunks:
+        if not original:
+            failures.append({"hunk": index, "error": "Original snippet is empty"})
+            continue
+        start = content.find(original)
+        while start != -1 and any(start < end and start + len(original) > begin for begin, end, _, _ in spans):
+            start = content.find(original, start + 1)
+        if start == -1:
+            failures.append({"hunk": index, "error": "Original snippet not found (or all occurrences already edited)"})
+            continue
+        spans.append((start, start + len(original), new, index))
+    
+    parts = []
+    pos = 0
+    for begin, end, new, _ in sorted(spans):
+        parts.append(content[pos:begin])
+        parts.append(new)
+        pos = end
+    parts.append(content[pos:])
+    return "".join(parts), failures
+
+def _replace_files(contents: Dict[Path, Tuple[str, str]], deletions: List[Path] = ()) -> Optional[str]:
+    """Write several files (path -> (content, encoding)) and delete others, all or none.
+    
+    Every body is staged in a temp file beside its target before any target
+    is touched; only then are the temps renamed over their targets and the
+    deletions made. Returns an error message if staging failed (nothing was
+    changed), otherwise None.
+    """
+    errors = write_files(
+        {path: encode_text(content, encoding) for path, (content, encoding) in contents.items()},
+        all_or_nothing=True
+    )
+    failed = next((error for error in errors.values() if error and not error.startswith("Not written")), None)
+    if failed:
+        return failed
+    for path in contents:
+        _file_written(path)
+    for path in deletions:
+        path.unlink(missing_ok=True)
+        _file_written(path)
+    return None
+
+def _read_for_edit(path: Path) -> Tuple[Optional[Tuple[str, str]], Optional[str]]:
+    """Read a text file to edit it: ((content, encoding), None) or (None, error)."""
+    try:
+        if path.stat().st_size > MAX_FILE_SIZE:
+            return None, f"File is too large (max {MAX_FILE_SIZE} bytes)"
+        # Any text file may be edited, whatever its extension; keep its encoding
+        decoded = decode_text(path.read_bytes())
+        if decoded is None:
+            return None, "File appears to be binary"
+        return decoded, None
+    except FileNotFoundError:
+        return None, "File does not exist"
+    except OSError as e:
+        return None, str(e)
+
+def edit_files(edits: List[Dict[str, str]]) -> Dict[str, Any]:
+    """Apply many snippet replacements across many files in one call, atomically.
+    
+    Hunks are grouped by file; each file is read once and all of its hunks
+    are applied in one pass against its current content. If any hunk fails,
+    nothing is written. Otherwise every new file body is staged in a temp
+    file first and then renamed over the original, so an error while writing
+    leaves each file either fully old or fully new.
+    """
+    by_file: Dict[Path, List[Tuple[int, str, str]]] = {}
+    failures = []
+    for index, edit in enumerate(edits):
+        if not isinstance(edit, Mapping) or "file_path" not in edit or "original_snippet" not in edit or "new_snippet" not in edit:
+            failures.append({"hunk": index, "error": "Edit must contain 'file_path', 'original_snippet' and 'new_snippet' keys"})
+            continue
+        try:
+            path = normalize_path(edit["file_path"])
+        except ValueError as e:
+            failures.append({"hunk": index, "file_path": edit["file_path"], "error": str(e)})
+            continue
+        by_file.setdefault(path, []).append((index, edit["original_snippet"], edit["new_snippet"]))
+    
+    staged = {}  # path -> (new content, encoding, hunk count, old length)
+    for path, hunks in by_file.items():
+        decoded, error = _read_for_edit(path)
+        if error:
+            failures.extend({"hunk": index, "file_path": str(path), "error": error} for index, _, _ in hunks)
+            continue
+        content, encoding = decoded
+        new_content, file_failures = _apply_hunks(content, hunks)
+        for failure in file_failures:
+            failure["file_path"] = str(path)
+        failures.extend(file_failures)
+        staged[path] = (new_content, encoding, len(hunks), len(content))
+    
+    if failures:
+        failures.sort(key=lambda f: f["hunk"])
+        return {
+            "error": f"{len(failures)} of {len(edits)} hunks could not be applied; no files were changed",
+            "failed_hunks": failures
+        }
+    
+    error = _replace_files({path: (new_content, encoding) for path, (new_content, encoding, _, _) in staged.items()})
+    if error:
+        return {"error": f"Failed to write edits: {error}; no files were changed"}
+    
+    return {
+        "success": True,
+        "files": {
+            str(path): {"hunks": count, "original_length": old_length, "new_length": len(new_content)}
+            for path, (new_content, _, count, old_length) in staged.items()
+        },
+        "hunks_applied": len(edits)
+    }
+
+def apply_patch(patch: str) -> Dict[str, Any]:
+    """Apply a unified diff (one or more files) with fuzzy context matching.
+    
+    Returns per-hunk results for every file. If any hunk fails, no file is
+    changed; otherwise all files are written together as in edit_files.
+    """
     try:
-        if os.name == 'nt':
-            result = subprocess.run(
-                ["powershell.exe", "-NoProfile", "-ExecutionPolicy", "Bypass", "-Command", command],
-                capture_output=True,
-                text=True,
-                timeout=120
-            )
+        patches = parse_unified_diff(patch)
+    except ValueError as e:
+        return {"error": f"Invalid patch: {str(e)}"}
+    if not patches:
+        return {"error": "No file changes found; expected a unified diff with '--- ' and '+++ ' headers"}
+    
+    files = {}
+    contents: Dict[Path, Tuple[str, str]] = {}
+    deletions = []
+    failed = False
+    for file_patch in patches:
+        try:
+            path = normalize_path(strip_prefix(file_patch.path))
+        except ValueError as e:
+            files[file_patch.path] = {"status": "failed", "error": str(e)}
+            failed = True
+            continue
+        creating = file_patch.old_path == DEV_NULL
+        deleting = file_patch.new_path == DEV_NULL
+        entry = files.setdefault(str(path), {"hunks": []})
+        if path in contents:
+            # A second section for the same file applies on top of the first
+            current, error = contents[path], None
+        elif creating:
+            current, error = ("", "utf-8"), ("File already exists" if path.exists() else None)
         else:
-            result = subprocess.run(
-                command,
-                shell=True,
-                capture_output=True,
-                text=True,
-                timeout=120
-            )
+            current, error = _read_for_edit(path)
+        if error:
+            entry.update({"status": "failed", "error": error})
+            failed = True
+            continue
+        new_content, results = apply_hunks(current[0], file_patch.hunks)
+        offset = len(entry["hunks"])
+        for result in results:
+            result["hunk"] += offset
+        entry["hunks"].extend(results)
+        if any(r["status"] == "failed" for r in results):
+            entry["status"] = "failed"
+            failed = True
+        elif deleting and new_content.strip():
+            entry.update({"status": "failed", "error": "File is not empty after applying a deletion"})
+            failed = True
+        else:
+            entry.setdefault("status", "deleted" if deleting else "created" if creating else "modified")
+        if deleting:
+            deletions.append(path)
+            contents.pop(path, None)
+        else:
+            contents[path] = (new_content, current[1])
+    
+    if failed:
+        return {"error": "Some hunks could not be applied; no files were changed", "files": files}
+    error = _replace_files(contents, deletions)
+    if error:
+        return {"error": f"Failed to write patched files: {error}; no files were changed", "files": files}
+    return {"success": True, "files": files}
+
+def run_command(command: str, timeout: Optional[int] = None, on_output=None, shell_session=None) -> Dict[str, Any]:
+    """Run a shell command, streaming its output.
+
+    stdout and stderr are read as they are produced into bounded head+tail
+    buffers, and each line is passed to on_output(stream, line) if given.
+    On timeout the command's whole process group is killed and the output
+    so far is returned with the error. With shell_session (a
+    PersistentShell) the command runs in that long-lived shell, so cd and
+    exported variables carry over between calls.
+    """
+    junit_path = None
+    try:
+        timeout = min(max(1, int(timeout or COMMAND_TIMEOUT)), MAX_COMMAND_TIMEOUT)
+        if shell_session is not None:
+            result = shell_session.run(command, timeout, on_output=on_output)
+        else:
+            if os.name == 'nt':
+                args, shell = ["powershell.exe", "-NoProfile", "-ExecutionPolicy", "Bypass", "-Command", command], False
+            else:
+                args, shell = command, True
+            env = None
+            if wants_junit(command):
+                fd, name = tempfile.mkstemp(prefix="puding-junit-", suffix=".xml")
+                os.close(fd)
+                junit_path = Path(name)
+                env = pytest_env(junit_path)
+            result = run_streaming(args, shell, timeout, on_output=on_output, env=env)
+        # The command may have created, edited or deleted files (formatters, git checkout, ...)
+        search_workspace_changed()
+        symbols_workspace_changed()
         
+        output = {
+            "stdout": result["stdout"],
+            "stderr": result["stderr"],
+        }
+        # A test run also gets a digest, which replaces the raw output in history;
+        # other commands (cat ci.log, grep FAILED ...) keep their output as is
+        if is_test_command(command):
+            digest = digest_test_output(result["stdout"], result["stderr"], junit_path)
+            if digest is not None:
+                output["test_digest"] = digest
+        if result["truncated"]:
+            output["output_truncated"] = True
+        for key in ("cwd", "shell_restarted", "shell_exited"):
+            if key in result:
+                output[key] = result[key]
+        if result["timed_out"]:
+            message = f"Command '{command}' timed out after {timeout} seconds"
+            if shell_session is not None:
+                message += "; the shell was killed and the next command starts a new one (environment reset)"
+            return {"error": message, "command": command, **output}
         return {
-            "success": result.returncode == 0,
+            "success": result["returncode"] == 0,
             "command": command,
-            "stdout": result.stdout,
-            "stderr": result.stderr,
-            "returncode": result.returncode
+            **output,
+            "returncode": result["returncode"],
+            "duration": result["duration"]
         }
-    except subprocess.TimeoutExpired:
-        return {"error": f"Command '{command}' timed out"}
     except Exception as e:
         return {"error": f"Failed to run command '{command}': {str(e)}"}
+    finally:
+        if junit_path is not None:
+            junit_path.unlink(missing_ok=True)
+
+def run_tests(args: Optional[List[str]] = None, timeout: Optional[int] = None,
+              python: Optional[str] = None, restart: bool = False) -> Dict[str, Any]:
+    """Run pytest through the workspace's warm test runner and return structured results."""
+    try:
+        timeout = min(max(1, int(timeout or COMMAND_TIMEOUT)), MAX_COMMAND_TIMEOUT)
+        if isinstance(args, str):
+            args = shlex.split(args)
+        if python:
+            # Any interpreter may be named, including ones outside the workspace
+            python = str(Path(python).expanduser().resolve())
+        return get_test_runner(python).run([str(a) for a in args or []], timeout, restart=bool(restart))
+    except Exception as e:
+        return {"error": f"Failed to run tests: {str(e)}"}
+
+def run_tests_parallel(args: Optional[List[str]] = None, workers: Optional[int] = None,
+                       timeout: Optional[int] = None, python: Optional[str] = None) -> Dict[str, Any]:
+    """Run pytest split into shards across CPU cores, balanced by remembered per-file timings."""
+    try:
+        timeout = min(max(1, int(timeout or COMMAND_TIMEOUT)), MAX_COMMAND_TIMEOUT)
+        if isinstance(args, str):
+            args = shlex.split(args)
+        if python:
+            python = str(Path(python).expanduser().resolve())
+        workers = int(workers or TEST_WORKERS or os.cpu_count() or 1)
+        return get_test_runner(python).run_parallel([str(a) for a in args or []], workers, timeout)
+    except Exception as e:
+        return {"error": f"Failed to run tests: {str(e)}"}
+
+def run_affected_tests(files: Optional[List[str]] = None, args: Optional[List[str]] = None,
+                       timeout: Optional[int] = None, changed_files: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Run only the test modules that are, or transitively import, the changed files.
+
+    files defaults to changed_files, which the engine fills with the files
+    written by tools during the current turn.
+    """
+    try:
+        targets = files or changed_files or []
+        if not targets:
+            return {"error": "No files were changed in this turn; pass files, or use run_tests for the whole suite"}
+        cwd = Path.cwd().resolve()
+        changed = []
+        for file_path in targets:
+            path = Path(file_path).resolve()
+            try:
+                changed.append(path.relative_to(cwd).as_posix())
+            except ValueError:
+                changed.append(str(path))
+        tests, unmapped = get_import_graph().affected_tests(changed)
+        selection = {"changed_files": changed, "selected_tests": tests}
+        if unmapped:
+            selection["unmapped_files"] = unmapped
+        if not tests:
+            message = "No test module imports the changed files"
+            if unmapped:
+                message += "; some changed files are not Python modules, so consider run_tests for the whole suite"
+            return {"success": True, "message": message, **selection}
+        if isinstance(args, str):
+            args = shlex.split(args)
+        result = run_tests(tests + [str(a) for a in args or []], timeout)
+        return {**result, **selection}
+    except Exception as e:
+        return {"error": f"Failed to run affected tests: {str(e)}"}
 
 def list_directory(dir_path: str = ".") -> Dict[str, Any]:
     """List contents of a directory."""
@@ -195,6 +558,61 @@ def list_directory(dir_path: str = ".") -> Dict[str, Any]:
     except Exception as e:
         return {"error": f"Failed to list directory '{dir_path}': {str(e)}"}
 
+def read_tool_output(handle: str, start_line: int = 1, end_line: int = None) -> Dict[str, Any]:
+    """Read a line range of a large tool result that was stored by handle."""
+    return get_blob_store().read_lines(handle, start_line, end_line)
+
+def search_code(query: str, regex: bool = False, case_sensitive: bool = False,
+                max_results: int = SEARCH_MAX_RESULTS) -> Dict[str, Any]:
+    """Search workspace files for a literal string or regex."""
+    try:
+        if not query:
+            return {"error": "Search query must not be empty"}
+        return get_search_index().search(query, regex=regex, case_sensitive=case_sensitive,
+                                         max_results=max(1, int(max_results)))
+    except Exception as e:
+        return {"error": f"Failed to search for '{query}': {str(e)}"}
+
+def find_symbol(name: str, kind: str = None, max_results: int = SYMBOL_MAX_RESULTS) -> Dict[str, Any]:
+    """Find where a class, function, method or import is defined in the workspace's Python files."""
+    try:
+        if not name:
+            return {"error": "Symbol name must not be empty"}
+        found, partial = get_symbol_index().find(name, kind=kind or None, max_results=max(1, int(max_results)))
+        result = {
+            "success": True,
+            "name": name,
+            "matches": [f"{rel}:{sym.describe()}" for rel, sym in found],
+            "count": len(found)
+        }
+        if partial:
+            result["note"] = "No exact match; showing symbols whose name contains the query"
+        return result
+    except Exception as e:
+        return {"error": f"Failed to find symbol '{name}': {str(e)}"}
+
+def outline_file(file_path: str) -> Dict[str, Any]:
+    """List the classes, functions, methods and imports of a Python file with their line spans."""
+    try:
+        path = normalize_path(file_path)
+        if not path.is_file():
+            return {"error": f"File '{file_path}' does not exist"}
+        if path.suffix not in PYTHON_SUFFIXES:
+            return {"error": f"outline_file only supports Python files, not '{file_path}'"}
+        symbols = get_symbol_index().file_symbols(path)
+        if "error" in symbols:
+            return symbols
+        result = {
+            "success": True,
+            "file_path": str(path),
+            "outline": [("    " * sym.depth) + sym.describe() for sym in symbols["symbols"]]
+        }
+        if "syntax_error" in symbols:
+            result["syntax_error"] = symbols["syntax_error"]
+        return result
+    except Exception as e:
+        return {"error": f"Failed to outline '{file_path}': {str(e)}"}
+
 # Tool definitions for Gemini function calling (function_declarations)
 TOOLS = [
     {
@@ -211,6 +629,40 @@ TOOLS = [
             "required": ["file_path"]
         }
     },
+    {
+        "name": "read_file_range",
+        "description": "Read part of a file of any size (e.g. large logs): a line range, a byte range, or the last lines. Use it for files too large for read_file",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "file_path": {
+                    "type": "string",
+                    "description": "Path to the file to read"
+                },
+                "start_line": {
+                    "type": "integer",
+                    "description": "First line to read, 1-based (default: 1)"
+                },
+                "end_line": {
+                    "type": "integer",
+                    "description": "Last line to read, inclusive"
+                },
+                "start_byte": {
+                    "type": "integer",
+                    "description": "Byte offset to start reading at (byte range mode)"
+                },
+                "end_byte": {
+                    "type": "integer",
+                    "description": "Byte offset to stop reading at, exclusive (byte range mode)"
+                },
+                "tail_lines": {
+                    "type": "integer",
+                    "description": "Read the last N lines of the file instead of a range"
+                }
+            },
+            "required": ["file_path"]
+        }
+    },
     {
         "name": "read_multiple_files",
         "description": "Read the contents of multiple files",
@@ -261,6 +713,14 @@ TOOLS = [
                         "required": ["path", "content"]
                     },
                     "description": "List of files to create, each with path and content"
+                },
+                "fsync": {
+                    "type": "boolean",
+                    "description": "Flush every file to disk before returning (default: false)"
+                },
+                "atomic": {
+                    "type": "boolean",
+                    "description": "Write all files or none of them if any fails (default: false)"
                 }
             },
             "required": ["files"]
@@ -288,6 +748,43 @@ TOOLS = [
             "required": ["file_path", "original_snippet", "new_snippet"]
         }
     },
+    {
+        "name": "edit_files",
+        "description": "Apply many snippet replacements across one or more files in a single call. Each original_snippet must match the file's current content exactly; if any hunk fails, no file is changed",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "edits": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "file_path": {"type": "string", "description": "Path to the file to edit"},
+                            "original_snippet": {"type": "string", "description": "Exact text to replace"},
+                            "new_snippet": {"type": "string", "description": "Text to replace it with"}
+                        },
+                        "required": ["file_path", "original_snippet", "new_snippet"]
+                    },
+                    "description": "Hunks to apply; several may target the same file"
+                }
+            },
+            "required": ["edits"]
+        }
+    },
+    {
+        "name": "apply_patch",
+        "description": "Apply a unified diff (as produced by 'diff -u' or 'git diff') to one or more files. Much cheaper than rewriting whole files. Context is matched fuzzily (line offsets, whitespace); if any hunk fails, no file is changed and per-hunk results explain which",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "patch": {
+                    "type": "string",
+                    "description": "Unified diff text with '--- path' / '+++ path' headers and '@@' hunks; use /dev/null to create or delete a file"
+                }
+            },
+            "required": ["patch"]
+        }
+    },
     {
         "name": "run_command",
         "description": "Run a shell command",
@@ -297,11 +794,90 @@ TOOLS = [
                 "command": {
                     "type": "string",
                     "description": "The shell command to run"
+                },
+                "timeout": {
+                    "type": "integer",
+                    "description": f"Seconds before the command and its child processes are killed (default {COMMAND_TIMEOUT}, max {MAX_COMMAND_TIMEOUT})"
                 }
             },
             "required": ["command"]
         }
     },
+    {
+        "name": "run_tests",
+        "description": "Run pytest in a warm interpreter (imports preloaded, one fork per run; modules edited since the last run are reloaded). Returns pass/fail/error/skip counts and each failure's test id and traceback",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "args": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "pytest arguments, e.g. [\"tests/test_api.py\", \"-k\", \"login\", \"-x\"] (default: the whole suite)"
+                },
+                "timeout": {
+                    "type": "integer",
+                    "description": f"Seconds before the run is killed (default {COMMAND_TIMEOUT}, max {MAX_COMMAND_TIMEOUT})"
+                },
+                "python": {
+                    "type": "string",
+                    "description": "Interpreter to run the tests with (default: the workspace's .venv/venv, else the agent's)"
+                },
+                "restart": {
+                    "type": "boolean",
+                    "description": "Start a fresh warm interpreter first, e.g. after installing dependencies"
+                }
+            }
+        }
+    },
+    {
+        "name": "run_tests_parallel",
+        "description": "Run a pytest suite split into shards that run at the same time (one per CPU core by default), balanced using each test file's time in earlier runs. Returns one merged report like run_tests, per-shard timings, and the path of a merged JUnit XML report",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "args": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "Test files or directories to split (default: every test file) plus pytest options given to each shard, e.g. [\"tests/\", \"-x\"]"
+                },
+                "workers": {
+                    "type": "integer",
+                    "description": "Most shards to run at once (default: the number of CPU cores)"
+                },
+                "timeout": {
+                    "type": "integer",
+                    "description": f"Seconds before every shard is killed (default {COMMAND_TIMEOUT}, max {MAX_COMMAND_TIMEOUT})"
+                },
+                "python": {
+                    "type": "string",
+                    "description": "Interpreter to run the tests with (default: the workspace's .venv/venv, else the agent's)"
+                }
+            }
+        }
+    },
+    {
+        "name": "run_affected_tests",
+        "description": "Run only the test modules affected by the files changed in this turn (test files that are, or transitively import, a changed file), in the warm test runner. Returns run_tests results plus the selected tests",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "files": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "Changed files to select tests for (default: the files written by tools in this turn)"
+                },
+                "args": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "Extra pytest arguments, e.g. [\"-x\"]"
+                },
+                "timeout": {
+                    "type": "integer",
+                    "description": f"Seconds before the run is killed (default {COMMAND_TIMEOUT}, max {MAX_COMMAND_TIMEOUT})"
+                }
+            }
+        }
+    },
     {
         "name": "list_directory",
         "description": "List the contents of a directory",
@@ -314,16 +890,111 @@ TOOLS = [
                 }
             }
         }
+    },
+    {
+        "name": "search_code",
+        "description": "Search the workspace (excluding ignored files) for a literal string or a regular expression. Returns 'path:line: snippet' matches",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "query": {
+                    "type": "string",
+                    "description": "Text or regular expression to search for"
+                },
+                "regex": {
+                    "type": "boolean",
+                    "description": "Treat query as a Python regular expression (default: false)"
+                },
+                "case_sensitive": {
+                    "type": "boolean",
+                    "description": "Match case exactly (default: false)"
+                },
+                "max_results": {
+                    "type": "integer",
+                    "description": f"Maximum number of matches to return (default: {SEARCH_MAX_RESULTS})"
+                }
+            },
+            "required": ["query"]
+        }
+    },
+    {
+        "name": "find_symbol",
+        "description": "Find where a Python class, function, method or import is defined. Returns 'path:start-end signature' matches; read just that span with read_file_range",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "name": {
+                    "type": "string",
+                    "description": "Symbol name, plain ('clear') or qualified ('Session.clear')"
+                },
+                "kind": {
+                    "type": "string",
+                    "enum": ["class", "function", "method", "import"],
+                    "description": "Only return symbols of this kind"
+                },
+                "max_results": {
+                    "type": "integer",
+                    "description": f"Maximum number of matches to return (default: {SYMBOL_MAX_RESULTS})"
+                }
+            },
+            "required": ["name"]
+        }
+    },
+    {
+        "name": "outline_file",
+        "description": "Outline a Python file: its imports, classes, functions and methods with signatures and line spans, without the bodies",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "file_path": {
+                    "type": "string",
+                    "description": "Path to the Python file"
+                }
+            },
+            "required": ["file_path"]
+        }
+    },
+    {
+        "name": "read_tool_output",
+        "description": "Read specific lines of a large tool result that was stored in full and replaced by a summary with a 'blob' handle",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "handle": {
+                    "type": "string",
+                    "description": "The 'blob' handle from the summarized tool result"
+                },
+                "start_line": {
+                    "type": "integer",
+                    "description": "First line to read, 1-based (default: 1)"
+                },
+                "end_line": {
+                    "type": "integer",
+                    "description": "Last line to read, inclusive (default: end of output)"
+                }
+            },
+            "required": ["handle"]
+        }
     }
 ]
 
 # Function mapping for tool execution
 TOOL_FUNCTIONS = {
     "read_file": read_local_file,
+    "read_file_range": read_file_range,
     "read_multiple_files": read_multiple_files,
     "create_file": create_file,
     "create_multiple_files": create_multiple_files,
     "edit_file": edit_file,
+    "edit_files": edit_files,
+    "apply_patch": apply_patch,
     "run_command": run_command,
-    "list_directory": list_directory
+    "run_tests": run_tests,
+    "run_affected_tests": run_affected_tests,
+    "run_tests_parallel": run_tests_parallel,
+    "list_directory": list_directory,
+    "search_code": search_code,
+    "find_symbol": find_symbol,
+    "outline_file": outline_file,
+    "read_tool_output": read_tool_output
 }
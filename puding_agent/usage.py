@@ -0,0 +1,165 @@
+"""
+Token and latency accounting for LLM calls.
+"""
+import threading
+import time
+from dataclasses import dataclass, field, asdict
+from typing import Optional, List, Any, Dict
+
+from .utils import ConversationMessage
+
+@dataclass
+class CallUsage:
+    """Usage reported for a single LLM request."""
+    iteration: int
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    latency: float = 0.0                  # Seconds from request to last chunk
+    first_token_latency: Optional[float] = None  # Seconds to first text delta (streaming only)
+    messages: int = 0                     # Messages sent in the prompt
+
+@dataclass
+class TurnUsage:
+    """All LLM calls made while answering one user message."""
+    index: int
+    started: float
+    latency: float = 0.0
+    calls: List[CallUsage] = field(default_factory=list)
+    # The turn's prompt tokens attributed to each message role, by their share
+    # of history content at the end of the turn
+    by_role: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def prompt_tokens(self) -> int:
+        return sum(c.prompt_tokens for c in self.calls)
+
+    @property
+    def completion_tokens(self) -> int:
+        return sum(c.completion_tokens for c in self.calls)
+
+    @property
+    def cached_tokens(self) -> int:
+        return sum(c.cached_tokens for c in self.calls)
+
+    @property
+    def peak_prompt_tokens(self) -> int:
+        return max((c.prompt_tokens for c in self.calls), default=0)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "index": self.index,
+            "started": self.started,
+            "latency": round(self.latency, 3),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "peak_prompt_tokens": self.peak_prompt_tokens,
+            "by_role": self.by_role,
+            "calls": [asdict(c) for c in self.calls],
+        }
+
+def message_role(msg: ConversationMessage) -> str:
+    """Role used for the usage breakdown; file content added via /add counts as 'context'."""
+    return "context" if msg.context_path else msg.role
+
+def role_breakdown(history: List[ConversationMessage], prompt_tokens: int) -> Dict[str, int]:
+    """Split a call's prompt tokens across message roles by their share of content size."""
+    chars: Dict[str, int] = {}
+    for msg in history:
+        role = message_role(msg)
+        chars[role] = chars.get(role, 0) + len(msg.content or "")
+    total = sum(chars.values())
+    if not total:
+        return {}
+    return {role: round(prompt_tokens * n / total) for role, n in chars.items()}
+
+def openai_usage(usage) -> Dict[str, int]:
+    """Extract token counts from an OpenAI-compatible usage object."""
+    if usage is None:
+        return {}
+    cached = 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    if details is not None:
+        cached = getattr(details, "cached_tokens", 0) or 0
+    # DeepSeek reports cache hits under its own field
+    cached = cached or getattr(usage, "prompt_cache_hit_tokens", 0) or 0
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+        "cached_tokens": cached,
+    }
+
+def gemini_usage(metadata) -> Dict[str, int]:
+    """Extract token counts from Gemini usage_metadata."""
+    if metadata is None:
+        return {}
+    return {
+        "prompt_tokens": getattr(metadata, "prompt_token_count", 0) or 0,
+        "completion_tokens": getattr(metadata, "candidates_token_count", 0) or 0,
+        "cached_tokens": getattr(metadata, "cached_content_token_count", 0) or 0,
+    }
+
+class UsageLedger:
+    """Per-session record of token usage and latency for every LLM call and turn."""
+
+    def __init__(self):
+        self.turns: List[TurnUsage] = []
+        self._lock = threading.Lock()
+
+    def start_turn(self) -> TurnUsage:
+        with self._lock:
+            turn = TurnUsage(index=len(self.turns) + 1, started=time.time())
+            self.turns.append(turn)
+            return turn
+
+    def end_turn(self, turn: TurnUsage, history: Optional[List[ConversationMessage]] = None):
+        """Close a turn; with history, split its prompt tokens across roles.
+
+        The breakdown walks the whole history, so it runs once per turn
+        rather than on every LLM call.
+        """
+        turn.latency = time.time() - turn.started
+        if history is not None:
+            turn.by_role = role_breakdown(history, turn.prompt_tokens)
+
+    def record_call(self, turn: TurnUsage, iteration: int, usage: Dict[str, Any],
+                    latency: float, history: List[ConversationMessage]) -> CallUsage:
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        call = CallUsage(
+            iteration=iteration,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=usage.get("completion_tokens", 0),
+            cached_tokens=usage.get("cached_tokens", 0),
+            latency=round(latency, 3),
+            first_token_latency=usage.get("first_token_latency"),
+            messages=len(history),
+        )
+        with self._lock:
+            turn.calls.append(call)
+        return call
+
+    def totals(self) -> Dict[str, Any]:
+        """Session totals across all turns."""
+        with self._lock:
+            turns = list(self.turns)
+        calls = [c for t in turns for c in t.calls]
+        by_role: Dict[str, int] = {}
+        for t in turns:
+            for role, n in t.by_role.items():
+                by_role[role] = by_role.get(role, 0) + n
+        return {
+            "turns": len(turns),
+            "calls": len(calls),
+            "prompt_tokens": sum(c.prompt_tokens for c in calls),
+            "completion_tokens": sum(c.completion_tokens for c in calls),
+            "cached_tokens": sum(c.cached_tokens for c in calls),
+            "latency": round(sum(c.latency for c in calls), 3),
+            "by_role": by_role,
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        """Totals plus the per-turn records, for /stats and /api/usage."""
+        with self._lock:
+            turns = [t.to_dict() for t in self.turns]
+        return {"totals": self.totals(), "turns": turns}
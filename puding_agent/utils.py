@@ -1,12 +1,16 @@
-
 """
 Utility functions for PUding Agent.
 """
-import mimetypes
+import os
+import codecs
+import stat
+import tempfile
+from itertools import islice
 from pathlib import Path
 from dataclasses import dataclass, field
-from typing import Optional, List, Any, Dict
-from .config import EXCLUDED_FILES, EXCLUDED_EXTENSIONS
+from typing import Optional, List, Any, Dict, Callable, Iterator, Tuple
+from .config import EXCLUDED_EXTENSIONS, BINARY_SNIFF_BYTES, FALLBACK_TEXT_ENCODINGS, FALLBACK_MIN_PRINTABLE_RATIO
+from .ignore import ExclusionMatcher, get_matcher
 
 @dataclass
 class ConversationMessage:
@@ -17,6 +21,8 @@ class ConversationMessage:
     tool_calls: Optional[List[Any]] = None  # List of tool calls from assistant
     tool_call_id: Optional[str] = None      # ID for tool response
     name: Optional[str] = None              # Name of the tool
+    # For file content added to context (/add)
+    context_path: Optional[str] = None      # Resolved path of the file the message carries
 
 def clean_json_string(json_str: str) -> str:
     """Clean and fix common JSON formatting errors from LLM output."""
@@ -47,10 +53,13 @@ def clean_json_string(json_str: str) -> str:
     
     return cleaned
 
-def normalize_path(file_path: str) -> Path:
-    """Normalize and validate file path to prevent directory traversal."""
+def normalize_path(file_path: str, cwd: Optional[Path] = None) -> Path:
+    """Normalize and validate file path to prevent directory traversal.
+    
+    Callers normalizing many paths can pass the resolved working directory.
+    """
     path = Path(file_path).resolve()
-    cwd = Path.cwd().resolve()
+    cwd = cwd or Path.cwd().resolve()
     
     # Ensure the path is within the current working directory
     try:
@@ -63,56 +72,176 @@ def normalize_path(file_path: str) -> Path:
     return path
 
 def should_exclude_file(file_path: Path) -> bool:
-    """Check if a file should be excluded from processing."""
-    # Check if file name is in excluded files
-    if file_path.name in EXCLUDED_FILES:
-        return True
-    
-    # Check if file extension is in excluded extensions
-    if file_path.suffix.lower() in EXCLUDED_EXTENSIONS:
-        return True
-    
-    # Check for compound extensions like .min.js, .chunk.css, etc.
-    filename_lower = file_path.name.lower()
-    for ext in EXCLUDED_EXTENSIONS:
-        if filename_lower.endswith(ext):
-            return True
-    
-    # Check if it's a hidden file (starts with .)
-    if file_path.name.startswith('.'):
-        return True
+    """Check if a file should be excluded from processing.
     
-    # Check if any parent directory is in excluded files
-    for parent in file_path.parents:
-        if parent.name in EXCLUDED_FILES:
-            return True
+    Uses the workspace's compiled ExclusionMatcher: the built-in excluded names
+    and extensions, hidden files, nested .gitignore rules, and parent
+    directories excluded by name or .gitignore.
+    """
+    return get_matcher().excluded(file_path)
+
+def walk_files(root: Path, on_excluded: Optional[Callable[[Path], None]] = None,
+               matcher: Optional[ExclusionMatcher] = None) -> Iterator[Path]:
+    """Yield files under root in sorted order, skipping excluded entries.
     
-    return False
+    Excluded directories are pruned before descending into them, so trees like
+    node_modules or .git are never listed. root itself was named explicitly
+    and is walked even if it would be excluded.
+    """
+    matcher = matcher or get_matcher()
+    explicit = Path(root).resolve()
+    for dirpath, dirnames, filenames in os.walk(root):
+        base = Path(dirpath)
+        kept = []
+        for name in sorted(dirnames):
+            if matcher.excluded(base / name, is_dir=True, explicit=explicit):
+                if on_excluded:
+                    on_excluded(base / name)
+            else:
+                kept.append(name)
+        dirnames[:] = kept
+        for name in sorted(filenames):
+            file_path = base / name
+            if matcher.excluded(file_path, is_dir=False, explicit=explicit):
+                if on_excluded:
+                    on_excluded(file_path)
+            else:
+                yield file_path
 
-def is_binary_file(file_path: Path) -> bool:
-    """Check if a file is binary."""
-    try:
-        with open(file_path, 'rb') as f:
-            chunk = f.read(1024)
-            return b'\0' in chunk
-    except Exception:
-        # If we can't read it, assume it's binary or inaccessible for safety
-        return True
-
-def is_text_file(file_path: Path) -> bool:
-    """Check if a file is a text file based on extension and content."""
-    # First check if it's in excluded extensions (early return for performance)
-    if file_path.suffix.lower() in EXCLUDED_EXTENSIONS:
-        return False
+_BOMS = [
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+def _mostly_printable(sample: str) -> bool:
+    """Whether control characters (C0 other than whitespace, DEL and C1) are rare in sample."""
+    control = sum(1 for c in sample if (c < " " and c not in "\t\n\r\f\v\b\x1b") or "\x7f" <= c <= "\x9f")
+    return control <= len(sample) * (1 - FALLBACK_MIN_PRINTABLE_RATIO)
+
+def decode_text(data: bytes) -> Optional[Tuple[str, str]]:
+    """Decode file bytes as text, returning (text, encoding), or None if they look binary.
     
-    # Common text file extensions
-    if file_path.suffix.lower() in ['.txt', '.py', '.js', '.ts', '.html', '.css', '.json', '.xml', '.yaml', '.yml', '.md', '.rst', '.sh', '.bat', '.gitignore', '.env', '.toml']:
-        return True
+    A BOM selects its encoding; otherwise NUL bytes near the start mean binary.
+    UTF-8 is tried first, then FALLBACK_TEXT_ENCODINGS, which are accepted only
+    if the result is mostly printable. Newlines are normalized
+    to "\n" as text-mode open() would.
+    """
+    text = encoding = None
+    for bom, bom_encoding in _BOMS:
+        if data.startswith(bom):
+            try:
+                text, encoding = data.decode(bom_encoding), bom_encoding
+            except UnicodeDecodeError:
+                return None
+            break
+    else:
+        if b"\0" in data[:BINARY_SNIFF_BYTES]:
+            return None
+        for candidate in ["utf-8", *FALLBACK_TEXT_ENCODINGS]:
+            try:
+                text, encoding = data.decode(candidate), candidate
+            except UnicodeDecodeError:
+                continue
+            if candidate == "utf-8" or _mostly_printable(text[:BINARY_SNIFF_BYTES]):
+                break
+        else:
+            return None
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text, encoding
+
+def read_text_file(file_path: Path, max_size: int, st: Optional[os.stat_result] = None) -> Dict[str, Any]:
+    """Read and decode a text file with a single open.
     
-    # Guess mimetype, if it's text, it's likely text
-    mime_type, _ = mimetypes.guess_type(str(file_path))
-    if mime_type and mime_type.startswith('text/'):
-        return True
+    The stat result (taken here if not given) serves both the size check and
+    the caller's metadata; binary detection runs on the same buffer that is
+    decoded. Returns {"content", "encoding"} or {"error": reason} where reason
+    is "too_large" or "binary".
+    """
+    # Excluded extensions are binary by definition; no need to open them
+    if file_path.suffix.lower() in EXCLUDED_EXTENSIONS:
+        return {"error": "binary"}
+    if st is None:
+        st = file_path.stat()
+    if st.st_size > max_size:
+        return {"error": "too_large"}
+    with open(file_path, "rb") as f:
+        # Read at most one byte past the limit in case the file grew since the stat
+        data = f.read(max_size + 1)
+    if len(data) > max_size:
+        return {"error": "too_large"}
+    decoded = decode_text(data)
+    if decoded is None:
+        return {"error": "binary"}
+    return {"content": decoded[0], "encoding": decoded[1]}
+
+# Permissions for new files, as open() would create them
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def encode_text(content: str, encoding: str = "utf-8") -> bytes:
+    """Encode text as a text-mode write would (platform newlines)."""
+    if os.linesep != "\n":
+        content = content.replace("\n", os.linesep)
+    return content.encode(encoding)
+
+def write_temp_sibling(path: Path, data: bytes, fsync: bool = False) -> Path:
+    """Write data to a new temp file in path's directory, ready to os.replace() over path.
     
-    # Fallback to binary check
-    return not is_binary_file(file_path)
+    The temp file is hidden (so it is never indexed or listed) and gets the
+    existing file's permissions, or the umask defaults for a new file.
+    """
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            mode = 0o666 & ~_UMASK
+        os.chmod(tmp, mode)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return Path(tmp)
+
+def atomic_write_text(path: Path, content: str, encoding: str = "utf-8", fsync: bool = False):
+    """Replace path's content in one step: readers see the old file or the new one, never a partial write."""
+    os.replace(write_temp_sibling(path, encode_text(content, encoding), fsync), path)
+
+class ProviderMessageStore:
+    """Append-only cache of conversation history in a provider's wire format.
+
+    Each history message is converted once; later syncs only convert the
+    messages appended since the previous sync. The cache is rebuilt from
+    scratch when the history list is replaced (cleared or session switched)
+    or shrinks, or after an explicit ``reset()``.
+    """
+
+    def __init__(self, convert: Callable[[ConversationMessage], Dict[str, Any]]):
+        self._convert = convert
+        self._source: Optional[List[ConversationMessage]] = None
+        self._synced = 0
+        self.messages: List[Dict[str, Any]] = []
+
+    def reset(self):
+        """Drop all cached messages; the next sync rebuilds them."""
+        self._source = None
+        self._synced = 0
+        self.messages = []
+
+    def sync(self, history: List[ConversationMessage]) -> List[Dict[str, Any]]:
+        """Bring the cache up to date with history and return provider messages."""
+        if history is not self._source or len(history) < self._synced:
+            self.reset()
+            self._source = history
+        for msg in islice(history, self._synced, None):
+            self.messages.append(self._convert(msg))
+        self._synced = len(history)
+        return self.messages
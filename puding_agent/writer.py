@@ -0,0 +1,82 @@
+"""
+Concurrent, crash-safe writing of many files at once.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional, Dict, List
+
+from .config import WRITE_WORKERS
+from .utils import write_temp_sibling
+
+def _fsync_dir(directory: Path):
+    """Persist a directory's entries (the renames into it). No-op where unsupported."""
+    if os.name == "nt":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def write_files(contents: Dict[Path, bytes], fsync: bool = False, all_or_nothing: bool = False,
+                workers: int = WRITE_WORKERS) -> Dict[Path, Optional[str]]:
+    """Write many files through temp files and renames; returns path -> error (None if written).
+
+    1. Every distinct parent directory is created once.
+    2. All bodies are written to hidden temp files beside their targets on a
+       thread pool (and fsynced there, when fsync is set).
+    3. Temps are renamed over their targets, so each file is either its old
+       version or its complete new one, never partial.
+    4. With fsync, each touched directory is fsynced once at the end, making
+       the renames durable too.
+
+    With all_or_nothing, any failure in steps 1-2 discards every temp file
+    and no target is touched.
+    """
+    errors: Dict[Path, Optional[str]] = {path: None for path in contents}
+    dir_errors: Dict[Path, str] = {}
+    for directory in sorted({path.parent for path in contents}):
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+            dir_errors[directory] = str(e)
+
+    def stage(path: Path):
+        if path.parent in dir_errors:
+            raise OSError(f"Cannot create directory '{path.parent}': {dir_errors[path.parent]}")
+        return write_temp_sibling(path, contents[path], fsync)
+
+    temps: Dict[Path, Path] = {}
+    paths: List[Path] = list(contents)
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(paths))), thread_name_prefix="puding-write") as pool:
+        futures = [(path, pool.submit(stage, path)) for path in paths] if paths else []
+        for path, future in futures:
+            try:
+                temps[path] = future.result()
+            except Exception as e:
+                errors[path] = str(e)
+
+    failed = [path for path, error in errors.items() if error]
+    if all_or_nothing and failed:
+        for tmp in temps.values():
+            tmp.unlink(missing_ok=True)
+        for path in paths:
+            errors[path] = errors[path] or "Not written: another file in the batch failed"
+        return errors
+
+    touched_dirs = set()
+    for path, tmp in temps.items():
+        try:
+            os.replace(tmp, path)
+            touched_dirs.add(path.parent)
+        except OSError as e:
+            tmp.unlink(missing_ok=True)
+            errors[path] = str(e)
+    if fsync:
+        for directory in touched_dirs:
+            try:
+                _fsync_dir(directory)
+            except OSError:
+                pass
+    return errors
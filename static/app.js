@@ -1,15 +1,26 @@
-const input=document.getElementById("input");const send=document.getElementById("send");const regen=document.getElementById("regen");const messages=document.getElementById("messages");const refresh=document.getElementById("refresh");const addPath=document.getElementById("addPath");const addBtn=document.getElementById("addBtn");const curPath=document.getElementById("curPath");const rootBtn=document.getElementById("rootBtn");const upBtn=document.getElementById("upBtn");const fileList=document.getElementById("fileList");const previewBox=document.getElementById("previewBox");const datasetSel=document.getElementById("datasetSel");const loadExample=document.getElementById("loadExample");const modelInfo=document.getElementById("modelInfo");const flagReflect=document.getElementById("flagReflect");const flagTools=document.getElementById("flagTools");const flagTests=document.getElementById("flagTests");const suggest=document.getElementById("suggest");const newSession=document.getElementById("newSession");const sessionList=document.getElementById("sessionList");const toggleBrowser=document.getElementById("toggleBrowser");const toggleConfig=document.getElementById("toggleConfig");
+const input=document.getElementById("input");const send=document.getElementById("send");const regen=document.getElementById("regen");const messages=document.getElementById("messages");const refresh=document.getElementById("refresh");const addPath=document.getElementById("addPath");const addBtn=document.getElementById("addBtn");const curPath=document.getElementById("curPath");const rootBtn=document.getElementById("rootBtn");const upBtn=document.getElementById("upBtn");const fileList=document.getElementById("fileList");const previewBox=document.getElementById("previewBox");const datasetSel=document.getElementById("datasetSel");const loadExample=document.getElementById("loadExample");const modelInfo=document.getElementById("modelInfo");const flagReflect=document.getElementById("flagReflect");const flagTools=document.getElementById("flagTools");const flagTests=document.getElementById("flagTests");const flagShell=document.getElementById("flagShell");const suggest=document.getElementById("suggest");const newSession=document.getElementById("newSession");const sessionList=document.getElementById("sessionList");const toggleBrowser=document.getElementById("toggleBrowser");const toggleConfig=document.getElementById("toggleConfig");
+let currentSession="default";
 function md(t){try{if(typeof marked!=="undefined"&&marked&&typeof marked.parse==="function"){return marked.parse(t||"")}}catch(_){}return t||""}
 function roleMeta(cls){return cls==="user"?{label:"U",bubble:"user"}:cls==="assistant"?{label:"A",bubble:"assistant"}:{label:"T",bubble:"assistant"}}
-function addMsg(text,cls){const row=document.createElement("div");row.className=`msgrow ${cls}`;const av=document.createElement("div");const meta=roleMeta(cls);av.className="avatar";av.textContent=meta.label;const bubble=document.createElement("div");bubble.className=`bubble ${meta.bubble}`;if(cls==="tool"){bubble.classList.add("tool")}const html=md(text||"");const safe=typeof DOMPurify!=="undefined"?DOMPurify.sanitize(html,{ADD_ATTR:['target']}):html;bubble.innerHTML=safe;row.appendChild(av);row.appendChild(bubble);messages.appendChild(row);messages.scrollTop=messages.scrollHeight;row.querySelectorAll("pre code").forEach(el=>{try{hljs.highlightElement(el)}catch(_){} })}
-async function loadHistory(){const r=await fetch("/api/history");const j=await r.json();messages.innerHTML="";(j.messages||[]).forEach(m=>{const role=m.role==="user"?"user":m.role==="assistant"?"assistant":"tool";addMsg(m.content,role)})}
-async function postText(t){addMsg(t,"user");send.disabled=true;try{const flags={reflect:!!(flagReflect&&flagReflect.checked),tools:!!(flagTools&&flagTools.checked),tests:!!(flagTests&&flagTests.checked)};const r=await fetch("/api/send",{method:"POST",headers:{"Content-Type":"application/json"},body:JSON.stringify({text:t,flags})});const j=await r.json();if(!r.ok||j.error){addMsg(`错误: ${j.error||"unknown"}`,"assistant");return}
+function addMsg(text,cls){const row=document.createElement("div");row.className=`msgrow ${cls}`;const av=document.createElement("div");const meta=roleMeta(cls);av.className="avatar";av.textContent=meta.label;const bubble=document.createElement("div");bubble.className=`bubble ${meta.bubble}`;if(cls==="tool"){bubble.classList.add("tool")}const html=md(text||"");const safe=typeof DOMPurify!=="undefined"?DOMPurify.sanitize(html,{ADD_ATTR:['target']}):html;bubble.innerHTML=safe;row.appendChild(av);row.appendChild(bubble);messages.appendChild(row);messages.scrollTop=messages.scrollHeight;row.querySelectorAll("pre code").forEach(el=>{try{hljs.highlightElement(el)}catch(_){} });return bubble}
+function setBubble(bubble,text){const html=md(text||"");bubble.innerHTML=typeof DOMPurify!=="undefined"?DOMPurify.sanitize(html,{ADD_ATTR:['target']}):html;bubble.querySelectorAll("pre code").forEach(el=>{try{hljs.highlightElement(el)}catch(_){} });messages.scrollTop=messages.scrollHeight}
+async function loadHistory(){const r=await fetch(`/api/history?session_id=${encodeURIComponent(currentSession)}`);const j=await r.json();if(flagShell&&j.flags){flagShell.checked=!!j.flags.shell}messages.innerHTML="";(j.messages||[]).forEach(m=>{const role=m.role==="user"?"user":m.role==="assistant"?"assistant":"tool";addMsg(m.content,role)})}
+function toolSummary(name,res){const ok=res&&res.success;let extra="";if(res&&res.message){extra=": "+res.message}else if(name==="run_command"){const err=(res&&res.stderr)||"";const code=(res&&typeof res.returncode!=="undefined")?` (code ${res.returncode})`:"";extra=err?": "+err.slice(0,400)+code:code}return `${name} 执行${ok?"成功":"失败"}${extra}`}
+function currentFlags(){return {reflect:!!(flagReflect&&flagReflect.checked),tools:!!(flagTools&&flagTools.checked),tests:!!(flagTests&&flagTests.checked),shell:!!(flagShell&&flagShell.checked)}}
+async function postTextBlocking(t){const r=await fetch("/api/send",{method:"POST",headers:{"Content-Type":"application/json"},body:JSON.stringify({text:t,flags:currentFlags(),session_id:currentSession})});const j=await r.json();if(!r.ok||j.error){addMsg(`错误: ${j.error||"unknown"}`,"assistant");return}
     if(!j.assistant_text && (!j.tools_executed || j.tools_executed.length === 0)){
         addMsg("(No response from AI - check logs)", "assistant");
     }
-    if(j.assistant_text){addMsg(j.assistant_text,"assistant")}if(Array.isArray(j.tools_executed)){for(const item of j.tools_executed){const name=item.name;const res=item.result;const ok=res&&res.success;let extra="";if(res&&res.message){extra=": "+res.message}else if(name==="run_command"){const err=(res&&res.stderr)||"";const code=(res&&typeof res.returncode!=="undefined")?` (code ${res.returncode})`:"";extra=err?": "+err.slice(0,400)+code:code}addMsg(`${name} 执行${ok?"成功":"失败"}${extra}`,"tool")}}}catch(e){addMsg(`异常: ${e}`,"assistant")}finally{send.disabled=false}}
-async function addContext(p){const r=await fetch("/api/add",{method:"POST",headers:{"Content-Type":"application/json"},body:JSON.stringify({path:p})});const j=await r.json();if(!r.ok){addMsg(`上下文添加失败: ${j.error||"unknown"}`,"assistant")}else{addMsg(`已加入上下文: ${p}`,"assistant")}}
-async function listPath(p){curPath.textContent=p;const r=await fetch(`/api/list?path=${encodeURIComponent(p)}`);const j=await r.json();fileList.innerHTML="";if(j.success===false){fileList.textContent=j.error||"无法列出目录";return}const items=j.items||[];items.forEach(it=>{const d=document.createElement("div");d.className="file";d.textContent=`${it.type==="directory"?"📁":"📄"} ${it.name}`;d.addEventListener("click",()=>{const next=p.endsWith("/")?p+it.name:p+"/"+it.name;if(it.type==="directory"){listPath(next)}else{readFile(next)}});const add=document.createElement("button");add.textContent="加入上下文";add.style.marginLeft="8px";add.addEventListener("click",ev=>{ev.stopPropagation();addContext(p.endsWith("/")?p+it.name:p+"/"+it.name)});d.appendChild(add);fileList.appendChild(d)})}
+    if(j.assistant_text){addMsg(j.assistant_text,"assistant")}if(Array.isArray(j.tools_executed)){for(const item of j.tools_executed){addMsg(toolSummary(item.name,item.result),"tool")}}}
+// 流式输出：通过 /api/stream (SSE) 实时显示文本与工具事件
+async function postText(t){addMsg(t,"user");send.disabled=true;try{const r=await fetch("/api/stream",{method:"POST",headers:{"Content-Type":"application/json"},body:JSON.stringify({text:t,flags:currentFlags(),session_id:currentSession})});if(!r.ok||!r.body){await postTextBlocking(t);return}
+    let bubble=null,text="",got=false,buf="",pending=false,live=null,liveText="";const reader=r.body.getReader();const dec=new TextDecoder();
+    const flush=()=>{pending=false;if(bubble){setBubble(bubble,text)}};
+    const onEvent=(ev,d)=>{if(ev==="text"){got=true;text+=d.delta||"";if(!bubble){bubble=addMsg("","assistant")}if(!pending){pending=true;requestAnimationFrame(flush)}}else if(ev==="loop"){if(d.iteration>1){bubble=null;text=""}}else if(ev==="tool_output"){if(!live){live=addMsg("","tool");live.appendChild(document.createElement("pre"));liveText=""}liveText=(liveText+d.line+"\n").slice(-4000);live.firstChild.textContent=liveText;messages.scrollTop=messages.scrollHeight}else if(ev==="tool_result"){got=true;if(live&&d.name==="run_command"){live.parentNode.remove();live=null}addMsg(toolSummary(d.name,d.result),"tool");bubble=null;text=""}else if(ev==="error"){addMsg(`错误: ${d.error||"unknown"}`,"assistant")}else if(ev==="done"){if(!got&&!d.assistant_text){addMsg("(No response from AI - check logs)","assistant")}else if(!got&&d.assistant_text){addMsg(d.assistant_text,"assistant")}}};
+    while(true){const {value,done}=await reader.read();if(done)break;buf+=dec.decode(value,{stream:true});let i;while((i=buf.indexOf("\n\n"))>=0){const frame=buf.slice(0,i);buf=buf.slice(i+2);let ev="message",data="";frame.split("\n").forEach(l=>{if(l.startsWith("event:")){ev=l.slice(6).trim()}else if(l.startsWith("data:")){data+=l.slice(5).trim()}});try{onEvent(ev,JSON.parse(data||"{}"))}catch(_){}}}
+    if(pending){flush()}}catch(e){addMsg(`异常: ${e}`,"assistant")}finally{send.disabled=false}}
+async function addContext(p,mode){const r=await fetch("/api/add",{method:"POST",headers:{"Content-Type":"application/json"},body:JSON.stringify({path:p,session_id:currentSession,mode:mode||"full"})});const j=await r.json();if(!r.ok){addMsg(`上下文添加失败: ${j.error||"unknown"}`,"assistant")}else if(mode==="map"){addMsg(`已加入目录地图: ${p}（${j.listed||0}/${j.files||0} 个文件，约 ${j.tokens||0} tokens）`,"assistant")}else{addMsg(`已加入上下文: ${p}`,"assistant")}}
+async function listPath(p){curPath.textContent=p;const r=await fetch(`/api/list?path=${encodeURIComponent(p)}`);const j=await r.json();fileList.innerHTML="";if(j.success===false){fileList.textContent=j.error||"无法列出目录";return}const items=j.items||[];items.forEach(it=>{const d=document.createElement("div");d.className="file";d.textContent=`${it.type==="directory"?"📁":"📄"} ${it.name}`;d.addEventListener("click",()=>{const next=p.endsWith("/")?p+it.name:p+"/"+it.name;if(it.type==="directory"){listPath(next)}else{readFile(next)}});const add=document.createElement("button");add.textContent="加入上下文";add.style.marginLeft="8px";add.addEventListener("click",ev=>{ev.stopPropagation();addContext(p.endsWith("/")?p+it.name:p+"/"+it.name)});d.appendChild(add);if(it.type==="directory"){const map=document.createElement("button");map.textContent="加入地图";map.style.marginLeft="8px";map.addEventListener("click",ev=>{ev.stopPropagation();addContext(p.endsWith("/")?p+it.name:p+"/"+it.name,"map")});d.appendChild(map)}fileList.appendChild(d)})}
 async function readFile(p){const r=await fetch(`/api/read?path=${encodeURIComponent(p)}`);const j=await r.json();if(j.success===false){previewBox.textContent=j.error||"读取失败";return}previewBox.textContent=j.content||""}
 input.addEventListener("keydown",e=>{if(e.key==="Enter"&&!e.shiftKey){e.preventDefault();if(!send.disabled){const t=input.value.trim();if(!t)return;input.value="";postText(t)}}});
 refresh.addEventListener("click",loadHistory);
@@ -26,9 +37,9 @@ regen.addEventListener("click",()=>{if(!lastUser)return;postText(lastUser)});
 suggest.innerHTML="";
 ["生成贪吃蛇游戏","分析 test_example.py 并生成单测","创建 Flask API 并写 README"].forEach(s=>{const c=document.createElement("div");c.className="chip";c.textContent=s;c.addEventListener("click",()=>{input.value=s});suggest.appendChild(c)})
 
-// 会话管理
-async function loadSessions(){const r=await fetch("/api/session/list");const j=await r.json();sessionList.innerHTML="";const cur=j.current;const items=j.items||[];items.forEach(it=>{const d=document.createElement("div");d.className="item";d.textContent=`${it.id} （${it.count}条）`;if(it.id===cur){d.classList.add("active")}d.addEventListener("click",()=>selectSession(it.id));sessionList.appendChild(d)});}
-async function selectSession(id){try{const r=await fetch("/api/session/select",{method:"POST",headers:{"Content-Type":"application/json"},body:JSON.stringify({id})});const j=await r.json();if(!r.ok){return}await loadSessions();await loadHistory()}catch(_){/* ignore */}}
+// 会话管理（当前会话保存在页面中，每个请求都携带 session_id）
+async function loadSessions(){const r=await fetch("/api/session/list");const j=await r.json();sessionList.innerHTML="";const cur=currentSession;const items=j.items||[];items.forEach(it=>{const d=document.createElement("div");d.className="item";d.textContent=`${it.id} （${it.count}条）`;if(it.id===cur){d.classList.add("active")}d.addEventListener("click",()=>selectSession(it.id));sessionList.appendChild(d)});}
+async function selectSession(id){try{const r=await fetch("/api/session/select",{method:"POST",headers:{"Content-Type":"application/json"},body:JSON.stringify({session_id:id})});const j=await r.json();if(!r.ok){return}currentSession=j.current;await loadSessions();await loadHistory()}catch(_){/* ignore */}}
 if(newSession){newSession.addEventListener("click",async()=>{try{const r=await fetch("/api/session/new",{method:"POST",headers:{"Content-Type":"application/json"},body:JSON.stringify({name:""})});await r.json();await loadSessions();await loadHistory()}catch(_){}})}
 loadSessions();
 
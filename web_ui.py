@@ -1,25 +1,25 @@
-from flask import Flask, request, jsonify, send_from_directory, render_template
+from flask import Flask, request, jsonify, send_from_directory, render_template, Response, stream_with_context
 from pathlib import Path
 from puding_agent.agent import GeminiEngineer
-from puding_agent.utils import ConversationMessage
+from puding_agent.sessions import SessionManager
+from puding_agent.cache import file_cache
 import os
+import json
+import queue
 import logging
+import threading
 
 app = Flask(__name__, static_folder="static", template_folder="templates")
-# Initialize the Gemini Engineer Agent
+# Initialize the Gemini Engineer Agent; its LLM clients are shared by every session
 engineer = GeminiEngineer()
-sessions = {}
-current_session = "default"
-sessions[current_session] = engineer.conversation_history
+sessions = SessionManager(engineer)
 
 @app.route("/")
 def index():
     return render_template("index.html")
 
-@app.route("/api/send", methods=["POST"])
-def api_send():
-    data = request.get_json(silent=True) or {}
-    logging.info(f"Received /api/send request. Data: {data}")
+def build_prompt(data):
+    """Combine the user's text with the strategy flags selected in the UI."""
     base_text = data.get("text", "")
     flags = data.get("flags") or {}
     prefix = ""
@@ -29,34 +29,104 @@ def api_send():
         prefix += "必须通过工具调用执行相关文件操作与命令。"
     if flags.get("tests"):
         prefix += "为代码自动编写单元测试并运行验证，如果失败请修复。"
-    text = (prefix + "\n" + base_text).strip()
+    return (prefix + "\n" + base_text).strip()
+
+def apply_session_flags(session, data):
+    """Apply the UI flags that change engine behaviour rather than the prompt."""
+    flags = data.get("flags") or {}
+    # Only an explicit flag changes the shell; clients that omit it keep the
+    # engine's state (e.g. enabled by PUDING_PERSISTENT_SHELL)
+    if "shell" in flags:
+        session.engine.set_persistent_shell(bool(flags["shell"]))
+
+def session_id_from_request():
+    """Sessions are addressed per request: JSON body field or query parameter."""
+    data = request.get_json(silent=True) or {}
+    return data.get("session_id") or request.args.get("session_id")
+
+def sse(event, data):
+    """Format one Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+@app.route("/api/send", methods=["POST"])
+def api_send():
+    data = request.get_json(silent=True) or {}
+    logging.info(f"Received /api/send request. Data: {data}")
+    text = build_prompt(data)
     if not text:
         logging.warning("Empty input text")
         return jsonify({"error": "empty_input"}), 400
+    session = sessions.get(session_id_from_request())
+    if session is None:
+        return jsonify({"error": "not_found"}), 404
     
     try:
-        logging.info("Calling engineer.respond_once...")
+        logging.info(f"Calling respond_once for session {session.id}...")
         
         def loop_callback(count):
             logging.info(f"Engineer loop iteration: {count}")
-            
-        result = engineer.respond_once(text, on_loop_start=loop_callback)
+        
+        with session.lock:
+            apply_session_flags(session, data)
+            result = session.engine.respond_once(text, on_loop_start=loop_callback)
         logging.info(f"respond_once result: {result}")
         
         if isinstance(result, dict) and result.get("error"):
             logging.error(f"Error from respond_once: {result.get('error')}")
             return jsonify(result), 500
             
-        sessions[current_session] = engineer.conversation_history
         return jsonify(result)
     except Exception as e:
         logging.error(f"Exception in api_send: {e}", exc_info=True)
         return jsonify({"error": str(e)}), 500
 
+@app.route("/api/stream", methods=["POST"])
+def api_stream():
+    """Run the agent loop and stream text deltas and tool events as SSE."""
+    data = request.get_json(silent=True) or {}
+    text = build_prompt(data)
+    if not text:
+        return jsonify({"error": "empty_input"}), 400
+    session = sessions.get(session_id_from_request())
+    if session is None:
+        return jsonify({"error": "not_found"}), 404
+    
+    events = queue.Queue()
+    
+    def run():
+        try:
+            with session.lock:
+                apply_session_flags(session, data)
+                result = session.engine.respond_once(text, on_event=lambda e: events.put((e["type"], e)))
+            if isinstance(result, dict) and result.get("error"):
+                events.put(("error", result))
+            else:
+                events.put(("done", result))
+        except Exception as e:
+            logging.error(f"Exception in api_stream: {e}", exc_info=True)
+            events.put(("error", {"error": str(e)}))
+    
+    threading.Thread(target=run, daemon=True).start()
+    
+    def generate():
+        while True:
+            event, payload = events.get()
+            yield sse(event, payload)
+            if event in ("done", "error"):
+                break
+    
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=headers)
+
 @app.route("/api/history", methods=["GET"])
 def api_history():
-    msgs = [{"role": m.role, "content": m.content} for m in sessions.get(current_session, [])]
-    return jsonify({"messages": msgs})
+    session = sessions.get(session_id_from_request())
+    if session is None:
+        return jsonify({"error": "not_found"}), 404
+    msgs = [{"role": m.role, "content": m.content} for m in session.messages()]
+    # Engine-side flags, so the UI's checkboxes start from the session's real state
+    flags = {"shell": session.engine.shell is not None}
+    return jsonify({"messages": msgs, "flags": flags})
 
 @app.route("/api/add", methods=["POST"])
 def api_add():
@@ -64,10 +134,18 @@ def api_add():
     path = (data.get("path") or "").strip()
     if not path:
         return jsonify({"error": "empty_path"}), 400
+    session = sessions.get(session_id_from_request())
+    if session is None:
+        return jsonify({"error": "not_found"}), 404
+    options = {}
+    if data.get("mode") == "map":
+        options["mode"] = "map"
+        if isinstance(data.get("map_tokens"), int) and data["map_tokens"] > 0:
+            options["map_tokens"] = data["map_tokens"]
     try:
-        engineer.add_file_to_context(path)
-        sessions[current_session] = engineer.conversation_history
-        return jsonify({"success": True})
+        with session.lock:
+            counts = session.engine.add_file_to_context(path, **options)
+        return jsonify({"success": True, **counts})
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
@@ -91,36 +169,45 @@ def api_status():
     model_name = getattr(engineer, "model_name", None) or os.getenv("GEMINI_MODEL")
     return jsonify({"provider": provider, "model": model_name})
 
+@app.route("/api/usage", methods=["GET"])
+def api_usage():
+    """Token usage ledger of one session, totals for every session and file cache counters."""
+    session = sessions.get(session_id_from_request())
+    if session is None:
+        return jsonify({"error": "not_found"}), 404
+    result = session.engine.usage.summary()
+    result["session_id"] = session.id
+    result["sessions"] = {s.id: s.engine.usage.totals() for s in sessions.list()}
+    result["file_cache"] = file_cache.stats()
+    return jsonify(result)
+
 @app.route("/api/session/new", methods=["POST"])
 def api_session_new():
     name = (request.get_json(silent=True) or {}).get("name") or ""
-    sid = f"s{len(sessions)+1}"
-    sessions[sid] = [ConversationMessage("system", engineer.conversation_history[0].content)]
-    return jsonify({"id": sid, "name": name})
+    session = sessions.create(name)
+    return jsonify({"id": session.id, "name": name})
 
 @app.route("/api/session/list", methods=["GET"])
 def api_session_list():
     items = []
-    for sid, msgs in sessions.items():
-        items.append({"id": sid, "count": len(msgs)})
-    return jsonify({"items": items, "current": current_session})
+    for session in sessions.list():
+        items.append({"id": session.id, "name": session.name, "count": len(session.messages())})
+    return jsonify({"items": items})
 
 @app.route("/api/session/select", methods=["POST"])
 def api_session_select():
-    data = request.get_json(silent=True) or {}
-    sid = data.get("id")
-    if sid not in sessions:
+    # Selection is client-side state; this only confirms the session exists
+    session = sessions.get(session_id_from_request() or (request.get_json(silent=True) or {}).get("id"))
+    if session is None:
         return jsonify({"error": "not_found"}), 404
-    global current_session
-    current_session = sid
-    engineer.conversation_history = sessions[sid]
-    return jsonify({"current": current_session})
+    return jsonify({"current": session.id})
 
 @app.route("/api/session/clear", methods=["POST"])
 def api_session_clear():
-    global current_session
-    sessions[current_session] = [ConversationMessage("system", engineer.conversation_history[0].content)]
-    engineer.conversation_history = sessions[current_session]
+    session = sessions.get(session_id_from_request())
+    if session is None:
+        return jsonify({"error": "not_found"}), 404
+    session.clear()
     return jsonify({"success": True})
 
 @app.route("/static/<path:path>")